@@ -0,0 +1,194 @@
+# async_fetcher.py
+# مسار جلب غير متزامن: كل طلبات (الأصل × الإطار الزمني) تُرسل معًا بدل 9 طلبات متتالية تحجب حلقة الأحداث.
+# - TwelveData: طلب batch واحد لكل إطار زمني يضم عدة رموز (symbol=EUR/USD,GBP/USD,...) عبر اتصال keep-alive مشترك.
+# - المصادر الأخرى (IQ Option): fetch_data_from_source في خيوط منفصلة مع حد أقصى للتزامن.
+# - إذا مُرر scheduler تمر كل الطلبات عبره (رصيد، أولويات، دمج المكرر).
+import asyncio
+import contextlib
+
+import pandas as pd
+
+try:
+    from metrics import FETCH_ERRORS, FETCH_SECONDS
+except ImportError: # metrics.py اختياري: الجلب يعمل كما هو بلا قياس
+    class _NoMetrics:
+        # ما يستخدمه هذا الملف من metrics (time/inc) بلا قياس
+        def time(self, **labels): return contextlib.nullcontext()
+        def inc(self, amount=1, **labels): pass
+    FETCH_ERRORS = FETCH_SECONDS = _NoMetrics()
+from request_scheduler import PRIORITY_BACKGROUND, candle_close_urgency
+
+try:
+    import httpx
+except ImportError:
+    print("Async_fetcher Warning: httpx not installed. Falling back to threaded fetch_data_from_source.")
+    httpx = None
+
+try:
+    from config.api_keys_config import TWELVEDATA_API_KEY
+except ImportError:
+    print("Async_fetcher Warning: config/api_keys_config.py not found. TwelveData batch requests disabled.")
+    TWELVEDATA_API_KEY = None
+
+TWELVEDATA_TIME_SERIES_URL = "https://api.twelvedata.com/time_series"
+TWELVEDATA_MAX_SYMBOLS_PER_BATCH = 8
+
+
+def _parse_twelvedata_series(payload: dict) -> pd.DataFrame | None:
+    if not isinstance(payload, dict) or payload.get("status") == "error" or not payload.get("values"):
+        return None
+    df = pd.DataFrame(payload["values"])
+    df["datetime"] = pd.to_datetime(df["datetime"])
+    df = df.set_index("datetime").sort_index()
+    for col in ("open", "high", "low", "close", "volume"):
+        if col in df.columns:
+            df[col] = pd.to_numeric(df[col], errors="coerce")
+        else:
+            df[col] = 0.0
+    return df[["open", "high", "low", "close", "volume"]]
+
+
+class AsyncCandleFetcher:
+    def __init__(self, sync_fetch_fn, candle_store=None, api_key: str | None = TWELVEDATA_API_KEY,
+                 max_concurrency: int = 8, request_timeout: float = 15.0,
+                 max_symbols_per_batch: int = TWELVEDATA_MAX_SYMBOLS_PER_BATCH, scheduler=None, run_blocking=None):
+        # run_blocking: بتوقيع asyncio.to_thread (مثل ExecutionLayer.thread_runner) لتوجيه العمل المتزامن ومهلته
+        self.sync_fetch_fn = sync_fetch_fn
+        self._run_blocking = run_blocking or asyncio.to_thread
+        self.candle_store = candle_store
+        self.scheduler = scheduler
+        self.api_key = api_key
+        self.request_timeout = request_timeout
+        self.max_symbols_per_batch = max_symbols_per_batch
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._max_concurrency = max_concurrency
+        self._client = None
+
+    def _get_client(self):
+        # عميل واحد يعيد استخدام الاتصالات المفتوحة (keep-alive) طوال عمر البوت
+        if self._client is None:
+            limits = httpx.Limits(max_connections=self._max_concurrency,
+                                  max_keepalive_connections=self._max_concurrency)
+            self._client = httpx.AsyncClient(timeout=self.request_timeout, limits=limits)
+        return self._client
+
+    async def aclose(self) -> None:
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    def _use_batch_api(self, source: str) -> bool:
+        return source.upper() == "TWELVEDATA" and httpx is not None and bool(self.api_key)
+
+    async def _scheduled(self, key, request_fn, credits: int, priority: int, frame: str):
+        if self.scheduler is None:
+            return await request_fn()
+        return await self.scheduler.run(key, request_fn, credits=credits, priority=priority,
+                                        urgency=candle_close_urgency(frame))
+
+    # --- نقطة الدخول ---
+    async def fetch_many(self, source: str, assets: list[dict], frames: list[str], count: int,
+                         priority: int = PRIORITY_BACKGROUND) -> dict[tuple[str, str], pd.DataFrame | None]:
+        # المفتاح في النتيجة: (COMMON_NAME, frame)
+        if self._use_batch_api(source):
+            jobs = [self._fetch_frame_batch(source, assets[i:i + self.max_symbols_per_batch], frame, count, priority)
+                    for frame in frames
+                    for i in range(0, len(assets), self.max_symbols_per_batch)]
+        else:
+            jobs = [self._fetch_single_threaded(source, asset_info, frame, count, priority)
+                    for frame in frames for asset_info in assets]
+
+        results = {}
+        for partial in await asyncio.gather(*jobs, return_exceptions=True):
+            if isinstance(partial, Exception):
+                print(f"Async_fetcher: Fetch job failed: {type(partial).__name__}: {partial}")
+                continue
+            results.update(partial)
+        for frame in frames:
+            for asset_info in assets:
+                results.setdefault((asset_info["COMMON_NAME"], frame), None)
+        return results
+
+    # --- المسار المتزامن في خيوط ---
+    async def _fetch_single_threaded(self, source: str, asset_info: dict, frame: str, count: int,
+                                     priority: int = PRIORITY_BACKGROUND) -> dict:
+        common_name = asset_info["COMMON_NAME"]
+
+        async def request():
+            async with self._semaphore:
+                if self.candle_store is not None:
+                    return await self._run_blocking(self.candle_store.fetch, self.sync_fetch_fn, source, common_name,
+                                                    frame, count, asset_info)
+                return await self._run_blocking(self.sync_fetch_fn, source=source, symbol=common_name,
+                                                interval_or_timeframe=frame, count=count, asset_config=asset_info)
+
+        # IQ Option لا يستهلك رصيدًا؛ TwelveData يستهلك رصيدًا واحدًا لكل طلب
+        credits = 1 if source.upper() == "TWELVEDATA" else 0
+        df = await self._scheduled((source.upper(), common_name, frame, count), request, credits, priority, frame)
+        return {(common_name, frame): df}
+
+    # --- مسار TwelveData batch ---
+    async def _request_twelvedata(self, symbols: list[str], interval: str, outputsize: int,
+                                  priority: int = PRIORITY_BACKGROUND) -> dict[str, dict]:
+        params = {"symbol": ",".join(symbols), "interval": interval,
+                  "outputsize": outputsize, "apikey": self.api_key}
+
+        async def request():
+            # الزمن من الإرسال حتى الرد فقط (بدون انتظار الرصيد في المجدول)؛ طلب batch واحد لعدة رموز
+            async with self._semaphore:
+                try:
+                    with FETCH_SECONDS.time(source="TWELVEDATA_BATCH", interval=interval):
+                        return await self._get_client().get(TWELVEDATA_TIME_SERIES_URL, params=params)
+                except Exception:
+                    FETCH_ERRORS.inc(source="TWELVEDATA_BATCH", interval=interval)
+                    raise
+
+        # كل رمز داخل طلب batch يُحتسب رصيدًا مستقلًا لدى TwelveData
+        key = ("TWELVEDATA", tuple(symbols), interval, outputsize)
+        response = await self._scheduled(key, request, len(symbols), priority, interval)
+        response.raise_for_status()
+        payload = response.json()
+        if len(symbols) == 1:
+            # عند طلب رمز واحد لا يغلف TwelveData الرد باسم الرمز
+            return {symbols[0]: payload}
+        if payload.get("status") == "error":
+            print(f"Async_fetcher: TwelveData batch error for {interval}: {payload.get('message')}")
+            return {}
+        return payload
+
+    async def _fetch_frame_batch(self, source: str, assets: list[dict], frame: str, count: int,
+                                 priority: int = PRIORITY_BACKGROUND) -> dict:
+        by_symbol = {a.get("TWELVEDATA_SYMBOL", a["COMMON_NAME"]): a for a in assets}
+        store = self.candle_store
+        if store is not None:
+            fetch_counts = {sym: store.count_to_fetch(source, a["COMMON_NAME"], frame, count) for sym, a in by_symbol.items()}
+            last_ts = {sym: store.last_timestamp(source, a["COMMON_NAME"], frame) for sym, a in by_symbol.items()}
+        else:
+            fetch_counts = {sym: count for sym in by_symbol}
+            last_ts = {sym: None for sym in by_symbol}
+
+        # outputsize مشترك داخل الطلب الواحد، لذا نأخذ أكبر عدد مطلوب
+        payloads = await self._request_twelvedata(list(by_symbol), frame, max(fetch_counts.values()), priority)
+        frames = {sym: _parse_twelvedata_series(payloads.get(sym)) for sym in by_symbol}
+
+        if store is not None:
+            gaps = [sym for sym, df in frames.items()
+                    if df is not None and store.needs_full_refetch(last_ts[sym], df, max(fetch_counts.values()), count)]
+            if gaps:
+                print(f"Async_fetcher: Gap detected for {gaps} {frame}, refetching {count} candles.")
+                refetched = await self._request_twelvedata(gaps, frame, count, priority)
+                frames.update({sym: _parse_twelvedata_series(refetched.get(sym)) for sym in gaps})
+
+        results = {}
+        for sym, asset_info in by_symbol.items():
+            common_name = asset_info["COMMON_NAME"]
+            df = frames[sym]
+            if df is None:
+                print(f"Async_fetcher: No data for {common_name} {frame}.")
+                results[(common_name, frame)] = None
+            elif store is not None:
+                await self._run_blocking(store.append, source, common_name, frame, df)
+                results[(common_name, frame)] = await self._run_blocking(store.read, source, common_name, frame, count)
+            else:
+                results[(common_name, frame)] = df.tail(count)
+        return results
@@ -0,0 +1,235 @@
+# backtest.py
+# اختبار رجعي متجه لاستراتيجية signal_engine على خيارات ثنائية بمدة ثابتة:
+# 1) اتجاه كل شمعة لكل إطار على التاريخ كله دفعة واحدة (batch_signals.signal_series، نفس شروط generate_signals).
+# 2) قاعدة توافق الأطر كما في generate_multiframe_signals: عند إغلاق كل شمعة من الإطار الأصغر نأخذ آخر شمعة
+#    *مغلقة* من كل إطار أعلى (searchsorted على أوقات الإغلاق، فلا نظر إلى المستقبل).
+# 3) صفقة TRADE_AMOUNT لمدة TRADE_DURATION تُسوّى بسعر الإغلاق عند الانتهاء من سلسلة تسوية (مثلًا شموع 1min).
+# لا حلقات شمعة بشمعة ولا pandas داخل المحاكاة: حلقة بايثون فقط على الأصول والأطر.
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+from batch_signals import OHLCV, signal_series
+from candle_store import DEFAULT_STORE_DIR, TIMESTAMP_COLUMN, CandleStore
+from resampler import plan_frames, resample_arrays
+from timeframes import interval_to_seconds
+
+DEFAULT_TRADE_AMOUNT = 1
+DEFAULT_TRADE_DURATION = "1m"
+DEFAULT_PAYOUT = 0.8  # ربح الصفقة الرابحة كنسبة من المبلغ (Quotex يعرض عادة 0.7 - 0.9)
+NS = 1_000_000_000
+
+
+def frame_directions(timestamps: np.ndarray, columns: dict, interval,
+                     params: dict | None = None) -> tuple[np.ndarray, np.ndarray]:
+    # (أوقات الإغلاق ns، اتجاه كل شمعة int8)
+    directions = signal_series(*(np.asarray(columns[col], dtype=np.float64) for col in OHLCV), params=params)
+    return np.asarray(timestamps, dtype="<i8") + interval_to_seconds(interval) * NS, directions
+
+
+def align_directions(decision_times: np.ndarray, close_times: np.ndarray, directions: np.ndarray) -> np.ndarray:
+    # اتجاه آخر شمعة أُغلقت عند أو قبل كل وقت قرار؛ 0 قبل أول شمعة مغلقة
+    idx = np.searchsorted(close_times, decision_times, side="right") - 1
+    return np.where(idx >= 0, directions[np.maximum(idx, 0)], 0).astype(np.int8)
+
+
+def multiframe_agreement(aligned: list[np.ndarray]) -> np.ndarray:
+    # نفس قاعدة decide_multiframe_signal: كل الأطر لها إشارة وكلها بنفس الاتجاه
+    stacked = np.stack(aligned)
+    agreed = (stacked == stacked[:1]).all(axis=0)
+    return np.where(agreed, stacked[0], 0).astype(np.int8)
+
+
+def simulate_binary_trades(entry_times: np.ndarray, directions: np.ndarray, settle_close_times: np.ndarray,
+                           settle_close: np.ndarray, duration_s: int, amount: float, payout: float) -> dict:
+    # سعر الدخول = إغلاق شمعة التسوية المنتهية عند وقت الدخول، وسعر الخروج = إغلاق الشمعة المنتهية عند الانتهاء.
+    # الصفقات التي لا تتوفر لها شمعة تسوية بالضبط عند الدخول أو الانتهاء (فجوة، عطلة، نهاية البيانات) تُستبعد.
+    expiry_times = entry_times + duration_s * NS
+    entry_idx = np.searchsorted(settle_close_times, entry_times, side="right") - 1
+    exit_idx = np.searchsorted(settle_close_times, expiry_times, side="right") - 1
+    last = len(settle_close_times) - 1
+    settled = ((entry_idx >= 0) & (exit_idx >= 0) &
+               (settle_close_times[np.clip(entry_idx, 0, last)] == entry_times) &
+               (settle_close_times[np.clip(exit_idx, 0, last)] == expiry_times))
+    entry_price = settle_close[np.clip(entry_idx, 0, last)][settled]
+    exit_price = settle_close[np.clip(exit_idx, 0, last)][settled]
+    direction = directions[settled]
+    move = np.sign(exit_price - entry_price) * direction
+    pnl = np.where(move > 0, amount * payout, np.where(move < 0, -amount, 0.0))
+    return {"entry_time": entry_times[settled], "expiry_time": expiry_times[settled], "direction": direction,
+            "entry_price": entry_price, "exit_price": exit_price, "pnl": pnl,
+            "unsettled": int((~settled).sum())}
+
+
+def summarize(pnl: np.ndarray, expiry_times: np.ndarray, unsettled: int = 0) -> dict:
+    order = np.argsort(expiry_times, kind="stable")
+    equity = np.cumsum(pnl[order])
+    drawdown = np.maximum.accumulate(np.r_[0.0, equity])[1:] - equity if len(equity) else np.zeros(0)
+    wins, losses = int((pnl > 0).sum()), int((pnl < 0).sum())
+    return {"trades": len(pnl), "wins": wins, "losses": losses, "ties": len(pnl) - wins - losses,
+            "win_rate": wins / (wins + losses) if wins + losses else float("nan"),
+            "pnl": float(pnl.sum()), "max_drawdown": float(drawdown.max()) if len(drawdown) else 0.0,
+            "unsettled": unsettled}
+
+
+def backtest_asset(frames_arrays: dict, frames: list, settle: tuple[np.ndarray, dict], settle_interval,
+                   trade_amount: float = DEFAULT_TRADE_AMOUNT, trade_duration=DEFAULT_TRADE_DURATION,
+                   payout: float = DEFAULT_PAYOUT, params: dict | None = None) -> dict:
+    # frames_arrays: frame -> (timestamps ns, {open..volume}) ؛ settle: سلسلة التسوية بنفس الشكل
+    # params: بدائل لثوابت الاستراتيجية (batch_signals.DEFAULT_STRATEGY_PARAMS)
+    duration_s = interval_to_seconds(trade_duration)
+    if duration_s % interval_to_seconds(settle_interval):
+        raise ValueError(f"Trade duration {trade_duration} is not a multiple of the settlement interval {settle_interval}.")
+    base = min(frames, key=interval_to_seconds)
+    per_frame = {frame: frame_directions(*frames_arrays[frame], frame, params) for frame in frames}
+    decision_times = per_frame[base][0]
+    agreed = multiframe_agreement([align_directions(decision_times, *per_frame[frame]) for frame in frames])
+    signal_at = np.flatnonzero(agreed)
+    settle_ts, settle_cols = settle
+    trades = simulate_binary_trades(decision_times[signal_at], agreed[signal_at],
+                                    np.asarray(settle_ts, dtype="<i8") + interval_to_seconds(settle_interval) * NS,
+                                    np.asarray(settle_cols["close"], dtype=np.float64),
+                                    duration_s, trade_amount, payout)
+    return trades
+
+
+def load_frames_from_store(store: CandleStore, source: str, symbol: str, frames: list, start=None, end=None) -> dict:
+    # الإطار الأصغر من المخزن والأطر القابلة للاشتقاق تُبنى منه محليًا (كما في البوت)، والباقي من المخزن
+    base, derivable, remote = plan_frames(frames)
+    loaded = {}
+    for frame in [base] + remote:
+        arrays = store.read_arrays(source, symbol, frame, start=start, end=end)
+        if arrays is None:
+            return {}
+        loaded[frame] = (arrays[TIMESTAMP_COLUMN], {col: arrays[col] for col in OHLCV})
+    for frame in derivable:
+        loaded[frame] = resample_arrays(*loaded[base], frame)
+    return loaded
+
+
+def run_backtest(symbols: list[str], frames: list, load_frames, load_settle, settle_interval,
+                 trade_amount: float = DEFAULT_TRADE_AMOUNT, trade_duration=DEFAULT_TRADE_DURATION,
+                 payout: float = DEFAULT_PAYOUT) -> tuple[pd.DataFrame, dict]:
+    # load_frames(symbol) -> frames_arrays ؛ load_settle(symbol) -> (timestamps, columns)
+    rows, all_pnl, all_expiry, unsettled_total = [], [], [], 0
+    for symbol in symbols:
+        frames_arrays = load_frames(symbol)
+        settle = load_settle(symbol)
+        if not frames_arrays or settle is None:
+            print(f"Backtest: No data for {symbol}, skipped.")
+            continue
+        trades = backtest_asset(frames_arrays, frames, settle, settle_interval, trade_amount, trade_duration, payout)
+        rows.append({"symbol": symbol, **summarize(trades["pnl"], trades["expiry_time"], trades["unsettled"])})
+        all_pnl.append(trades["pnl"])
+        all_expiry.append(trades["expiry_time"])
+        unsettled_total += trades["unsettled"]
+    total = summarize(np.concatenate(all_pnl) if all_pnl else np.zeros(0),
+                      np.concatenate(all_expiry) if all_expiry else np.zeros(0, dtype="<i8"), unsettled_total)
+    return pd.DataFrame(rows), total
+
+
+def _synthetic_series(rng, n: int, interval, start_ns: int) -> tuple[np.ndarray, dict]:
+    # سير عشوائي مع ضجيج حول الاتجاه (بيانات لقياس الزمن والتحقق، لا تمثل سوقًا حقيقيًا)
+    step = interval_to_seconds(interval) * NS
+    close = 1.1 * np.exp(np.cumsum(rng.normal(0, 0.0004, n)) + rng.normal(0, 0.002, n))
+    open_ = np.r_[close[0], close[:-1]]
+    spread = np.abs(rng.normal(0, 0.001, n))
+    return start_ns + np.arange(n, dtype="<i8") * step, {
+        "open": open_, "high": np.maximum(open_, close) * (1 + spread),
+        "low": np.minimum(open_, close) * (1 - spread), "close": close,
+        "volume": rng.integers(1, 1000, n).astype(np.float64),
+    }
+
+
+def _signal_regime_series(rng, n: int, interval, start_ns: int, bullish: bool = True,
+                          noise: float = 1e-5) -> tuple[np.ndarray, dict]:
+    # نظام تركيبي تظهر فيه إشارات الاستراتيجية (السير العشوائي لا يحقق شروطها الثمانية معًا على ثلاثة أطر أبدًا):
+    # صعود يومي هادئ، ثم اندفاع متسارع في آخر ساعتين، ثم شمعة تمحو الاندفاع وتغلق تحت حد Bollinger السفلي بذيل سفلي
+    # طويل (مطرقة) مع MACD ما زال فوق إشارته. الشمعة تغلق مع إغلاق الساعة فتتفق 15min/30min/1h على CALL؛
+    # bullish=False يعكس السعر (شهاب، إشارات PUT). معايَر على الإطار الأساسي 15min والأطر 15min,30min,1h.
+    step = interval_to_seconds(interval) * NS
+    day, rally, size = 96, 8, 0.005  # شموع في الدورة، شموع الاندفاع، حجم الاندفاع (لوغاريتمي)
+    day_path = 0.533 * size * np.arange(day) / day
+    day_path[day - 1 - rally:day - 1] += size * np.expm1(np.arange(1, rally + 1) / 3.72) / np.expm1(rally / 3.72)
+    day_path[-1] = day_path[-2] - 1.6 * size
+    # الدورة مثبتة على حدود الأيام (epoch) مهما كان start_ns، فشمعة الهبوط تغلق مع إغلاق شمعة الساعة
+    shift = int(start_ns // step) % day
+    steps = np.tile(np.diff(np.r_[0.0, day_path]), n // day + 2)[shift:shift + n]
+    log_close = np.cumsum(steps) + rng.normal(0, noise, n)
+    log_open = np.r_[log_close[0], log_close[:-1]]
+    log_high, log_low = np.maximum(log_open, log_close), np.minimum(log_open, log_close)
+    flush = np.arange((day - 1 - shift) % day, n, day)
+    log_low[flush] -= 4.31 * size
+    volume = np.full(n, 1000.0)
+    volume[flush] = 10.0  # حجم شمعة الهبوط صغير فيبقى اتجاه OBV صاعدًا
+    if not bullish:
+        log_open, log_close, log_high, log_low = -log_open, -log_close, -log_low, -log_high
+    return start_ns + np.arange(n, dtype="<i8") * step, {
+        "open": 1.1 * np.exp(log_open), "high": 1.1 * np.exp(log_high), "low": 1.1 * np.exp(log_low),
+        "close": 1.1 * np.exp(log_close), "volume": volume,
+    }
+
+
+def synthetic_pair(rng, regime: str, index: int, n: int, interval, start_ns: int) -> tuple[np.ndarray, dict]:
+    # regime: "signals" (أزواج CALL وPUT بالتناوب) أو "walk" (سير عشوائي لقياس الزمن، بلا إشارات عمليًا)
+    if regime == "signals":
+        return _signal_regime_series(rng, n, interval, start_ns, bullish=index % 2 == 0)
+    return _synthetic_series(rng, n, interval, start_ns)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Vectorized binary-option backtest of the signal_engine strategy.")
+    parser.add_argument("--symbols", default="EUR/USD,GBP/USD,USD/JPY")
+    parser.add_argument("--source", default="TWELVEDATA")
+    parser.add_argument("--frames", default="15min,30min,1h")
+    parser.add_argument("--store", default=DEFAULT_STORE_DIR)
+    parser.add_argument("--start", default=None)
+    parser.add_argument("--end", default=None)
+    parser.add_argument("--amount", type=float, default=DEFAULT_TRADE_AMOUNT)
+    parser.add_argument("--duration", default=DEFAULT_TRADE_DURATION)
+    parser.add_argument("--payout", type=float, default=DEFAULT_PAYOUT)
+    parser.add_argument("--settle-interval", default="1min", help="candle interval in the store used to settle expiries")
+    parser.add_argument("--synthetic", type=int, default=0, help="run on N synthetic pairs instead of the store")
+    parser.add_argument("--years", type=float, default=5.0, help="history length for --synthetic")
+    parser.add_argument("--regime", default="signals", choices=("signals", "walk"),
+                        help="--synthetic data: a regime that triggers the strategy, or a plain random walk")
+    args = parser.parse_args()
+    frames = args.frames.split(",")
+
+    if args.synthetic:
+        # بيانات تركيبية: الإطار الأساسي يُستخدم للتسوية أيضًا، فالمدة الافتراضية = الإطار الأساسي
+        rng = np.random.default_rng(0)
+        base = min(frames, key=interval_to_seconds)
+        n = int(args.years * 365 * 86400 / interval_to_seconds(base))
+        symbols = [f"SYN{i:03d}" for i in range(args.synthetic)]
+        series = {s: synthetic_pair(rng, args.regime, i, n, base, 1_500_000_000 * NS) for i, s in enumerate(symbols)}
+        _, derivable, _ = plan_frames(frames)
+        load_frames = lambda s: {base: series[s], **{f: resample_arrays(*series[s], f) for f in derivable}}
+        load_settle = lambda s: series[s]
+        settle_interval = base
+        duration = args.duration if args.duration != DEFAULT_TRADE_DURATION else base
+        print(f"Synthetic: {len(symbols)} pairs x {n} {base} candles ({args.years:g} years, {args.regime})")
+    else:
+        store = CandleStore(args.store)
+        symbols = args.symbols.split(",")
+        load_frames = lambda s: load_frames_from_store(store, args.source, s, frames, args.start, args.end)
+
+        def load_settle(s):
+            arrays = store.read_arrays(args.source, s, args.settle_interval, start=args.start, end=args.end)
+            return None if arrays is None else (arrays[TIMESTAMP_COLUMN], arrays)
+        settle_interval = args.settle_interval
+        duration = args.duration
+
+    started = time.perf_counter()
+    per_asset, total = run_backtest(symbols, frames, load_frames, load_settle, settle_interval,
+                                    args.amount, duration, args.payout)
+    elapsed = time.perf_counter() - started
+    if not per_asset.empty:
+        print(per_asset.to_string(index=False))
+    print(f"Total: {total['trades']} trades, win rate {total['win_rate']:.1%}, P&L {total['pnl']:+.2f}, "
+          f"max drawdown {total['max_drawdown']:.2f}, unsettled {total['unsettled']} ({elapsed:.2f}s)")
+    if args.synthetic and args.regime == "signals":
+        # فحص ذاتي: مسار الإشارات والتسوية كله يجب أن يُنتج صفقات على هذا النظام
+        assert total["trades"] > 0, "The signal regime produced no trades."
@@ -0,0 +1,191 @@
+# batch_signals.py
+# محرك إشارات دفعي: كل الأصول × كل الأطر × آخر N شمعة في مصفوفة واحدة (A, F, T)، وكل المؤشرات والأنماط
+# وشروط buy/sell تُحسب بتمريرة متجهة واحدة بدل استدعاء pandas/ta لكل زوج (أصل، إطار).
+# الشموع محاذاة لليمين (آخر شمعة في T-1)، وما قبل بداية بيانات كل إطار حشو NaN وقناع الصلاحية False.
+# القرارات مطابقة لـ signal_engine.generate_signals على الصف الأخير (نفس دلالات NaN).
+import numpy as np
+
+import indicator_kernels as kernels
+from strategy.candle_patterns import candlestick_pattern_mask, decode_pattern_mask, detect_candlestick_patterns_arrays
+
+OHLCV = ("open", "high", "low", "close", "volume")
+BULLISH_PATTERNS = ("bullish_engulfing", "hammer", "morning_star", "three_white_soldiers")
+BEARISH_PATTERNS = ("bearish_engulfing", "shooting_star", "evening_star", "three_black_crows")
+# ثوابت الاستراتيجية في generate_signals؛ indicator_series/batch_signal_conditions تقبل بديلًا عنها لمحسّن walk-forward
+DEFAULT_STRATEGY_PARAMS = {
+    "ema_fast": 20, "ema_slow": 50, "rsi_window": 9, "rsi_upper": 70, "rsi_lower": 30,
+    "stoch_window": 5, "stoch_low": 20, "stoch_high": 80, "boll_window": 20, "boll_dev": 2,
+    "obv_fast": 20, "obv_slow": 50,
+}
+
+
+def stack_frames(frames_data: dict, symbols: list[str], frames: list[str], count: int) -> dict:
+    # frames_data: {(symbol, frame): DataFrame | None} كما تُرجعه fetch_frames_for_assets
+    stacked = np.full((len(OHLCV), len(symbols), len(frames), count), np.nan)
+    for a, symbol in enumerate(symbols):
+        for f, frame in enumerate(frames):
+            df = frames_data.get((symbol, frame))
+            if df is None or df.empty:
+                continue
+            # إطارات المخزن بترتيب OHLCV أصلًا: to_numpy مباشرة أرخص بكثير من اختيار الأعمدة لكل إطار
+            ordered = df if tuple(df.columns) == OHLCV else df[list(OHLCV)]
+            tail = ordered.to_numpy(dtype=np.float64)[-count:]
+            stacked[:, a, f, count - len(tail):] = tail.T
+    batch = dict(zip(OHLCV, stacked))
+    batch["valid"] = ~np.isnan(batch["close"])
+    return batch
+
+
+def _last_window(x: np.ndarray, window: int) -> np.ndarray:
+    # نافذة الشموع الأخيرة؛ أي NaN (حشو) داخلها يجعل النتيجة NaN كما في rolling(window) في pandas
+    if x.shape[-1] < window:
+        return np.full(x.shape[:-1] + (window,), np.nan)
+    return x[..., -window:]
+
+
+def batch_last_values(batch: dict) -> dict:
+    # قيم المؤشرات للشمعة الأخيرة لكل (أصل، إطار): كل قيمة مصفوفة بشكل (A, F)
+    valid = batch["valid"]
+    # البيانات خارج القناع تُعامل كحشو حتى لو احتوت أرقامًا
+    open_, high, low, close, volume = (np.where(valid, batch[col], np.nan) for col in OHLCV)
+
+    ema20 = kernels.ema(close, 2 / 21, 20)[..., -1]
+    ema50 = kernels.ema(close, 2 / 51, 50)[..., -1]
+    macd_line, macd_signal = kernels.macd(close, 12, 26, 9)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        lowest5, highest5 = _last_window(low, 5).min(axis=-1), _last_window(high, 5).max(axis=-1)
+        stoch = 100 * (close[..., -1] - lowest5) / (highest5 - lowest5)
+
+    obv = kernels.obv(close, volume)
+    boll_window = _last_window(close, 20)
+    boll_mid, boll_std = boll_window.mean(axis=-1), boll_window.std(axis=-1)
+
+    patterns = detect_candlestick_patterns_arrays(open_[..., -3:], high[..., -3:], low[..., -3:], close[..., -3:])
+    values = {
+        "close": close[..., -1], "ema20": ema20, "ema50": ema50,
+        "tenkan": (_last_window(high, 9).max(axis=-1) + _last_window(low, 9).min(axis=-1)) / 2,
+        "rsi": kernels.rsi(close, 9)[..., -1],
+        "macd_line": macd_line[..., -1], "macd_signal": macd_signal[..., -1],
+        "stoch": stoch,
+        "obv_mean20": _last_window(obv, 20).mean(axis=-1), "obv_mean50": _last_window(obv, 50).mean(axis=-1),
+        "boll_lower": boll_mid - 2 * boll_std, "boll_upper": boll_mid + 2 * boll_std,
+    }
+    values.update({name: flags[..., -1] for name, flags in patterns.items()})
+    return values
+
+
+def indicator_series(open_: np.ndarray, high: np.ndarray, low: np.ndarray, close: np.ndarray,
+                     volume: np.ndarray, params: dict | None = None) -> dict:
+    # نفس مؤشرات generate_signals لكل الشموع (وليس الأخيرة فقط) بشكل (..., T)، للاختبار الرجعي على التاريخ كله
+    p = DEFAULT_STRATEGY_PARAMS if params is None else {**DEFAULT_STRATEGY_PARAMS, **params}
+    macd_line, macd_signal = kernels.macd(close, 12, 26, 9)
+    obv = kernels.obv(close, volume)
+    boll_mid, boll_std = kernels.rolling_mean(close, p["boll_window"]), kernels.rolling_std(close, p["boll_window"])
+    values = {
+        "close": close,
+        "ema20": kernels.ema(close, 2 / (p["ema_fast"] + 1), p["ema_fast"]),
+        "ema50": kernels.ema(close, 2 / (p["ema_slow"] + 1), p["ema_slow"]),
+        "tenkan": (kernels.rolling_max(high, 9) + kernels.rolling_min(low, 9)) / 2,
+        "rsi": kernels.rsi(close, p["rsi_window"]), "macd_line": macd_line, "macd_signal": macd_signal,
+        "stoch": kernels.stoch_k(high, low, close, p["stoch_window"]),
+        "obv_mean20": kernels.rolling_mean(obv, p["obv_fast"]), "obv_mean50": kernels.rolling_mean(obv, p["obv_slow"]),
+        "boll_lower": boll_mid - p["boll_dev"] * boll_std, "boll_upper": boll_mid + p["boll_dev"] * boll_std,
+    }
+    values.update(decode_pattern_mask(candlestick_pattern_mask(open_, high, low, close)))
+    return values
+
+
+def signal_series(open_: np.ndarray, high: np.ndarray, low: np.ndarray, close: np.ndarray,
+                  volume: np.ndarray, params: dict | None = None) -> np.ndarray:
+    # اتجاه كل شمعة (1 call، -1 put، 0 لا شيء) مثل buy_signal/sell_signal في generate_signals على كامل الإطار
+    buy, sell = batch_signal_conditions(indicator_series(open_, high, low, close, volume, params), params)
+    return np.where(buy, 1, np.where(sell, -1, 0)).astype(np.int8)
+
+
+def batch_signal_conditions(values: dict, params: dict | None = None) -> tuple[np.ndarray, np.ndarray]:
+    # نفس شروط buy_signal / sell_signal في generate_signals، على مصفوفات (A, F)
+    v = values
+    p = DEFAULT_STRATEGY_PARAMS if params is None else {**DEFAULT_STRATEGY_PARAMS, **params}
+    stoch_ok = (v["stoch"] >= p["stoch_low"]) & (v["stoch"] <= p["stoch_high"])
+    obv_trend = v["obv_mean20"] > v["obv_mean50"]
+    buy = (
+        (v["ema20"] > v["ema50"]) & (v["close"] > v["tenkan"]) & (v["rsi"] < p["rsi_upper"]) &
+        (v["macd_line"] > v["macd_signal"]) & stoch_ok & obv_trend &
+        (v["close"] <= v["boll_lower"]) &
+        np.logical_or.reduce([v[name] for name in BULLISH_PATTERNS])
+    )
+    sell = (
+        (v["ema20"] < v["ema50"]) & (v["close"] < v["tenkan"]) & (v["rsi"] > p["rsi_lower"]) &
+        (v["macd_line"] < v["macd_signal"]) & stoch_ok & ~obv_trend &
+        (v["close"] >= v["boll_upper"]) &
+        np.logical_or.reduce([v[name] for name in BEARISH_PATTERNS])
+    )
+    return buy, sell
+
+
+def batch_frame_directions(batch: dict) -> np.ndarray:
+    # (A, F) من int8: 1 = call، -1 = put، 0 = لا إشارة (buy له الأولوية كما في get_single_signal_from_engine)
+    buy, sell = batch_signal_conditions(batch_last_values(batch))
+    return np.where(buy, 1, np.where(sell, -1, 0)).astype(np.int8)
+
+
+def multiframe_consensus(directions: np.ndarray) -> np.ndarray:
+    # (A,) : الاتجاه إذا اتفقت كل الأطر عليه، وإلا 0
+    agreed = (directions == directions[:, :1]).all(axis=1)
+    return np.where(agreed, directions[:, 0], 0).astype(np.int8)
+
+
+if __name__ == "__main__":
+    # مقارنة القيم والقرارات مع المسار الفردي (LastBarIndicators المطابق لـ ta) وقياس زمن دورة كاملة لعدة مئات من الأصول
+    import time
+
+    import pandas as pd
+
+    from indicator_engine import evaluate_signal_conditions
+    from signal_rules import LastBarIndicators
+
+    rng = np.random.default_rng(3)
+    n_assets, frames, count = 500, ["15min", "30min", "1h"], 250
+    frames_data, symbols = {}, [f"SYM{i:03d}" for i in range(n_assets)]
+    for symbol in symbols:
+        for frame in frames:
+            length = int(rng.choice([0, 3, 40, count + 30], p=[0.02, 0.02, 0.06, 0.9]))
+            close = 1.1 + np.cumsum(rng.normal(0, 0.0008, length))
+            open_ = np.r_[close[:1], close[:-1]] + rng.normal(0, 0.0003, length)
+            frames_data[(symbol, frame)] = pd.DataFrame({
+                "open": open_,
+                "high": np.maximum(open_, close) + rng.uniform(0, 0.0005, length),
+                "low": np.minimum(open_, close) - rng.uniform(0, 0.0005, length),
+                "close": close,
+                "volume": rng.uniform(100, 1000, length),
+            }, index=pd.date_range("2024-01-01", periods=length, freq="15min"))
+
+    started = time.perf_counter()
+    batch = stack_frames(frames_data, symbols, frames, count)
+    stacked = time.perf_counter()
+    values = batch_last_values(batch)
+    buy, sell = batch_signal_conditions(values)
+    consensus = multiframe_consensus(np.where(buy, 1, np.where(sell, -1, 0)))
+    finished = time.perf_counter()
+    print(f"{n_assets} assets x {len(frames)} frames x {count} candles: stack {(stacked - started) * 1000:.1f} ms, "
+          f"signals {(finished - stacked) * 1000:.1f} ms, {int((consensus != 0).sum())} multi-frame signals")
+
+    started = time.perf_counter()
+    mismatches = 0
+    for a, symbol in enumerate(symbols):
+        for f, frame in enumerate(frames):
+            df = frames_data[(symbol, frame)].iloc[-count:]
+            if df.empty:
+                assert not buy[a, f] and not sell[a, f]
+                continue
+            expected = LastBarIndicators(*[df[col].to_numpy() for col in OHLCV]).compute_all()
+            for key, value in expected.items():
+                got = values[key][a, f]
+                if isinstance(value, (bool, np.bool_)):
+                    mismatches += bool(got) != bool(value)
+                elif not (np.isnan(value) and np.isnan(got)):
+                    mismatches += not abs(got - value) <= 1e-9 * max(1.0, abs(value))
+            mismatches += (bool(buy[a, f]), bool(sell[a, f])) != evaluate_signal_conditions(expected)
+    print(f"Per-pair path: {(time.perf_counter() - started) * 1000:.1f} ms, mismatches: {mismatches}")
+    assert mismatches == 0
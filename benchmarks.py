@@ -0,0 +1,256 @@
+# benchmarks.py
+# مجموعة قياس قابلة للتكرار (نفس البذرة = نفس البيانات) لإثبات أثر تحسينات الأداء:
+# - synthetic_ohlcv: مولد OHLCV بسير عشوائي مع تقلب قابل للضبط، فجوات سعرية (open بعيد عن close السابق)،
+#   فجوات زمنية (شموع ناقصة)، وشموع مسطحة (open=high=low=close).
+# - الحالات: detect_candlestick_patterns و generate_signals عند 250 / 10k / 1M شمعة، ودورة
+#   generate_multiframe_signals كاملة بمزود بيانات بديل و format_telegram_message عند 3 / 100 / 1000 أصل.
+# - لكل حالة: زمن الجدار (أفضل تكرار والوسيط) وذروة الذاكرة (tracemalloc، في تمريرة منفصلة حتى لا يبطئ القياس).
+# - --save يكتب خط أساس JSON و --compare يفحص التراجع (رمز خروج 1 إذا تجاوز الزمن أو الذاكرة حد التسامح).
+# ملاحظة: ذاكرة الدورة متعددة الأطر لا تشمل عمليات ExecutionLayer (حساب المؤشرات الدفعي يتم هناك).
+import argparse
+import asyncio
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+import tracemalloc
+import types
+import zlib
+from datetime import datetime, timezone
+
+import numpy as np
+import pandas as pd
+
+from timeframes import interval_to_seconds
+
+CANDLE_SIZES = (250, 10_000, 1_000_000)
+ASSET_COUNTS = (3, 100, 1000)
+QUICK_CANDLE_SIZES = (250, 10_000)
+QUICK_ASSET_COUNTS = (3, 100)
+CASES = ("patterns", "signals", "multiframe", "telegram")
+DEFAULT_BASELINE = "bench_baseline.json"
+
+
+def synthetic_ohlcv(n: int, seed: int = 0, interval="1min", volatility: float = 0.0005, gap_prob: float = 0.002,
+                    gap_scale: float = 10.0, missing_prob: float = 0.001, flat_prob: float = 0.01,
+                    start_price: float = 1.1, end=None) -> pd.DataFrame:
+    # end: آخر شمعة (افتراضيًا شموع متتالية تبدأ 2024-01-01 UTC)؛ الفهرس بلا منطقة زمنية كما يعيده المزودون
+    rng = np.random.default_rng(seed)
+    body = rng.normal(0, volatility, n)
+    jump = np.where(rng.random(n) < gap_prob, rng.normal(0, volatility * gap_scale, n), 0.0)
+    flat = rng.random(n) < flat_prob
+    body[flat] = 0.0
+    jump[flat] = 0.0
+    log_close = np.log(start_price) + np.cumsum(jump + body)
+    close = np.exp(log_close)
+    open_ = np.exp(log_close - body)  # = close السابق × exp(jump)
+    wick = np.abs(rng.normal(0, volatility / 2, (2, n)))
+    wick[:, flat] = 0.0
+    high = np.maximum(open_, close) * np.exp(wick[0])
+    low = np.minimum(open_, close) * np.exp(-wick[1])
+    volume = np.where(flat, 0.0, rng.integers(1, 1000, n).astype(np.float64))
+
+    # فجوات زمنية: بعض الخطوات تقفز عدة شموع (عطلة، انقطاع المزود)
+    steps = np.where(rng.random(n) < missing_prob, rng.integers(2, 60, n), 1)
+    steps[0] = 0
+    offsets = np.cumsum(steps) * interval_to_seconds(interval) * 1_000_000_000
+    if end is None:
+        origin = pd.Timestamp("2024-01-01").value
+    else:
+        origin = pd.Timestamp(end).value - int(offsets[-1])
+    index = pd.DatetimeIndex(origin + offsets, name="datetime")
+    return pd.DataFrame({"open": open_, "high": high, "low": low, "close": close, "volume": volume}, index=index)
+
+
+def _stable_seed(*parts) -> int:
+    return zlib.crc32("|".join(map(str, parts)).encode())
+
+
+def make_stand_in_fetcher(seed: int = 0):
+    # بديل fetch_data_from_source: بيانات تركيبية ثابتة لكل (رمز، إطار)، تنتهي عند الشمعة الحالية، مولدة مرة واحدة
+    frames = {}
+
+    def fetch_data_from_source(source, symbol, interval_or_timeframe, count, asset_config=None):
+        key = (symbol, interval_or_timeframe)
+        df = frames.get(key)
+        if df is None or len(df) < count:
+            end = pd.Timestamp.now(tz="UTC").tz_localize(None).floor(pd.Timedelta(seconds=interval_to_seconds(interval_or_timeframe)))
+            df = frames[key] = synthetic_ohlcv(count, seed=_stable_seed(seed, symbol, interval_or_timeframe),
+                                               interval=interval_or_timeframe, missing_prob=0.0, end=end)
+        return df.tail(count)
+    return fetch_data_from_source
+
+
+def measure(fn, budget_s: float = 1.0, max_repeats: int = 10) -> dict:
+    # تكرار حتى استهلاك الميزانية (تكرار واحد على الأقل)، ثم تمريرة إضافية تحت tracemalloc لذروة الذاكرة
+    times = []
+    while len(times) < max_repeats and (not times or sum(times) < budget_s):
+        started = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - started)
+    tracemalloc.start()
+    try:
+        fn()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return {"wall_s": min(times), "median_s": statistics.median(times), "repeats": len(times),
+            "peak_mb": peak / 2**20}
+
+
+# --- الحالات ---
+def bench_patterns(sizes, budget_s):
+    from strategy.candle_patterns import detect_candlestick_patterns
+    for n in sizes:
+        df = synthetic_ohlcv(n, seed=n)
+        yield f"patterns/{n}", measure(lambda: detect_candlestick_patterns(df), budget_s)
+
+
+def bench_signals(sizes, budget_s):
+    from signal_engine import generate_signals
+    for n in sizes:
+        df = synthetic_ohlcv(n, seed=n, interval="15min")
+        yield f"signals/{n}", measure(lambda: generate_signals(df, "15min"), budget_s)
+
+
+def _load_main(seed: int):
+    # main.py بمزود بديل بدل data_fetcher، بلا مخزن شموع على القرص وبلا رصيد API، حتى تقيس الدورة الحساب فقط
+    if "main" not in sys.modules:
+        stand_in = types.ModuleType("data_fetcher")
+        stand_in.fetch_data_from_source = make_stand_in_fetcher(seed)
+        sys.modules["data_fetcher"] = stand_in
+    import main
+    main.ACTIVE_DATA_SOURCE = "BENCHMARK"
+    main.candle_store = None
+    if main.async_fetcher is not None:
+        main.async_fetcher.candle_store = None
+    return main
+
+
+def _bench_assets(count: int) -> list[dict]:
+    return [{"COMMON_NAME": f"BENCH{i:04d}", "QUOTEX_SYMBOL": f"BENCH{i:04d}"} for i in range(count)]
+
+
+def bench_multiframe(asset_counts, budget_s, seed: int = 0):
+    main = _load_main(seed)
+    loop = asyncio.new_event_loop()
+    try:
+        if main.execution is not None:
+            main.execution.warm_up()
+
+        for count in asset_counts:
+            assets = _bench_assets(count)
+
+            def cycle():
+                # دورة باردة: كل الأطر تُجلب وتُحلل (بلا ذاكرة مؤقتة من التكرار السابق)
+                for cache in (main.frame_cache, main.signal_cache):
+                    if cache is not None:
+                        cache.clear()
+                main.last_frame_directions.clear()
+                loop.run_until_complete(main.generate_multiframe_signals(None, assets))
+
+            cycle()  # توليد بيانات المزود البديل وتشغيل عمّال العمليات قبل القياس
+            yield f"multiframe/{count}", measure(cycle, budget_s)
+    finally:
+        if main.execution is not None:
+            main.execution.shutdown()
+        pending = asyncio.all_tasks(loop)  # عامل RequestScheduler وما شابه
+        for task in pending:
+            task.cancel()
+        loop.run_until_complete(asyncio.gather(*pending, return_exceptions=True))
+        loop.close()
+
+
+def bench_telegram(asset_counts, budget_s, seed: int = 0):
+    main = _load_main(seed)
+    for count in asset_counts:
+        signals = [(a["COMMON_NAME"], "call" if i % 2 else "put") for i, a in enumerate(_bench_assets(count))]
+        yield f"telegram/{count}", measure(
+            lambda: [main.format_telegram_message(name, direction, main.ANALYSIS_FRAMES) for name, direction in signals],
+            budget_s, max_repeats=50)
+
+
+def run_suite(cases, sizes, asset_counts, budget_s: float = 1.0, seed: int = 0) -> dict:
+    runners = {"patterns": lambda: bench_patterns(sizes, budget_s),
+               "signals": lambda: bench_signals(sizes, budget_s),
+               "multiframe": lambda: bench_multiframe(asset_counts, budget_s, seed),
+               "telegram": lambda: bench_telegram(asset_counts, budget_s, seed)}
+    results = {}
+    for case in cases:
+        for name, result in runners[case]():
+            results[name] = result
+            print(f"Bench: {name:20s} {result['wall_s'] * 1000:10.2f} ms (median {result['median_s'] * 1000:.2f} ms, "
+                  f"{result['repeats']} runs)  peak {result['peak_mb']:8.2f} MB", flush=True)
+    return {"meta": environment(seed), "results": results}
+
+
+def environment(seed: int) -> dict:
+    return {"created": datetime.now(timezone.utc).isoformat(timespec="seconds"), "seed": seed,
+            "python": platform.python_version(), "numpy": np.__version__, "pandas": pd.__version__,
+            "machine": platform.machine(), "node": platform.node(), "cpus": os.cpu_count()}
+
+
+# --- خطوط الأساس وفحص التراجع ---
+def save_baseline(report: dict, path: str) -> None:
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2, sort_keys=True)
+
+
+def load_baseline(path: str) -> dict:
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def compare(report: dict, baseline: dict, time_tolerance: float = 0.25, memory_tolerance: float = 0.25,
+            min_delta_s: float = 0.002) -> list[str]:
+    # تراجع: أبطأ من خط الأساس بأكثر من time_tolerance (وبفارق مطلق > min_delta_s لتجاهل ضجيج الحالات الصغيرة)،
+    # أو ذروة ذاكرة أعلى بأكثر من memory_tolerance (وبأكثر من 1 MB)
+    regressions = []
+    for name, result in report["results"].items():
+        base = baseline["results"].get(name)
+        if base is None:
+            continue
+        ratio = result["wall_s"] / base["wall_s"] if base["wall_s"] else 1.0
+        memory_ratio = result["peak_mb"] / base["peak_mb"] if base["peak_mb"] else 1.0
+        status = "ok"
+        if ratio > 1 + time_tolerance and result["wall_s"] - base["wall_s"] > min_delta_s:
+            status = "SLOWER"
+            regressions.append(f"{name}: {base['wall_s'] * 1000:.2f} -> {result['wall_s'] * 1000:.2f} ms ({ratio:.2f}x)")
+        if memory_ratio > 1 + memory_tolerance and result["peak_mb"] - base["peak_mb"] > 1.0:
+            status = "MORE MEMORY" if status == "ok" else f"{status}, MORE MEMORY"
+            regressions.append(f"{name}: peak {base['peak_mb']:.1f} -> {result['peak_mb']:.1f} MB ({memory_ratio:.2f}x)")
+        print(f"Compare: {name:20s} time {ratio:5.2f}x  memory {memory_ratio:5.2f}x  {status}")
+    if baseline.get("meta", {}).get("node") != report["meta"]["node"]:
+        print(f"Compare Warning: baseline was recorded on {baseline.get('meta', {}).get('node')}, "
+              f"not {report['meta']['node']}; timings are only comparable on the same machine.")
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Reproducible benchmarks for the signal pipeline.")
+    parser.add_argument("--cases", default=",".join(CASES), help=f"comma-separated subset of {CASES}")
+    parser.add_argument("--quick", action="store_true", help="skip the 1M-candle and 1000-asset sizes")
+    parser.add_argument("--budget", type=float, default=1.0, help="seconds of repeats per case")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--save", default=None, help=f"write results as a baseline (e.g. {DEFAULT_BASELINE})")
+    parser.add_argument("--compare", default=None, help="baseline JSON to check for regressions")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed slowdown/memory growth (0.25 = 25%%)")
+    args = parser.parse_args()
+
+    cases = [case for case in args.cases.split(",") if case]
+    unknown = set(cases) - set(CASES)
+    if unknown:
+        parser.error(f"unknown cases {sorted(unknown)}")
+    report = run_suite(cases, QUICK_CANDLE_SIZES if args.quick else CANDLE_SIZES,
+                       QUICK_ASSET_COUNTS if args.quick else ASSET_COUNTS, args.budget, args.seed)
+    if args.save:
+        save_baseline(report, args.save)
+        print(f"Bench: baseline written to {args.save}")
+    if args.compare:
+        regressions = compare(report, load_baseline(args.compare), args.tolerance, args.tolerance)
+        if regressions:
+            print("Bench: REGRESSIONS\n  " + "\n  ".join(regressions))
+            sys.exit(1)
+        print("Bench: no regressions against the baseline.")
@@ -1,7 +1,14 @@
+from collections.abc import Sequence
+
 import pandas as pd
 import numpy as np # لاستخدامه في np.nan عند الحاجة أو للعمليات الرقمية
+try:
+    from metrics import PATTERN_SECONDS
+    timed_patterns = PATTERN_SECONDS.timed
+except ImportError: # metrics.py اختياري: الدوال تعمل كما هي بلا قياس
+    def timed_patterns(**labels): return lambda fn: fn
 
-def detect_candlestick_patterns(
+def _detect_candlestick_patterns_pandas(
     df_input: pd.DataFrame,
     doji_threshold: float = 0.1,
     hammer_body_max_ratio: float = 0.4,
@@ -162,6 +169,143 @@ def detect_candlestick_patterns(
 
     return df[pattern_columns]
 
+# --- نواة الأنماط المضغوطة: كل الأنماط التسعة في قناع بتات واحد لكل شمعة ---
+# خصائص الشمعة (الجسم/النطاق/الظلال) تُحسب مرة واحدة، والشموع السابقة تُقرأ كـ views مزاحة على نفس المصفوفة
+# (شرائح بلا نسخ) بدل shift() متكرر. كل نمط قاعدة في PATTERN_RULES تكتب بتها في القناع؛
+# نمط جديد = قاعدة جديدة بلا تمريرة إضافية على الإطار كله لبناء أعمدة مزاحة.
+PATTERN_RULES: dict = {}  # name -> (lookback, rule(at) -> bool array)
+
+
+class _PatternNames(Sequence):
+    # أسماء الأنماط بترتيب بتاتها، كـ view حي على PATTERN_RULES: نمط يُضاف لاحقًا عبر register_pattern
+    # يظهر في كل من يقرأ PATTERN_NAMES (أعمدة DataFrame، محركات الإشارات، pattern_sweep)
+    def __getitem__(self, index):
+        return tuple(PATTERN_RULES)[index]
+
+    def __len__(self) -> int:
+        return len(PATTERN_RULES)
+
+    def __repr__(self) -> str:
+        return f"PATTERN_NAMES{tuple(PATTERN_RULES)}"
+
+
+PATTERN_NAMES = _PatternNames()
+
+
+def register_pattern(name: str, lookback: int, rule) -> None:
+    # rule تستقبل at(field, lag) التي تُرجع view للحقل مزاحًا lag شمعة، محاذى على الشموع التي لها lookback سابقة
+    if name not in PATTERN_RULES and len(PATTERN_RULES) >= 16:
+        raise ValueError("Pattern bitmask is uint16: at most 16 patterns.")
+    PATTERN_RULES[name] = (lookback, rule)
+
+
+def pattern_bit(name: str) -> int:
+    return 1 << list(PATTERN_RULES).index(name)
+
+
+register_pattern('bullish_engulfing', 1, lambda at: (
+    (at('close', 1) < at('open', 1)) & at('bullish', 0) & (at('open', 0) < at('close', 1)) & (at('close', 0) > at('open', 1))))
+register_pattern('bearish_engulfing', 1, lambda at: (
+    (at('close', 1) > at('open', 1)) & at('bearish', 0) & (at('open', 0) > at('close', 1)) & (at('close', 0) < at('open', 1))))
+register_pattern('hammer', 0, lambda at: at('hammer', 0))
+register_pattern('shooting_star', 0, lambda at: at('shooting_star', 0))
+register_pattern('doji', 0, lambda at: at('doji', 0))
+register_pattern('morning_star', 2, lambda at: (
+    (at('close', 2) < at('open', 2)) & (at('doji', 1) | at('hammer', 1)) &
+    at('bullish', 0) & (at('close', 0) > (at('open', 2) + at('close', 2)) / 2)))
+register_pattern('evening_star', 2, lambda at: (
+    (at('close', 2) > at('open', 2)) & (at('doji', 1) | at('shooting_star', 1)) &
+    at('bearish', 0) & (at('close', 0) < (at('open', 2) + at('close', 2)) / 2)))
+register_pattern('three_white_soldiers', 2, lambda at: (
+    at('bullish', 0) & at('bullish', 1) & at('bullish', 2) & (at('close', 0) > at('close', 1)) & (at('close', 1) > at('close', 2))))
+register_pattern('three_black_crows', 2, lambda at: (
+    at('bearish', 0) & at('bearish', 1) & at('bearish', 2) & (at('close', 0) < at('close', 1)) & (at('close', 1) < at('close', 2))))
+
+
+def candlestick_pattern_mask(
+    open_: np.ndarray,
+    high: np.ndarray,
+    low: np.ndarray,
+    close: np.ndarray,
+    doji_threshold: float = 0.1,
+    hammer_body_max_ratio: float = 0.4,
+    hammer_lower_shadow_min_ratio: float = 0.5,
+    hammer_upper_shadow_max_ratio: float = 0.2,
+) -> np.ndarray:
+    # قناع uint16 بشكل (..., T): البت pattern_bit(name) مرفوع إذا ظهر النمط على الشمعة. يعمل على أي شكل
+    # (سلسلة واحدة أو أصول × أطر × شموع)، والقيم NaN لا تنتج أي نمط مثل fillna(False) في النسخة الجدولية
+    open_, high, low, close = (np.asarray(x, dtype=np.float64) for x in (open_, high, low, close))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        total_range = high - low
+        total_range = np.where(total_range == 0, np.nan, total_range)
+        body_ratio = np.abs(close - open_) / total_range
+        upper_ratio = (high - np.maximum(close, open_)) / total_range
+        lower_ratio = (np.minimum(close, open_) - low) / total_range
+    small_body = body_ratio < hammer_body_max_ratio
+    fields = {
+        'open': open_, 'close': close,
+        'bullish': close > open_, 'bearish': close < open_,
+        'doji': body_ratio < doji_threshold,
+        'hammer': small_body & (lower_ratio > hammer_lower_shadow_min_ratio) & (upper_ratio < hammer_upper_shadow_max_ratio),
+        'shooting_star': small_body & (upper_ratio > hammer_lower_shadow_min_ratio) & (lower_ratio < hammer_upper_shadow_max_ratio),
+    }
+
+    # العتبات قد تكون مصفوفات (P, 1) لمسح عدة تركيبات دفعة واحدة (pattern_sweep)، فيصبح القناع (P, T)
+    n = close.shape[-1]
+    mask = np.zeros(np.broadcast_shapes(*(f.shape for f in fields.values())), dtype=np.uint16)
+    for bit, (lookback, rule) in enumerate(PATTERN_RULES.values()):
+        if n <= lookback:
+            continue
+        hits = rule(lambda field, lag: fields[field][..., lookback - lag:n - lag])
+        mask[..., lookback:] |= hits.astype(np.uint16) << bit
+    return mask
+
+
+def decode_pattern_mask(mask: np.ndarray, names=None) -> dict:
+    return {name: (mask & pattern_bit(name)) != 0 for name in (names or PATTERN_RULES)}
+
+
+def pattern_window() -> int:
+    # عدد الشموع الذي يحتاجه أطول نمط مسجل (lookback + الشمعة نفسها)
+    return 1 + max((lookback for lookback, _ in PATTERN_RULES.values()), default=0)
+
+
+def patterns_for_last_candle(candles, *thresholds) -> dict:
+    # أنماط الشمعة الأخيرة فقط من آخر pattern_window() شموع (قواميس OHLC من الأقدم للأحدث) عبر نفس القناع،
+    # تستخدمها محركات المؤشرات التزايدية لتجنب بناء DataFrame عند كل شمعة
+    window = list(candles)[-pattern_window():]
+    mask = candlestick_pattern_mask(
+        *(np.array([candle[field] for candle in window], dtype=np.float64) for field in ('open', 'high', 'low', 'close')),
+        *thresholds
+    )
+    return {name: bool(flags[-1]) for name, flags in decode_pattern_mask(mask).items()}
+
+
+def detect_candlestick_patterns_arrays(open_: np.ndarray, high: np.ndarray, low: np.ndarray,
+                                       close: np.ndarray, *thresholds) -> dict:
+    # أعمدة منطقية منفصلة من نفس القناع، على مصفوفات بأي شكل (..., T)
+    return decode_pattern_mask(candlestick_pattern_mask(open_, high, low, close, *thresholds))
+
+
+@timed_patterns()
+def detect_candlestick_patterns(
+    df_input: pd.DataFrame,
+    doji_threshold: float = 0.1,
+    hammer_body_max_ratio: float = 0.4,
+    hammer_lower_shadow_min_ratio: float = 0.5,
+    hammer_upper_shadow_max_ratio: float = 0.2,
+) -> pd.DataFrame:
+    # واجهة DataFrame متوافقة مع النسخة السابقة: نفس الأعمدة التسعة ونفس الفهرس، مبنية من القناع المضغوط
+    required_columns = ['open', 'high', 'low', 'close']
+    if not all(col in df_input.columns for col in required_columns):
+        print("Error: DataFrame is missing one or more required OHLC columns for pattern detection.")
+        return pd.DataFrame(False, columns=list(PATTERN_NAMES), index=df_input.index)
+    mask = candlestick_pattern_mask(
+        *(df_input[col].to_numpy(dtype=np.float64) for col in required_columns),
+        doji_threshold, hammer_body_max_ratio, hammer_lower_shadow_min_ratio, hammer_upper_shadow_max_ratio
+    )
+    return pd.DataFrame(decode_pattern_mask(mask), index=df_input.index)
+
 # --- مثال للاستخدام (للاختبار فقط) ---
 if __name__ == '__main__':
     # إنشاء DataFrame وهمي للاختبار
@@ -189,4 +333,37 @@ if __name__ == '__main__':
     for pattern_name in patterns_result.columns:
         detected_on_candles = patterns_result[patterns_result[pattern_name]].index.to_list()
         if detected_on_candles:
-            print(f"  {pattern_name}: detected on {detected_on_candles}")
\ No newline at end of file
+            print(f"  {pattern_name}: detected on {detected_on_candles}")
+
+    # مطابقة النواة المضغوطة مع النسخة الجدولية السابقة وقياس الزمن والذاكرة على تاريخ طويل
+    import time
+    import tracemalloc
+
+    rng = np.random.default_rng(5)
+    n = 1_000_000
+    close = 1.1 + np.cumsum(rng.normal(0, 0.0005, n))
+    open_ = np.r_[close[0], close[:-1]] + rng.normal(0, 0.0002, n)
+    long_df = pd.DataFrame({
+        'open': open_,
+        'high': np.maximum(open_, close) + rng.uniform(0, 0.0004, n),
+        'low': np.minimum(open_, close) - rng.uniform(0, 0.0004, n),
+        'close': close,
+    })
+    long_df.iloc[::97, :] = long_df.iloc[::97][['open']].to_numpy()  # شموع بنطاق صفري
+    long_df.iloc[5::1013] = np.nan
+
+    results = {}
+    for label, fn in (("pandas (legacy)", _detect_candlestick_patterns_pandas), ("bitmask kernel", detect_candlestick_patterns)):
+        tracemalloc.start()
+        started = time.perf_counter()
+        results[label] = fn(long_df)
+        elapsed = time.perf_counter() - started
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        print(f"{label:16s} {elapsed * 1000:8.1f} ms, peak {peak / 2**20:7.1f} MiB for {n} candles")
+    legacy, kernel = results.values()
+    for name in PATTERN_NAMES:
+        assert (legacy[name].to_numpy(dtype=bool) == kernel[name].to_numpy()).all(), name
+    mask = candlestick_pattern_mask(*(long_df[c].to_numpy() for c in ['open', 'high', 'low', 'close']))
+    print(f"Identical on all {len(PATTERN_NAMES)} patterns; bitmask is {mask.nbytes / 2**20:.1f} MiB "
+          f"vs {kernel.memory_usage(index=False).sum() / 2**20:.1f} MiB of bool columns.")
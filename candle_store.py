@@ -0,0 +1,271 @@
+# candle_store.py
+# مخزن شموع OHLCV محلي ودائم، مفتاحه (source, symbol, interval).
+# كل عمود يُحفظ في ملف ثنائي مستقل (تنسيق عمودي) بحيث يمكن قراءته عبر np.memmap دون تحميل الملف كاملًا.
+# الهدف: عند كل دورة نجلب فقط الشموع الجديدة بعد آخر طابع زمني مخزّن بدل 250 شمعة كاملة.
+import os
+import re
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+from timeframes import interval_to_seconds
+
+COLUMNS = ("open", "high", "low", "close", "volume")
+TIMESTAMP_COLUMN = "timestamp"
+DEFAULT_STORE_DIR = os.path.join("data", "candles")
+MERGE_BLOCK_ROWS = 1_000_000 # صفوف الأرشيف المقروءة في كل خطوة من الدمج المتدفق (_rewrite_merged)
+
+
+def _column_path(series_dir: str, column: str) -> str:
+    extension = "i8" if column == TIMESTAMP_COLUMN else "f8"
+    return os.path.join(series_dir, f"{column}.{extension}")
+
+
+def _to_ns(value) -> int:
+    ts = pd.Timestamp(value)
+    if ts.tzinfo is not None:
+        ts = ts.tz_convert("UTC").tz_localize(None)
+    return int(ts.as_unit("ns").value)
+
+
+def frame_to_arrays(df: pd.DataFrame) -> tuple[np.ndarray, dict[str, np.ndarray]]:
+    # تحويل DataFrame (فهرس زمني أو عمود 'datetime') إلى مصفوفات مرتبة وخالية من التكرار
+    if "datetime" in df.columns:
+        index = pd.DatetimeIndex(pd.to_datetime(df["datetime"]))
+    else:
+        index = pd.DatetimeIndex(df.index)
+    if index.tz is not None:
+        index = index.tz_convert("UTC").tz_localize(None)
+    timestamps = index.as_unit("ns").asi8.astype("<i8")
+
+    columns = {}
+    for col in COLUMNS:
+        if col in df.columns:
+            columns[col] = pd.to_numeric(df[col], errors="coerce").to_numpy(dtype="<f8")
+        else:
+            # أزواج الفوركس في TwelveData لا تحتوي غالبًا على حجم تداول
+            columns[col] = np.zeros(len(df), dtype="<f8")
+
+    return sort_unique(timestamps, columns)
+
+
+def sort_unique(timestamps: np.ndarray, columns: dict[str, np.ndarray]) -> tuple[np.ndarray, dict[str, np.ndarray]]:
+    # ترتيب تصاعدي وإبقاء آخر نسخة من أي طابع زمني مكرر
+    timestamps = np.asarray(timestamps, dtype="<i8")
+    if len(timestamps) > 1 and (timestamps[1:] > timestamps[:-1]).all():
+        return timestamps, columns  # الحالة الشائعة: مرتبة أصلًا وبلا تكرار
+    order = np.argsort(timestamps, kind="stable")
+    timestamps = timestamps[order]
+    keep = np.ones(len(timestamps), dtype=bool)
+    if len(timestamps) > 1:
+        keep[:-1] = timestamps[1:] != timestamps[:-1]
+    return timestamps[keep], {col: np.asarray(values)[order][keep] for col, values in columns.items()}
+
+
+def arrays_to_frame(arrays: dict[str, np.ndarray]) -> pd.DataFrame:
+    index = pd.DatetimeIndex(np.asarray(arrays[TIMESTAMP_COLUMN]).astype("datetime64[ns]"), name="datetime")
+    return pd.DataFrame({col: np.asarray(arrays[col]) for col in COLUMNS}, index=index)
+
+
+class CandleStore:
+    def __init__(self, base_dir: str = DEFAULT_STORE_DIR):
+        self.base_dir = base_dir
+        self._locks: dict[str, threading.Lock] = {}
+        self._locks_guard = threading.Lock()
+
+    # --- مسارات وأقفال ---
+    def series_dir(self, source: str, symbol: str, interval) -> str:
+        safe_symbol = re.sub(r"[^A-Za-z0-9_.-]", "_", str(symbol))
+        return os.path.join(self.base_dir, str(source).upper(), safe_symbol, str(interval))
+
+    def _lock_for(self, series_dir: str) -> threading.Lock:
+        with self._locks_guard:
+            if series_dir not in self._locks:
+                self._locks[series_dir] = threading.Lock()
+            return self._locks[series_dir]
+
+    @staticmethod
+    def _rows_in(series_dir: str) -> int:
+        path = _column_path(series_dir, TIMESTAMP_COLUMN)
+        if not os.path.exists(path):
+            return 0
+        return os.path.getsize(path) // 8
+
+    # --- القراءة ---
+    def row_count(self, source: str, symbol: str, interval) -> int:
+        return self._rows_in(self.series_dir(source, symbol, interval))
+
+    def last_timestamp(self, source: str, symbol: str, interval) -> pd.Timestamp | None:
+        series_dir = self.series_dir(source, symbol, interval)
+        rows = self._rows_in(series_dir)
+        if rows == 0:
+            return None
+        ts = np.memmap(_column_path(series_dir, TIMESTAMP_COLUMN), dtype="<i8", mode="r", shape=(rows,))
+        return pd.Timestamp(int(ts[-1]))
+
+    def read_arrays(self, source: str, symbol: str, interval, start=None, end=None,
+                    count: int | None = None) -> dict[str, np.ndarray] | None:
+        # ترجع شرائح memmap (بدون نسخ) للمدى المطلوب [start, end] أو آخر count شمعة
+        series_dir = self.series_dir(source, symbol, interval)
+        rows = self._rows_in(series_dir)
+        if rows == 0:
+            return None
+        ts = np.memmap(_column_path(series_dir, TIMESTAMP_COLUMN), dtype="<i8", mode="r", shape=(rows,))
+        lo, hi = 0, rows
+        if start is not None:
+            lo = int(np.searchsorted(ts, _to_ns(start), side="left"))
+        if end is not None:
+            hi = int(np.searchsorted(ts, _to_ns(end), side="right"))
+        if count is not None:
+            lo = max(lo, hi - count)
+        arrays = {TIMESTAMP_COLUMN: ts[lo:hi]}
+        for col in COLUMNS:
+            arrays[col] = np.memmap(_column_path(series_dir, col), dtype="<f8", mode="r", shape=(rows,))[lo:hi]
+        return arrays
+
+    def read(self, source: str, symbol: str, interval, count: int | None = None,
+             start=None, end=None) -> pd.DataFrame | None:
+        arrays = self.read_arrays(source, symbol, interval, start=start, end=end, count=count)
+        if arrays is None or len(arrays[TIMESTAMP_COLUMN]) == 0:
+            return None
+        return arrays_to_frame(arrays)
+
+    # --- الكتابة ---
+    def append(self, source: str, symbol: str, interval, df: pd.DataFrame) -> int:
+        if df is None or df.empty:
+            return 0
+        new_ts, new_cols = frame_to_arrays(df)
+        return self.append_arrays(source, symbol, interval, new_ts, new_cols)
+
+    def append_arrays(self, source: str, symbol: str, interval, timestamps: np.ndarray,
+                      columns: dict[str, np.ndarray]) -> int:
+        # مثل append لكن من مصفوفات مباشرة (timestamps بالنانوثانية UTC)، للاستيراد الجماعي دون DataFrame
+        new_ts, new_cols = sort_unique(timestamps, {col: np.asarray(columns[col], dtype="<f8") for col in COLUMNS})
+        if len(new_ts) == 0:
+            return 0
+        series_dir = self.series_dir(source, symbol, interval)
+        with self._lock_for(series_dir):
+            os.makedirs(series_dir, exist_ok=True)
+            return self._append_locked(series_dir, new_ts, new_cols)
+
+    def _append_locked(self, series_dir: str, new_ts: np.ndarray, new_cols: dict[str, np.ndarray]) -> int:
+        rows = self._rows_in(series_dir)
+        # قص أي بقايا كتابة غير مكتملة حتى تبقى الأعمدة متطابقة الطول مع عمود الوقت
+        for col in COLUMNS:
+            path = _column_path(series_dir, col)
+            if os.path.exists(path) and os.path.getsize(path) != rows * 8:
+                os.truncate(path, rows * 8)
+        if rows == 0:
+            self._write_rows(series_dir, new_ts, new_cols, mode="wb")
+            return len(new_ts)
+
+        stored_ts = np.memmap(_column_path(series_dir, TIMESTAMP_COLUMN), dtype="<i8", mode="r", shape=(rows,))
+        last_ts = int(stored_ts[-1])
+        overlap = new_ts <= last_ts
+        if overlap.any():
+            positions = np.searchsorted(stored_ts, new_ts[overlap])
+            positions = np.minimum(positions, rows - 1)
+            if not np.array_equal(stored_ts[positions], new_ts[overlap]):
+                # شموع أقدم أو فجوات داخل المدى المخزن: إعادة كتابة السلسلة مدمجةً
+                del stored_ts
+                self._rewrite_merged(series_dir, rows, new_ts, new_cols)
+                return len(new_ts)
+            # تحديث الشموع الموجودة (مثل الشمعة الأخيرة التي كانت قيد التكوين) في مكانها
+            for col in COLUMNS:
+                column = np.memmap(_column_path(series_dir, col), dtype="<f8", mode="r+", shape=(rows,))
+                column[positions] = new_cols[col][overlap]
+                column.flush()
+                del column
+        del stored_ts
+
+        tail = ~overlap
+        if tail.any():
+            self._write_rows(series_dir, new_ts[tail], {col: values[tail] for col, values in new_cols.items()}, mode="ab")
+        return int(tail.sum())
+
+    @staticmethod
+    def _write_rows(series_dir: str, timestamps: np.ndarray, columns: dict[str, np.ndarray], mode: str) -> None:
+        # الأعمدة أولًا ثم عمود الوقت أخيرًا: عمود الوقت هو الذي يحدد عدد الصفوف الصالحة
+        for col in COLUMNS:
+            with open(_column_path(series_dir, col), mode) as fh:
+                fh.write(np.ascontiguousarray(columns[col], dtype="<f8").tobytes())
+        with open(_column_path(series_dir, TIMESTAMP_COLUMN), mode) as fh:
+            fh.write(np.ascontiguousarray(timestamps, dtype="<i8").tobytes())
+
+    def _rewrite_merged(self, series_dir: str, rows: int, new_ts: np.ndarray, new_cols: dict[str, np.ndarray],
+                        block_rows: int = MERGE_BLOCK_ROWS) -> None:
+        # دمج متدفق في نسخة مؤقتة: ما قبل أقدم شمعة جديدة يُنسخ كما هو، والباقي يُدمج مع الجديدة كتلةً كتلة،
+        # فالذاكرة = الدفعة الجديدة + كتلة واحدة مهما كبر الأرشيف (الكلفة ما زالت قراءة الأرشيف وكتابته مرة)
+        stored_ts = np.memmap(_column_path(series_dir, TIMESTAMP_COLUMN), dtype="<i8", mode="r", shape=(rows,))
+        stored_cols = {col: np.memmap(_column_path(series_dir, col), dtype="<f8", mode="r", shape=(rows,))
+                       for col in COLUMNS}
+        tmp_dir = series_dir + ".tmp"
+        os.makedirs(tmp_dir, exist_ok=True)
+        mode = "wb"
+        start = int(np.searchsorted(stored_ts, new_ts[0]))
+        for lo in range(0, start, block_rows):
+            hi = min(start, lo + block_rows)
+            self._write_rows(tmp_dir, stored_ts[lo:hi], {col: values[lo:hi] for col, values in stored_cols.items()}, mode)
+            mode = "ab"
+        j = 0  # أول صف جديد لم يُكتب بعد
+        for lo in range(start, rows, block_rows):
+            hi = min(rows, lo + block_rows)
+            k = j + int(np.searchsorted(new_ts[j:], stored_ts[hi - 1], side="right"))  # الصفوف الجديدة ضمن هذه الكتلة
+            all_ts = np.concatenate([stored_ts[lo:hi], new_ts[j:k]])
+            order = np.argsort(all_ts, kind="stable")
+            sorted_ts = all_ts[order]
+            keep = np.ones(len(sorted_ts), dtype=bool)
+            keep[:-1] = sorted_ts[1:] != sorted_ts[:-1]  # الترتيب المستقر يجعل القيم الجديدة تفوز عند التكرار
+            merged = {col: np.concatenate([stored_cols[col][lo:hi], new_cols[col][j:k]])[order][keep] for col in COLUMNS}
+            self._write_rows(tmp_dir, sorted_ts[keep], merged, mode)
+            mode = "ab"
+            j = k
+        if j < len(new_ts):
+            self._write_rows(tmp_dir, new_ts[j:], {col: values[j:] for col, values in new_cols.items()}, mode)
+        del stored_ts, stored_cols  # تحرير memmap قبل استبدال الملفات
+        for col in COLUMNS + (TIMESTAMP_COLUMN,):
+            os.replace(_column_path(tmp_dir, col), _column_path(series_dir, col))
+        os.rmdir(tmp_dir)
+
+    # --- الجلب التزايدي ---
+    def count_to_fetch(self, source: str, symbol: str, interval, count: int, now: float | None = None) -> int:
+        series_dir = self.series_dir(source, symbol, interval)
+        rows = self._rows_in(series_dir)
+        if rows < count:
+            return count
+        last_ts = self.last_timestamp(source, symbol, interval)
+        now_s = time.time() if now is None else now
+        elapsed = now_s - last_ts.value / 1e9
+        # +1 لإعادة جلب آخر شمعة مخزنة لأنها قد تكون ما زالت قيد التكوين
+        missing = int(max(0.0, elapsed) // interval_to_seconds(interval)) + 1
+        return max(1, min(count, missing))
+
+    @staticmethod
+    def needs_full_refetch(last_ts: pd.Timestamp | None, df_new: pd.DataFrame, fetch_count: int, count: int) -> bool:
+        # لا يوجد تداخل بين الدفعة الجديدة والمخزن (انقطاع طويل أو فرق توقيت): يجب جلب النافذة كاملة
+        if fetch_count >= count or last_ts is None:
+            return False
+        new_ts, _ = frame_to_arrays(df_new)
+        return bool(len(new_ts)) and new_ts[0] > last_ts.value
+
+    def fetch(self, fetch_fn, source: str, symbol: str, interval, count: int,
+              asset_config: dict | None = None, now: float | None = None) -> pd.DataFrame | None:
+        # fetch_fn بنفس توقيع fetch_data_from_source
+        fetch_count = self.count_to_fetch(source, symbol, interval, count, now=now)
+        last_ts = self.last_timestamp(source, symbol, interval)
+        df_new = fetch_fn(source=source, symbol=symbol, interval_or_timeframe=interval,
+                          count=fetch_count, asset_config=asset_config)
+        if df_new is None or df_new.empty:
+            return None
+
+        if self.needs_full_refetch(last_ts, df_new, fetch_count, count):
+            print(f"CandleStore: Gap detected for {symbol} {interval}, refetching {count} candles.")
+            df_new = fetch_fn(source=source, symbol=symbol, interval_or_timeframe=interval,
+                              count=count, asset_config=asset_config)
+            if df_new is None or df_new.empty:
+                return None
+
+        self.append(source, symbol, interval, df_new)
+        return self.read(source, symbol, interval, count=count)
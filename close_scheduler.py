@@ -0,0 +1,105 @@
+# close_scheduler.py
+# مجدول محاذى لإغلاق الشموع بدل حلقة ثابتة كل 60 ثانية:
+# - يستيقظ بعد أقرب إغلاق بين أطر ANALYSIS_FRAMES + مهلة (grace) لتأخر المزود في نشر الشمعة المغلقة.
+# - يرجع الأطر التي أُغلقت لها شمعة فقط، فتُعاد معالجة أزواج (الأصل، الإطار) تلك وحدها.
+# - إذا استغرقت دورة أطول من المسافة إلى الإغلاق التالي، تُدمج كل الإغلاقات الفائتة في دورة واحدة فورًا.
+# - يسجل التأخر من إغلاق الشمعة حتى صدور الإشارة لكل دورة (آخر قيمة، المتوسط، p95، الأقصى) لعرضه في /status.
+import asyncio
+import time
+from collections import deque
+
+import numpy as np
+
+from timeframes import candle_open_time, interval_to_seconds, next_candle_close
+
+
+class CandleCloseScheduler:
+    def __init__(self, frames: list, grace_s: float = 2.0, history: int = 500, clock=time.time, sleep=asyncio.sleep):
+        self.frames = list(frames)
+        self.grace_s = grace_s
+        self._clock = clock
+        self._sleep = sleep
+        self._covered_until: float | None = None  # كل الإغلاقات حتى هذا الوقت عولجت
+        self.lags: deque = deque(maxlen=history)
+        self.cycles = 0
+        self.merged_closes = 0
+
+    def next_close(self, after_s: float) -> int:
+        return min(next_candle_close(after_s, frame) for frame in self.frames)
+
+    def closed_between(self, after_s: float, until_s: float) -> tuple[int | None, list]:
+        # (آخر حد إغلاق، الأطر التي لها إغلاق في (after_s, until_s])
+        closes = {frame: candle_open_time(until_s, frame) for frame in self.frames}
+        closed = [frame for frame, close in closes.items() if close > after_s]
+        return (max(closes[frame] for frame in closed) if closed else None), closed
+
+    async def wait(self) -> tuple[int | None, list]:
+        # أول استدعاء يرجع فورًا بكل الأطر (تحليل أولي عند التشغيل) و close_time = None
+        if self._covered_until is None:
+            self._covered_until = self._clock() - self.grace_s
+            return None, list(self.frames)
+        while True:
+            boundary = self.next_close(self._covered_until)
+            delay = boundary + self.grace_s - self._clock()
+            if delay > 0:
+                await self._sleep(delay)
+            until = self._clock() - self.grace_s
+            close_time, closed = self.closed_between(self._covered_until, until)
+            if not closed:
+                continue  # استيقاظ مبكر (دقة المؤقت)
+            # عدد الحدود الفائتة التي دُمجت في هذه الدورة (حلقة سابقة طالت أكثر من الفاصل)
+            self.merged_closes += sum(
+                max(0, int(until // interval_to_seconds(f)) - int(self._covered_until // interval_to_seconds(f)) - 1)
+                for f in closed)
+            self._covered_until = until
+            self.cycles += 1
+            return close_time, closed
+
+    def record_lag(self, close_time: float | None, signal_time: float | None = None) -> float | None:
+        if close_time is None:
+            return None
+        lag = (self._clock() if signal_time is None else signal_time) - close_time
+        self.lags.append(lag)
+        return lag
+
+    def stats(self) -> dict:
+        lags = np.asarray(self.lags, dtype=np.float64)
+        if len(lags) == 0:
+            return {"cycles": self.cycles, "merged_closes": self.merged_closes, "samples": 0}
+        return {"cycles": self.cycles, "merged_closes": self.merged_closes, "samples": len(lags),
+                "last_s": float(lags[-1]), "mean_s": float(lags.mean()),
+                "p95_s": float(np.percentile(lags, 95)), "max_s": float(lags.max())}
+
+    def format_stats(self) -> str:
+        s = self.stats()
+        if not s["samples"]:
+            return f"{s['cycles']} cycles, no close-to-signal samples yet"
+        return (f"close-to-signal lag last {s['last_s']:.2f}s, mean {s['mean_s']:.2f}s, p95 {s['p95_s']:.2f}s, "
+                f"max {s['max_s']:.2f}s over {s['samples']} cycles ({s['merged_closes']} merged closes)")
+
+
+if __name__ == "__main__":
+    # محاكاة ساعة افتراضية: 15min/30min/1h لمدة ساعتين، مع دورة بطيئة واحدة تتجاوز الإغلاق التالي
+    class FakeClock:
+        def __init__(self, now):
+            self.now = now
+
+        def __call__(self):
+            return self.now
+
+        async def sleep(self, seconds):
+            self.now += seconds
+
+    async def simulate():
+        clock = FakeClock(1_700_000_000 + 7)
+        scheduler = CandleCloseScheduler(["15min", "30min", "1h"], grace_s=3, clock=clock, sleep=clock.sleep)
+        print("startup:", await scheduler.wait())
+        for cycle in range(8):
+            close_time, closed = await scheduler.wait()
+            work = 2000 if cycle == 2 else 0.4  # الدورة الثالثة تتجاوز إغلاقين تاليين
+            clock.now += work
+            lag = scheduler.record_lag(close_time)
+            print(f"close {close_time % 86400 // 3600:02.0f}:{close_time % 3600 // 60:02.0f} UTC -> {closed}, lag {lag:.1f}s")
+        print(scheduler.format_stats())
+
+    asyncio.run(simulate())
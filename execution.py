@@ -0,0 +1,208 @@
+# execution.py
+# طبقة تنفيذ تُبعد العمل المتزامن عن حلقة أحداث python-telegram-bot:
+# - مسارات خيوط (thread lanes) للإدخال/الإخراج: "io" لطلبات الشبكة والقرص، و"browser" بخيط واحد لأن Selenium
+#   WebDriver لا يحتمل الاستدعاء من عدة خيوط في آن واحد (login_quotex و place_trade يصطفان فيه بالترتيب).
+# - مجمع عمليات (process pool، spawn) لحساب المؤشرات الثقيل (مثل batch_frame_directions) خارج GIL.
+# - مهلة لكل مهمة وإلغاء: عند انتهاء المهلة أو إلغاء الـ coroutine تُلغى المهمة إن لم تبدأ بعد؛ المهمة الجارية في خيط
+#   لا يمكن إيقافها قسرًا، لكن المنتظر يتحرر فورًا فتبقى المعالجات الأخرى مستجيبة.
+# - LoopLagMonitor يقيس تأخر حلقة الأحداث (مدى تأخر استيقاظ sleep عن موعده) لعرضه في /status.
+import asyncio
+import functools
+import multiprocessing as mp
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import numpy as np
+
+DEFAULT_THREAD_LANES = {"io": 8, "browser": 1}
+
+
+def _summarize(samples) -> dict:
+    values = np.asarray(samples, dtype=np.float64)
+    if len(values) == 0:
+        return {"samples": 0}
+    return {"samples": len(values), "last_s": float(values[-1]), "mean_s": float(values.mean()),
+            "p95_s": float(np.percentile(values, 95)), "max_s": float(values.max())}
+
+
+class TaskStats:
+    def __init__(self, history: int = 500):
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self.timeouts = 0
+        self.cancelled = 0
+        self.durations: deque = deque(maxlen=history)
+
+    def as_dict(self) -> dict:
+        return {"submitted": self.submitted, "completed": self.completed, "failed": self.failed,
+                "timeouts": self.timeouts, "cancelled": self.cancelled, **_summarize(self.durations)}
+
+
+class ExecutionLayer:
+    def __init__(self, thread_lanes: dict | None = None, process_workers: int | None = None):
+        self._thread_lanes = dict(DEFAULT_THREAD_LANES if thread_lanes is None else thread_lanes)
+        self._threads: dict[str, ThreadPoolExecutor] = {}
+        self._process_workers = process_workers
+        self._processes: ProcessPoolExecutor | None = None
+        self.stats: dict[str, TaskStats] = {}
+
+    def _thread_pool(self, lane: str) -> ThreadPoolExecutor:
+        if lane not in self._threads:
+            self._threads[lane] = ThreadPoolExecutor(max_workers=self._thread_lanes.get(lane, 1),
+                                                     thread_name_prefix=f"exec-{lane}")
+        return self._threads[lane]
+
+    def _process_pool(self) -> ProcessPoolExecutor:
+        # spawn: العملية الأم فيها خيوط (تيليجرام، httpx، المسارات أعلاه) و fork معها غير آمن
+        if self._processes is None:
+            self._processes = ProcessPoolExecutor(max_workers=self._process_workers, mp_context=mp.get_context("spawn"))
+        return self._processes
+
+    async def _run(self, kind: str, executor, fn, args, kwargs, timeout: float | None):
+        stats = self.stats.setdefault(kind, TaskStats())
+        stats.submitted += 1
+        started = time.monotonic()
+        future = asyncio.get_running_loop().run_in_executor(executor, functools.partial(fn, *args, **kwargs))
+        try:
+            result = await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            stats.timeouts += 1
+            raise
+        except asyncio.CancelledError:
+            future.cancel()
+            stats.cancelled += 1
+            raise
+        except BaseException:
+            stats.failed += 1
+            raise
+        stats.completed += 1
+        stats.durations.append(time.monotonic() - started)
+        return result
+
+    async def run_thread(self, fn, *args, lane: str = "io", timeout: float | None = None, **kwargs):
+        return await self._run(lane, self._thread_pool(lane), fn, args, kwargs, timeout)
+
+    async def run_process(self, fn, *args, timeout: float | None = None, fallback_lane: str | None = None, **kwargs):
+        # fn ومعاملاته يجب أن تكون قابلة لـ pickle (دالة على مستوى وحدة، مصفوفات numpy، ...)
+        try:
+            return await self._run("process", self._process_pool(), fn, args, kwargs, timeout)
+        except BrokenProcessPool:
+            # عامل مات (ذاكرة، إشارة، أو تعذر تشغيله): مجمع جديد في الاستدعاء التالي، وهذه المهمة في خيط إن طُلب
+            if self._processes is not None:
+                self._processes.shutdown(wait=False, cancel_futures=True)
+                self._processes = None
+            if fallback_lane is None:
+                raise
+            print(f"Execution Warning: Process pool broken, running {getattr(fn, '__name__', fn)} in the {fallback_lane} lane.")
+            return await self.run_thread(fn, *args, lane=fallback_lane, timeout=timeout, **kwargs)
+
+    def thread_runner(self, lane: str = "io", timeout: float | None = None):
+        # بديل لـ asyncio.to_thread (نفس التوقيع) يمر عبر المسار المحدد ومهلته
+        async def run(fn, *args, **kwargs):
+            return await self.run_thread(fn, *args, lane=lane, timeout=timeout, **kwargs)
+        return run
+
+    def warm_up(self) -> None:
+        # تشغيل عمّال العمليات مسبقًا حتى لا تدفع أول دورة كلفة spawn واستيراد numpy/pandas
+        pool = self._process_pool()
+        for _ in range(self._process_workers or os.cpu_count() or 1):
+            pool.submit(time.sleep, 0)
+
+    def shutdown(self) -> None:
+        for pool in self._threads.values():
+            pool.shutdown(wait=False, cancel_futures=True)
+        self._threads.clear()
+        if self._processes is not None:
+            self._processes.shutdown(wait=False, cancel_futures=True)
+            self._processes = None
+
+    def format_stats(self) -> str:
+        parts = []
+        for kind, stats in self.stats.items():
+            s = stats.as_dict()
+            timing = f", p95 {s['p95_s']:.2f}s" if s["samples"] else ""
+            parts.append(f"{kind}: {s['completed']}/{s['submitted']} done, {s['timeouts']} timeouts, "
+                         f"{s['failed']} failed{timing}")
+        return "; ".join(parts) if parts else "no tasks yet"
+
+
+class LoopLagMonitor:
+    def __init__(self, interval_s: float = 0.25, history: int = 2000):
+        self.interval_s = interval_s
+        self.lags: deque = deque(maxlen=history)
+        self._task: asyncio.Task | None = None
+
+    async def _run(self) -> None:
+        while True:
+            started = time.monotonic()
+            await asyncio.sleep(self.interval_s)
+            self.lags.append(max(0.0, time.monotonic() - started - self.interval_s))
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    def stats(self) -> dict:
+        return _summarize(self.lags)
+
+    def format_stats(self) -> str:
+        s = self.stats()
+        if not s["samples"]:
+            return "no samples yet"
+        return f"event-loop lag mean {s['mean_s'] * 1000:.1f} ms, p95 {s['p95_s'] * 1000:.1f} ms, max {s['max_s'] * 1000:.1f} ms"
+
+
+if __name__ == "__main__":
+    # تأخر الحلقة أثناء عمل متزامن ثقيل: مباشرة داخل coroutine مقابل عبر ExecutionLayer، مع مهلة تنتهي
+    from batch_signals import OHLCV, batch_frame_directions
+
+    def blocking_io(seconds):
+        time.sleep(seconds)
+        return seconds
+
+    async def measure(label, work):
+        monitor = LoopLagMonitor(interval_s=0.02)
+        monitor.start()
+        await asyncio.sleep(0.1)
+        started = time.perf_counter()
+        await work()
+        elapsed = time.perf_counter() - started
+        await asyncio.sleep(0.1)  # حتى يسجل المراقب الاستيقاظ المتأخر بعد العمل الحاجب
+        monitor.stop()
+        print(f"{label}: {elapsed:.2f}s, {monitor.format_stats()}")
+
+    async def main():
+        rng = np.random.default_rng(0)
+        close = 1.1 + np.cumsum(rng.normal(0, 1e-3, (400, 3, 250)), axis=-1)
+        batch = {col: close + (0.001 if col == "high" else -0.001 if col == "low" else 0) for col in OHLCV}
+        batch["volume"] = np.ones_like(close)
+        batch["valid"] = np.ones(close.shape, dtype=bool)
+        layer = ExecutionLayer(process_workers=1)
+        layer.warm_up()
+
+        async def inline():
+            blocking_io(0.5)
+            batch_frame_directions(batch)
+
+        async def offloaded():
+            await asyncio.gather(layer.run_thread(blocking_io, 0.5), layer.run_process(batch_frame_directions, batch))
+
+        await measure("Inline blocking work", inline)
+        await measure("ExecutionLayer", offloaded)
+        try:
+            await layer.run_thread(blocking_io, 1.0, lane="browser", timeout=0.2)
+        except asyncio.TimeoutError:
+            print("Browser task timed out after 0.2s; the loop was released immediately.")
+        print(layer.format_stats())
+        layer.shutdown()
+
+    asyncio.run(main())
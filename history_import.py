@@ -0,0 +1,202 @@
+# history_import.py
+# استيراد جماعي لتواريخ OHLCV طويلة (ملفات CSV/Parquet بملايين الأسطر) إلى CandleStore:
+# - القراءة على قطع (chunk_rows) فتبقى الذاكرة محدودة مهما كان حجم الملف.
+# - توحيد الرموز عبر ASSETS_TO_MONITOR: EURUSD / EUR/USD / eur_usd ... كلها تُخزن باسم COMMON_NAME كما يقرؤها البوت.
+# - الترتيب وإزالة التكرار (آخر نسخة تفوز) تتم في CandleStore.append_arrays، داخل القطعة وعبر القطع.
+# - ملف مرتب من الأحدث للأقدم (يُكتشف من أول قطعة): القطع تُحفظ مؤقتًا على القرص وتُلحق بالترتيب العكسي، فيبقى
+#   الاستيراد إلحاقًا خطيًا بدل دمج مع الأرشيف لكل قطعة.
+# - الحد المتبقي: قطع أقدم من آخر شمعة مخزنة (استيراد تاريخ أقدم لسلسلة موجودة، أو ملف غير مرتب) تُدمج بإعادة كتابة
+#   السلسلة من أقدم شمعة جديدة فيها. الذاكرة محدودة (قطعة + كتلة من الأرشيف)، لكن القراءة والكتابة تتكرر مع كل قطعة؛
+#   للتواريخ الكبيرة استورد الأقدم أولًا، أو استخدم --chunk-rows أكبر.
+# بعد الاستيراد: CandleStore.read_arrays(start=..., end=...) يرجع شرائح memmap بلا نسخ للمدى المطلوب
+# (عمود الوقت المرتب هو الفهرس عبر searchsorted)، ويعمل عليها backtest.py و walk_forward.py مباشرة.
+import argparse
+import os
+import re
+import shutil
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+from candle_store import COLUMNS, DEFAULT_STORE_DIR, CandleStore
+
+try:
+    import pyarrow.parquet as pq
+except ImportError:
+    pq = None  # Parquet اختياري؛ CSV يعمل بدونه
+
+DEFAULT_CHUNK_ROWS = 1_000_000
+TIME_COLUMNS = ("timestamp", "datetime", "time", "date", "open_time")
+SYMBOL_COLUMNS = ("symbol", "ticker", "pair", "asset", "instrument")
+SYMBOL_FIELDS = ("COMMON_NAME", "IQOPTION_SYMBOL", "TWELVEDATA_SYMBOL", "QUOTEX_SYMBOL")
+# حدود تمييز وحدة أرقام epoch حسب حجمها (ثوانٍ، مللي، ميكرو، نانو)
+_EPOCH_UNITS = ((1e11, 1_000_000_000), (1e14, 1_000_000), (1e17, 1_000), (np.inf, 1))
+
+
+def symbol_key(symbol) -> str:
+    return re.sub(r"[^A-Z0-9]", "", str(symbol).upper())
+
+
+def build_symbol_map(assets: list[dict]) -> dict[str, str]:
+    # كل أسماء الأصل لدى المزودين -> COMMON_NAME (المفتاح الذي يستخدمه البوت في CandleStore)
+    return {symbol_key(asset[field]): asset["COMMON_NAME"]
+            for asset in assets for field in SYMBOL_FIELDS if asset.get(field)}
+
+
+def normalize_symbol(symbol, symbol_map: dict[str, str], keep_unknown: bool = False) -> str | None:
+    name = symbol_map.get(symbol_key(symbol))
+    if name is None and keep_unknown:
+        return str(symbol)
+    return name
+
+
+def parse_timestamps(values: pd.Series) -> np.ndarray:
+    # نانوثانية UTC بلا منطقة زمنية (مثل CandleStore)؛ القيم غير الصالحة تصبح NaT (iNaT)
+    if pd.api.types.is_numeric_dtype(values):
+        raw = values.to_numpy(dtype=np.float64)
+        magnitude = np.nanmax(np.abs(raw)) if np.isfinite(raw).any() else 0.0
+        scale = next(scale for limit, scale in _EPOCH_UNITS if magnitude < limit)
+        out = np.full(len(raw), np.iinfo(np.int64).min, dtype="<i8")
+        finite = np.isfinite(raw)
+        out[finite] = (raw[finite] * scale).astype("<i8") if scale > 1 else raw[finite].astype("<i8")
+        return out
+    # النصوص بلا منطقة زمنية تُعتبر UTC كما يعيدها المزودان؛ التنسيق يُستنتج من أول قيمة (سريع)،
+    # وما فشل فقط يُعاد تحليله بتنسيق مختلط
+    parsed = pd.to_datetime(values, utc=True, errors="coerce")
+    failed = parsed.isna() & values.notna()
+    if failed.any():
+        parsed[failed] = pd.to_datetime(values[failed], utc=True, errors="coerce", format="mixed")
+    return parsed.dt.tz_localize(None).dt.as_unit("ns").to_numpy().view("<i8")
+
+
+def iter_chunks(path: str, chunk_rows: int = DEFAULT_CHUNK_ROWS, file_format: str | None = None):
+    file_format = (file_format or os.path.splitext(path)[1].lstrip(".")).lower()
+    if file_format in ("parquet", "pq"):
+        if pq is None:
+            raise ImportError("Reading Parquet requires pyarrow (pip install pyarrow).")
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=chunk_rows):
+            yield batch.to_pandas()
+    else:
+        yield from pd.read_csv(path, chunksize=chunk_rows)
+
+
+def _resolve_columns(columns) -> dict[str, str]:
+    # أسماء الأعمدة بلا حساسية لحالة الأحرف: الدور -> اسم العمود في الملف
+    lower = {str(c).strip().lower(): c for c in columns}
+    found = {col: lower[col] for col in COLUMNS if col in lower}
+    missing = [col for col in ("open", "high", "low", "close") if col not in found]
+    if missing:
+        raise ValueError(f"Missing OHLC columns {missing} (found {list(columns)}).")
+    time_column = next((lower[c] for c in TIME_COLUMNS if c in lower), None)
+    if time_column is None:
+        raise ValueError(f"No timestamp column; expected one of {TIME_COLUMNS}.")
+    found["time"] = time_column
+    symbol_column = next((lower[c] for c in SYMBOL_COLUMNS if c in lower), None)
+    if symbol_column is not None:
+        found["symbol"] = symbol_column
+    return found
+
+
+def is_descending(groups: list, timestamps: np.ndarray) -> bool:
+    # الاتجاه الغالب للوقت داخل كل رمز في القطعة (ملف بعدة رموز قد يكون مرتبًا حسب الرمز ثم الوقت)
+    steps = [np.diff(timestamps[rows]) for _, rows in groups]
+    return sum(int((d < 0).sum()) for d in steps) > sum(int((d > 0).sum()) for d in steps)
+
+
+def import_file(store: CandleStore, path: str, interval, source: str, symbol_map: dict[str, str],
+                symbol: str | None = None, chunk_rows: int = DEFAULT_CHUNK_ROWS, file_format: str | None = None,
+                keep_unknown: bool = False) -> dict:
+    # symbol: للملفات بلا عمود رمز (ملف لكل أصل)؛ يرجع عدادات الاستيراد
+    stats = {"rows": 0, "stored": 0, "invalid": 0, "unknown_symbol": 0, "symbols": set(), "descending": False}
+    roles = None
+    spool_dir, spooled = None, []  # ملف من الأحدث للأقدم: (ملف القطعة المؤقت، الرمز) بترتيب القراءة
+    try:
+        for chunk in iter_chunks(path, chunk_rows, file_format):
+            first_chunk = roles is None
+            if first_chunk:
+                roles = _resolve_columns(chunk.columns)
+                if "symbol" not in roles and symbol is None:
+                    raise ValueError(f"{path} has no symbol column; pass symbol= (--symbol).")
+            timestamps = parse_timestamps(chunk[roles["time"]])
+            columns = {col: (pd.to_numeric(chunk[roles[col]], errors="coerce").to_numpy(dtype="<f8") if col in roles
+                             else np.zeros(len(chunk), dtype="<f8")) for col in COLUMNS}
+            valid = (timestamps != np.iinfo(np.int64).min) & ~np.isnan(columns["close"])
+            stats["rows"] += len(chunk)
+            stats["invalid"] += int((~valid).sum())
+
+            if "symbol" in roles:
+                codes, raw_symbols = pd.factorize(chunk[roles["symbol"]])
+                groups = [(raw, (codes == k) & valid) for k, raw in enumerate(raw_symbols)]
+            else:
+                groups = [(symbol, valid)]
+            if first_chunk and is_descending(groups, timestamps):
+                # كل قطعة أقدم من سابقتها: إلحاقها مباشرة يعيد كتابة السلسلة كلها في كل قطعة
+                stats["descending"] = True
+                os.makedirs(store.base_dir, exist_ok=True)
+                spool_dir = tempfile.mkdtemp(prefix=".import-", dir=store.base_dir)
+            for raw, rows in groups:
+                name = normalize_symbol(raw, symbol_map, keep_unknown)
+                if name is None:
+                    stats["unknown_symbol"] += int(rows.sum())
+                    continue
+                if rows.all():
+                    part_ts, part_cols = timestamps, columns
+                else:
+                    part_ts, part_cols = timestamps[rows], {col: values[rows] for col, values in columns.items()}
+                stats["symbols"].add(name)
+                if spool_dir is None:
+                    stats["stored"] += store.append_arrays(source, name, interval, part_ts, part_cols)
+                    continue
+                part_path = os.path.join(spool_dir, f"{len(spooled):08d}.npz")
+                np.savez(part_path, timestamp=part_ts, **part_cols)
+                spooled.append((part_path, name))
+
+        for part_path, name in reversed(spooled):
+            # عكس القطعة يجعلها تصاعدية، وكل قطعة تلي المخزن فتُلحق بلا دمج
+            with np.load(part_path) as part:
+                stats["stored"] += store.append_arrays(source, name, interval, part["timestamp"][::-1],
+                                                       {col: part[col][::-1] for col in COLUMNS})
+            os.remove(part_path)
+    finally:
+        if spool_dir is not None:
+            shutil.rmtree(spool_dir, ignore_errors=True)
+    return stats
+
+
+def _monitored_assets() -> list[dict]:
+    # ASSETS_TO_MONITOR من main.py إن أمكن استيراده (يتطلب تبعيات البوت؛ main ينهي العملية إذا غاب data_fetcher)
+    try:
+        from main import ASSETS_TO_MONITOR
+        return ASSETS_TO_MONITOR
+    except (ImportError, SystemExit) as e:
+        print(f"Import Warning: Could not load ASSETS_TO_MONITOR from main.py ({e}); symbols are kept as-is.")
+        return []
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Bulk import CSV/Parquet OHLCV history into the candle store.")
+    parser.add_argument("paths", nargs="+")
+    parser.add_argument("--interval", required=True, help="candle interval of the files, e.g. 1min or 15min")
+    parser.add_argument("--source", default="TWELVEDATA")
+    parser.add_argument("--store", default=DEFAULT_STORE_DIR)
+    parser.add_argument("--symbol", default=None, help="symbol for files without a symbol column")
+    parser.add_argument("--format", default=None, choices=("csv", "parquet"))
+    parser.add_argument("--chunk-rows", type=int, default=DEFAULT_CHUNK_ROWS)
+    parser.add_argument("--keep-unknown", action="store_true", help="store symbols missing from ASSETS_TO_MONITOR as-is")
+    args = parser.parse_args()
+
+    symbol_map = build_symbol_map(_monitored_assets())
+    keep_unknown = args.keep_unknown or not symbol_map
+    store = CandleStore(args.store)
+    for path in args.paths:
+        started = time.perf_counter()
+        stats = import_file(store, path, args.interval, args.source, symbol_map, args.symbol,
+                            args.chunk_rows, args.format, keep_unknown)
+        elapsed = time.perf_counter() - started
+        print(f"Import: {path}: {stats['rows']} rows, {stats['stored']} stored for {sorted(stats['symbols'])}, "
+              f"{stats['invalid']} invalid, {stats['unknown_symbol']} unknown symbol "
+              f"({elapsed:.1f}s, {stats['rows'] / max(elapsed, 1e-9):,.0f} rows/s)")
+        for name in sorted(stats["symbols"]):
+            print(f"  {name} {args.interval}: {store.row_count(args.source, name, args.interval)} candles in store")
@@ -0,0 +1,310 @@
+# indicator_engine.py
+# محرك مؤشرات تزايدي: يحتفظ بحالة كل مؤشر لكل (symbol, frame) ويحدّثها بكلفة ثابتة O(1) عند إغلاق كل شمعة
+# بدل إعادة حساب EMA/RSI/MACD/Stochastic/OBV/Bollinger/ATR على 250 صفًا في كل دقيقة.
+# المخرجات تطابق حسابات مكتبة ta المستخدمة في signal_engine.generate_signals (ضمن تفاوت عددي صغير).
+import copy
+import math
+from collections import deque
+
+from strategy.candle_patterns import pattern_window, patterns_for_last_candle
+
+NAN = float("nan")
+
+
+class _Ema:
+    # ewm(adjust=False, min_periods): البذرة هي أول قيمة ثم y = (1 - a) * y + a * x
+    def __init__(self, alpha: float, min_periods: int):
+        self.alpha = alpha
+        self.min_periods = min_periods
+        self.count = 0
+        self.mean = NAN
+
+    def update(self, x: float) -> float:
+        if math.isnan(x):
+            return self.value
+        self.mean = x if self.count == 0 else self.mean + self.alpha * (x - self.mean)
+        self.count += 1
+        return self.value
+
+    @property
+    def value(self) -> float:
+        return self.mean if self.count >= self.min_periods else NAN
+
+
+class _RollingWindow:
+    # نافذة متحركة بمجموع ومجموع مربعات جاريين (المتوسط والانحراف المعياري ddof=0)،
+    # مع إعادة حساب دورية دقيقة لمنع تراكم أخطاء الفاصلة العائمة
+    def __init__(self, window: int):
+        self.window = window
+        self.values = deque(maxlen=window)
+        self.total = 0.0
+        self.total_sq = 0.0
+        self._updates = 0
+
+    def update(self, x: float) -> None:
+        if len(self.values) == self.window:
+            old = self.values[0]
+            self.total -= old
+            self.total_sq -= old * old
+        self.values.append(x)
+        self.total += x
+        self.total_sq += x * x
+        self._updates += 1
+        if self._updates % self.window == 0:
+            self.total = math.fsum(self.values)
+            self.total_sq = math.fsum(v * v for v in self.values)
+
+    @property
+    def full(self) -> bool:
+        return len(self.values) == self.window
+
+    @property
+    def mean(self) -> float:
+        return self.total / self.window if self.full else NAN
+
+    @property
+    def std(self) -> float:
+        if not self.full:
+            return NAN
+        mean = self.total / self.window
+        return math.sqrt(max(0.0, self.total_sq / self.window - mean * mean))
+
+
+class _RollingExtreme:
+    # أعلى/أدنى قيمة في نافذة متحركة عبر deque رتيب (O(1) مطفأ لكل تحديث)
+    def __init__(self, window: int, is_max: bool):
+        self.window = window
+        self.is_max = is_max
+        self.index = -1
+        self.candidates = deque()  # (index, value)
+
+    def update(self, x: float) -> None:
+        self.index += 1
+        while self.candidates and (self.candidates[-1][1] <= x if self.is_max else self.candidates[-1][1] >= x):
+            self.candidates.pop()
+        self.candidates.append((self.index, x))
+        if self.candidates[0][0] <= self.index - self.window:
+            self.candidates.popleft()
+
+    @property
+    def value(self) -> float:
+        return self.candidates[0][1] if self.index + 1 >= self.window else NAN
+
+
+class IndicatorState:
+    def __init__(self):
+        self.ema20 = _Ema(2 / 21, 20)
+        self.ema50 = _Ema(2 / 51, 50)
+        self.tenkan_high = _RollingExtreme(9, is_max=True)
+        self.tenkan_low = _RollingExtreme(9, is_max=False)
+        self.rsi_up = _Ema(1 / 9, 9)
+        self.rsi_down = _Ema(1 / 9, 9)
+        self.macd_fast = _Ema(2 / 13, 12)
+        self.macd_slow = _Ema(2 / 27, 26)
+        self.macd_sign = _Ema(2 / 10, 9)
+        self.stoch_high = _RollingExtreme(5, is_max=True)
+        self.stoch_low = _RollingExtreme(5, is_max=False)
+        self.obv = 0.0
+        self.obv_fast = _RollingWindow(20)
+        self.obv_slow = _RollingWindow(50)
+        self.boll = _RollingWindow(20)
+        self.atr_window = 14
+        self.atr = 0.0
+        self.atr_count = 0
+        self.atr_sum = 0.0
+        self.recent = deque(maxlen=pattern_window())  # آخر الشموع التي تحتاجها أنماط الشموع
+        self.prev_close = None
+        self.last_timestamp = None
+        self.values: dict = {}
+
+    def update(self, candle: dict, timestamp=None) -> dict:
+        o, h, l, c = candle["open"], candle["high"], candle["low"], candle["close"]
+        v = candle.get("volume", 0.0) or 0.0
+        prev_close = self.prev_close
+
+        ema20 = self.ema20.update(c)
+        ema50 = self.ema50.update(c)
+        self.tenkan_high.update(h)
+        self.tenkan_low.update(l)
+        tenkan = (self.tenkan_high.value + self.tenkan_low.value) / 2
+
+        # diff الأول NaN يتحول إلى 0 في ta (where(diff > 0, 0.0))، لذا تبدأ المتوسطات من الشمعة الأولى
+        diff = 0.0 if prev_close is None else c - prev_close
+        up = self.rsi_up.update(diff if diff > 0 else 0.0)
+        down = self.rsi_down.update(-diff if diff < 0 else 0.0)
+        if math.isnan(down):
+            rsi = NAN
+        elif down == 0:
+            rsi = 100.0
+        else:
+            rsi = 100 - 100 / (1 + up / down)
+
+        macd_line = self.macd_fast.update(c) - self.macd_slow.update(c)
+        macd_signal = self.macd_sign.update(macd_line)
+
+        self.stoch_high.update(h)
+        self.stoch_low.update(l)
+        stoch_range = self.stoch_high.value - self.stoch_low.value
+        stoch = 100 * (c - self.stoch_low.value) / stoch_range if stoch_range != 0 else NAN
+
+        self.obv += -v if (prev_close is not None and c < prev_close) else v
+        self.obv_fast.update(self.obv)
+        self.obv_slow.update(self.obv)
+
+        self.boll.update(c)
+        boll_mid, boll_std = self.boll.mean, self.boll.std
+
+        true_range = h - l if prev_close is None else max(h - l, abs(h - prev_close), abs(l - prev_close))
+        self.atr_count += 1
+        if self.atr_count < self.atr_window:
+            self.atr_sum += true_range
+        elif self.atr_count == self.atr_window:
+            self.atr = (self.atr_sum + true_range) / self.atr_window
+        else:
+            self.atr = (self.atr * (self.atr_window - 1) + true_range) / self.atr_window
+
+        self.recent.append({"open": o, "high": h, "low": l, "close": c})
+
+        self.prev_close = c
+        self.last_timestamp = timestamp
+        self.values = {
+            "close": c, "ema20": ema20, "ema50": ema50, "tenkan": tenkan, "rsi": rsi,
+            "macd_line": macd_line, "macd_signal": macd_signal, "stoch": stoch,
+            "obv": self.obv, "obv_mean20": self.obv_fast.mean, "obv_mean50": self.obv_slow.mean,
+            "boll_lower": boll_mid - 2 * boll_std, "boll_upper": boll_mid + 2 * boll_std,
+            "atr": self.atr,
+            **patterns_for_last_candle(self.recent),
+        }
+        return self.values
+
+    def preview(self, candle: dict) -> dict:
+        # قيم المؤشرات لو أُضيفت هذه الشمعة دون تعديل الحالة (للشمعة التي ما زالت قيد التكوين)
+        return copy.deepcopy(self).update(candle)
+
+
+def evaluate_signal_conditions(values: dict) -> tuple[bool, bool]:
+    # نفس شروط buy_signal / sell_signal في signal_engine.generate_signals (المقارنات مع NaN = False)
+    v = values
+    stoch_ok = 20 <= v["stoch"] <= 80
+    obv_trend = v["obv_mean20"] > v["obv_mean50"]
+    buy = (
+        v["ema20"] > v["ema50"] and v["close"] > v["tenkan"] and v["rsi"] < 70 and
+        v["macd_line"] > v["macd_signal"] and stoch_ok and obv_trend and
+        v["close"] <= v["boll_lower"] and
+        (v["bullish_engulfing"] or v["hammer"] or v["morning_star"] or v["three_white_soldiers"])
+    )
+    sell = (
+        v["ema20"] < v["ema50"] and v["close"] < v["tenkan"] and v["rsi"] > 30 and
+        v["macd_line"] < v["macd_signal"] and stoch_ok and
+        not obv_trend and
+        v["close"] >= v["boll_upper"] and
+        (v["bearish_engulfing"] or v["shooting_star"] or v["evening_star"] or v["three_black_crows"])
+    )
+    return bool(buy), bool(sell)
+
+
+class IndicatorEngine:
+    def __init__(self, rule_evaluator=None):
+        # rule_evaluator (signal_rules.RuleEvaluator) اختياري: نفس القرار مع إحصاءات رفض الشروط
+        self.rule_evaluator = rule_evaluator
+        self._states: dict = {}
+        self.candles_applied = 0
+        self.rebuilds = 0
+
+    def state_for(self, symbol: str, frame: str) -> IndicatorState:
+        key = (symbol, frame)
+        if key not in self._states:
+            self._states[key] = IndicatorState()
+        return self._states[key]
+
+    def reset(self, symbol: str, frame: str) -> None:
+        self._states.pop((symbol, frame), None)
+
+    def sync(self, symbol: str, frame: str, df) -> dict | None:
+        # يطبق الشموع المغلقة الجديدة فقط (كل الصفوف عدا الأخير)، ثم يعاين الصف الأخير دون تثبيته
+        # لأنه قد يكون شمعة قيد التكوين ستتغير في الدورة القادمة
+        if df is None or df.empty:
+            return None
+        state = self.state_for(symbol, frame)
+        index = df.index
+        start = 0
+        if state.last_timestamp is not None:
+            position = index.searchsorted(state.last_timestamp)
+            if position < len(index) and index[position] == state.last_timestamp:
+                start = position + 1
+            else:
+                # التاريخ المخزن لم يعد متصلًا بالحالة (فجوة أو إعادة تشغيل): نعيد البناء من البيانات الحالية
+                self.rebuilds += 1
+                state = self._states[(symbol, frame)] = IndicatorState()
+
+        rows = df[["open", "high", "low", "close", "volume"]].iloc[start:].to_numpy()
+        for i in range(len(rows) - 1):
+            o, h, l, c, v = rows[i]
+            state.update({"open": o, "high": h, "low": l, "close": c, "volume": v}, timestamp=index[start + i])
+            self.candles_applied += 1
+        if len(rows) == 0:
+            # الصف الأخير مثبّت بالفعل (لا جديد منذ آخر استدعاء)
+            return state.values
+        o, h, l, c, v = rows[-1]
+        return state.preview({"open": o, "high": h, "low": l, "close": c, "volume": v})
+
+    def signal(self, symbol: str, frame: str, df) -> str | None:
+        values = self.sync(symbol, frame, df)
+        if not values:
+            return None
+        if self.rule_evaluator is not None:
+            return self.rule_evaluator.decide(values)
+        buy, sell = evaluate_signal_conditions(values)
+        if buy:
+            return "call"
+        if sell:
+            return "put"
+        return None
+
+
+# --- مقارنة مع حسابات ta (للاختبار فقط) ---
+if __name__ == '__main__':
+    import numpy as np
+    import pandas as pd
+    from ta.momentum import RSIIndicator, StochasticOscillator
+    from ta.trend import EMAIndicator, MACD
+    from ta.volatility import AverageTrueRange, BollingerBands
+    from ta.volume import OnBalanceVolumeIndicator
+
+    TOLERANCE = 1e-9
+    rng = np.random.default_rng(7)
+    n = 5000
+    close = 1.1 * np.exp(np.cumsum(rng.standard_normal(n) * 0.002))
+    open_ = np.r_[close[0], close[:-1]]
+    df = pd.DataFrame({
+        'open': open_, 'close': close,
+        'high': np.maximum(open_, close) * (1 + np.abs(rng.standard_normal(n)) * 0.001),
+        'low': np.minimum(open_, close) * (1 - np.abs(rng.standard_normal(n)) * 0.001),
+        'volume': rng.integers(0, 1000, n).astype(float),
+    }, index=pd.date_range('2024-01-01', periods=n, freq='15min'))
+
+    obv = OnBalanceVolumeIndicator(df['close'], df['volume']).on_balance_volume()
+    macd = MACD(df['close'], window_slow=26, window_fast=12, window_sign=9)
+    boll = BollingerBands(df['close'], window=20, window_dev=2)
+    expected = {
+        'ema20': EMAIndicator(df['close'], window=20).ema_indicator(),
+        'ema50': EMAIndicator(df['close'], window=50).ema_indicator(),
+        'tenkan': (df['high'].rolling(9).max() + df['low'].rolling(9).min()) / 2,
+        'rsi': RSIIndicator(df['close'], window=9).rsi(),
+        'macd_line': macd.macd(), 'macd_signal': macd.macd_signal(),
+        'stoch': StochasticOscillator(df['high'], df['low'], df['close'], window=5, smooth_window=3).stoch(),
+        'obv_mean20': obv.rolling(20).mean(), 'obv_mean50': obv.rolling(50).mean(),
+        'boll_lower': boll.bollinger_lband(), 'boll_upper': boll.bollinger_hband(),
+        'atr': AverageTrueRange(df['high'], df['low'], df['close'], window=14).average_true_range(),
+    }
+
+    state = IndicatorState()
+    rows = [dict(state.update(candle)) for candle in df.to_dict('records')]
+    actual = pd.DataFrame(rows, index=df.index)
+    for name, series in expected.items():
+        a, e = actual[name].to_numpy(), series.to_numpy()
+        assert (np.isnan(a) == np.isnan(e)).all(), f"{name}: warm-up (NaN) positions differ"
+        max_error = np.nanmax(np.abs(a - e) / np.maximum(1.0, np.abs(e)))
+        print(f"{name:12s} max relative error: {max_error:.2e}")
+        assert max_error < TOLERANCE, f"{name} exceeds tolerance"
+    print("All incremental indicators match ta within tolerance.")
@@ -0,0 +1,154 @@
+# indicator_kernels.py
+# نوى NumPy متجهة للمؤشرات المستخدمة في signal_engine، تعمل على المحور الأخير لأي مصفوفة (..., T)
+# فتصلح لسلسلة واحدة (T,) أو لدفعة (أصول × أطر × شموع). القيم NaN في بداية السلسلة تعني "لا بيانات" (حشو)
+# وتُعامل مثل بداية السلسلة في pandas/ta: EMA تبدأ من أول قيمة صالحة، والنوافذ التي تلمس الحشو تعطي NaN.
+import numpy as np
+
+_EMA_BLOCK = 64
+_block_cache: dict = {}
+_weights_cache: dict = {}
+
+
+def _scan_block_operators(decay: float, block: int) -> tuple[np.ndarray, np.ndarray]:
+    # y[k] = sum_j M[k, j] * u[j] + decay^(k+1) * y_prev داخل كتلة طولها block (كل القوى <= 1 فلا فيضان عددي)
+    key = (decay, block)
+    if key not in _block_cache:
+        k = np.arange(block)
+        lags = k[:, None] - k[None, :]
+        mixing = np.where(lags >= 0, decay ** np.maximum(lags, 0), 0.0)
+        _block_cache[key] = (mixing.T.copy(), decay ** (k + 1))
+    return _block_cache[key]
+
+
+def _affine_scan(u: np.ndarray, decay: float, seed: np.ndarray) -> np.ndarray:
+    # y[t] = decay * y[t-1] + u[t] على المحور الأخير، y[-1] = seed. الكتل تُحسب كلها بجداء مصفوفي واحد،
+    # وحمل كل كتلة إلى التالية هو نفس المعادلة على آخر قيم الكتل (بمعامل decay^block) فيُحل بنفس الدالة تعاوديًا
+    n = u.shape[-1]
+    block = _EMA_BLOCK
+    mixing_t, powers = _scan_block_operators(decay, block)
+    if n <= block:
+        return u @ mixing_t[:n, :n] + seed[..., None] * powers[:n]
+    n_blocks = -(-n // block)
+    padded = np.zeros(u.shape[:-1] + (n_blocks * block,))
+    padded[..., :n] = u
+    local = padded.reshape(u.shape[:-1] + (n_blocks, block)) @ mixing_t  # كل كتلة بحمل صفري
+    # carry[k] = آخر قيمة في الكتلة k بعد إضافة حمل ما قبلها
+    carry = _affine_scan(local[..., -1], decay ** block, seed)
+    previous = np.concatenate([seed[..., None], carry[..., :-1]], axis=-1)
+    out = local + previous[..., None] * powers
+    return out.reshape(u.shape[:-1] + (n_blocks * block,))[..., :n]
+
+
+def first_valid_index(x: np.ndarray) -> np.ndarray:
+    valid = ~np.isnan(x)
+    first = np.argmax(valid, axis=-1)
+    return np.where(valid.any(axis=-1), first, x.shape[-1])
+
+
+def ema(x: np.ndarray, alpha: float, min_periods: int = 1) -> np.ndarray:
+    # ewm(alpha, adjust=False, min_periods) محسوبة بكتل مصفوفية بدل حلقة بايثون لكل شمعة
+    x = np.asarray(x, dtype=np.float64)
+    n = x.shape[-1]
+    if n == 0:
+        return x.copy()
+    start = first_valid_index(x)
+    seed = np.take_along_axis(x, np.minimum(start, n - 1)[..., None], axis=-1)[..., 0]
+    # ملء الحشو الأمامي بأول قيمة صالحة: y يبقى ثابتًا عند البذرة حتى بداية السلسلة الفعلية
+    filled = np.where(np.arange(n) < start[..., None], seed[..., None], x)
+
+    out = _affine_scan(alpha * filled, 1 - alpha, seed)
+
+    positions = np.arange(n)
+    out[positions < (start + min_periods - 1)[..., None]] = np.nan
+    return out
+
+
+def ema_last(x: np.ndarray, alpha: float, min_periods: int = 1) -> float:
+    # آخر قيمة فقط لسلسلة أحادية بدون حشو: y_n = (1-a)^(n-1) x_0 + sum a (1-a)^(n-1-i) x_i كجداء نقطي واحد
+    n = len(x)
+    if n < min_periods or n == 0:
+        return np.nan
+    key = (alpha, n)
+    weights = _weights_cache.get(key)
+    if weights is None:
+        weights = alpha * (1 - alpha) ** np.arange(n - 1, -1, -1, dtype=np.float64)
+        weights[0] = (1 - alpha) ** (n - 1)
+        _weights_cache[key] = weights
+    return float(np.dot(weights, x))
+
+
+def _rolling(x: np.ndarray, window: int, combine, finish=None) -> np.ndarray:
+    # النافذة كـ window عملية متجهة على شرائح متجاورة مزاحة (أسرع من الاختزال على sliding_window_view
+    # للسلاسل الطويلة)؛ أي NaN داخل النافذة ينتشر إلى النتيجة كما في rolling(window) في pandas
+    x = np.asarray(x, dtype=np.float64)
+    n = x.shape[-1]
+    out = np.full(x.shape, np.nan)
+    if n >= window:
+        width = n - window + 1
+        acc = x[..., :width].copy()
+        for offset in range(1, window):
+            combine(acc, x[..., offset:offset + width], out=acc)
+        out[..., window - 1:] = acc if finish is None else finish(acc)
+    return out
+
+
+def rolling_max(x: np.ndarray, window: int) -> np.ndarray:
+    return _rolling(x, window, np.maximum)
+
+
+def rolling_min(x: np.ndarray, window: int) -> np.ndarray:
+    return _rolling(x, window, np.minimum)
+
+
+def rolling_mean(x: np.ndarray, window: int) -> np.ndarray:
+    return _rolling(x, window, np.add, lambda total: total / window)
+
+
+def rolling_std(x: np.ndarray, window: int) -> np.ndarray:
+    # ddof=0 كما في BollingerBands من ta؛ على مرحلتين (المتوسط ثم مجموع مربعات الانحراف) لدقة أفضل
+    x = np.asarray(x, dtype=np.float64)
+    mean = rolling_mean(x, window)
+    out = np.full(x.shape, np.nan)
+    n = x.shape[-1]
+    if n >= window:
+        width = n - window + 1
+        center = mean[..., window - 1:]
+        squares = np.zeros(x.shape[:-1] + (width,))
+        for offset in range(window):
+            deviation = x[..., offset:offset + width] - center
+            squares += deviation * deviation
+        out[..., window - 1:] = np.sqrt(squares / window)
+    return out
+
+
+def rsi(close: np.ndarray, window: int) -> np.ndarray:
+    close = np.asarray(close, dtype=np.float64)
+    diff = np.diff(close, axis=-1, prepend=np.nan)
+    valid = ~np.isnan(close)
+    # ta: diff.where(diff > 0, 0.0) يحول الفرق الأول (NaN) إلى 0، فتبدأ المتوسطات من أول شمعة
+    up = np.where(valid, np.where(diff > 0, diff, 0.0), np.nan)
+    down = np.where(valid, np.where(diff < 0, -diff, 0.0), np.nan)
+    ema_up = ema(up, 1.0 / window, window)
+    ema_down = ema(down, 1.0 / window, window)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(ema_down == 0, 100.0, 100 - 100 / (1 + ema_up / ema_down))
+
+
+def macd(close: np.ndarray, fast: int = 12, slow: int = 26, sign: int = 9) -> tuple[np.ndarray, np.ndarray]:
+    line = ema(close, 2 / (fast + 1), fast) - ema(close, 2 / (slow + 1), slow)
+    return line, ema(line, 2 / (sign + 1), sign)
+
+
+def stoch_k(high: np.ndarray, low: np.ndarray, close: np.ndarray, window: int) -> np.ndarray:
+    lowest = rolling_min(low, window)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return 100 * (close - lowest) / (rolling_max(high, window) - lowest)
+
+
+def obv(close: np.ndarray, volume: np.ndarray) -> np.ndarray:
+    close = np.asarray(close, dtype=np.float64)
+    prev = np.concatenate([np.full(close.shape[:-1] + (1,), np.nan), close[..., :-1]], axis=-1)
+    signed = np.where(close < prev, -volume, volume)
+    valid = ~np.isnan(close)
+    out = np.cumsum(np.where(valid, signed, 0.0), axis=-1)
+    return np.where(valid, out, np.nan)
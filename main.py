@@ -1,9 +1,14 @@
 # main_bot.py
+import time
+STARTUP_STARTED_AT = time.time() # قبل الاستيرادات الثقيلة: أساس قياس زمن البدء حتى أول إشارة
 import pandas as pd
+import numpy as np
 from datetime import datetime
-import time
 from telegram import Bot
 import sys 
+import os
+import json
+import contextlib
 from telegram.ext import Application, CommandHandler, ContextTypes, MessageHandler, filters # تأكد من هذا الاستيراد
 import asyncio
 
@@ -32,21 +37,158 @@ except ImportError:
     sys.exit(1)
 
 try:
-    from signal_engine import get_single_signal_from_engine
+    from candle_store import CandleStore
+    print("Main: Successfully loaded candle_store.")
+except ImportError:
+    print("Main Warning: candle_store.py not found. Every cycle will fetch the full candle window.")
+    CandleStore = None
+
+try:
+    from async_fetcher import AsyncCandleFetcher
+    print("Main: Successfully loaded async_fetcher.")
+except ImportError:
+    print("Main Warning: async_fetcher.py not found. Candles will be fetched one request at a time.")
+    AsyncCandleFetcher = None
+
+try:
+    from request_scheduler import RequestScheduler, PRIORITY_INTERACTIVE, PRIORITY_BACKGROUND
+    print("Main: Successfully loaded request_scheduler.")
+except ImportError:
+    print("Main Warning: request_scheduler.py not found. Fetches will not be credit-limited.")
+    RequestScheduler = None
+    PRIORITY_INTERACTIVE, PRIORITY_BACKGROUND = 0, 10
+
+try:
+    from stream_ingest import StreamIngestor, TwelveDataPriceStream, LineJsonPriceStream
+    print("Main: Successfully loaded stream_ingest.")
+except ImportError:
+    print("Main Warning: stream_ingest.py not found. Only POLL ingestion mode is available.")
+    StreamIngestor = None
+
+try:
+    from timeframes import closed_candles
+    print("Main: Successfully loaded timeframes.")
+except ImportError:
+    print("Main Warning: timeframes.py not found. The forming candle will be analyzed with the closed ones.")
+    def closed_candles(df, interval_or_timeframe, now=None): return df
+
+try:
+    from resampler import plan_frames, base_count_for, derive_frames
+    print("Main: Successfully loaded resampler.")
+except ImportError:
+    print("Main Warning: resampler.py not found. Every frame will be fetched from the source.")
+    plan_frames = None
+
+try:
+    from metrics import REGISTRY, DECISION_SECONDS, INDICATOR_SECONDS, SIGNALS_TOTAL, TELEGRAM_ERRORS, TELEGRAM_SECONDS, timed_fetch
+    METRICS_ENABLED = True
+    print("Main: Successfully loaded metrics.")
+except ImportError:
+    print("Main Warning: metrics.py not found. Stage timings and /metrics are disabled.")
+    METRICS_ENABLED = False
+    class _NoMetrics:
+        # نفس ما يستخدمه هذا الملف من metrics (timed/time/inc/gauge/format_summary/shutdown) بلا قياس
+        def timed(self, **labels): return lambda fn: fn
+        def time(self, **labels): return contextlib.nullcontext()
+        def inc(self, amount=1, **labels): pass
+        def gauge(self, name, help_text, fn): pass
+        def format_summary(self): return "metrics.py not found"
+        def shutdown(self): pass
+    REGISTRY = DECISION_SECONDS = INDICATOR_SECONDS = SIGNALS_TOTAL = TELEGRAM_ERRORS = TELEGRAM_SECONDS = _NoMetrics()
+    def timed_fetch(fetch_fn): return fetch_fn
+
+try:
+    from signal_engine import get_single_signal_from_engine, rule_evaluator
     print("Main: Successfully loaded signal_engine.")
 except ImportError:
     print("Main CRITICAL ERROR: signal_engine.py not found. Bot cannot run.")
     sys.exit(1)
 
 try:
-    from broker.quotex_executor import setup_browser, login_quotex, place_trade, close_browser
-    print("Main: Successfully loaded Quotex executor.")
+    from indicator_engine import IndicatorEngine
+    print("Main: Successfully loaded indicator_engine.")
+except ImportError:
+    print("Main Warning: indicator_engine.py not found. Indicators will be recomputed on every cycle.")
+    IndicatorEngine = None
+
+try:
+    from batch_signals import stack_frames, batch_frame_directions, multiframe_consensus
+    print("Main: Successfully loaded batch_signals.")
+except ImportError:
+    print("Main Warning: batch_signals.py not found. Each asset/frame will be analyzed separately.")
+    stack_frames = None
+
+try:
+    from signal_cache import TTLCache, MISSING, frame_fingerprint
+    from timeframes import candle_open_time
+    print("Main: Successfully loaded signal_cache.")
+except ImportError:
+    print("Main Warning: signal_cache.py not found. Frames and signals will not be cached.")
+    TTLCache = None
+
+try:
+    from close_scheduler import CandleCloseScheduler
+    print("Main: Successfully loaded close_scheduler.")
+except ImportError:
+    print("Main Warning: close_scheduler.py not found. The background loop will rescan every 60 seconds.")
+    CandleCloseScheduler = None
+
+try:
+    from execution import ExecutionLayer, LoopLagMonitor
+    print("Main: Successfully loaded execution.")
+except ImportError:
+    print("Main Warning: execution.py not found. Blocking work will use asyncio.to_thread without a process pool.")
+    ExecutionLayer = None
+
+try:
+    from sharding import ShardCoordinator, ShardWorker, parse_address, worker_authkey
+    print("Main: Successfully loaded sharding.")
+except ImportError:
+    print("Main Warning: sharding.py not found. Coordinator/worker scanning disabled.")
+    ShardCoordinator = None
+
+try:
+    from telegram_outbox import TelegramOutbox
+    print("Main: Successfully loaded telegram_outbox.")
+except ImportError:
+    print("Main Warning: telegram_outbox.py not found. Signals will be sent directly with a 3s pause between them.")
+    TelegramOutbox = None
+
+try:
+    from quotex_pool import QuotexSessionPool
+    print("Main: Successfully loaded quotex_pool.")
+except ImportError:
+    print("Main Warning: quotex_pool.py not found. Trades will run one after another on a single browser session.")
+    QuotexSessionPool = None
+
+try:
+    from order_queue import OrderQueue
+    print("Main: Successfully loaded order_queue.")
 except ImportError:
-    print("Main Warning: broker/quotex_executor.py not found. Trading functions will be simulated.")
-    def setup_browser(headless=True, browser_type="chrome"): print("Mock: setup_browser"); return "mock_driver"
-    def login_quotex(driver, email, password): print("Mock: login_quotex"); return True
-    def place_trade(driver, asset, direction, amount, duration): print(f"Mock: place_trade for {asset}"); return True
-    def close_browser(driver): print("Mock: close_browser")
+    print("Main Warning: order_queue.py not found. Trades will be placed inline, without signal deadlines.")
+    OrderQueue = None
+
+# Quotex executor (selenium) يُحمّل عند أول استخدام في مسار "browser" (load_quotex_executor) لا عند بدء التشغيل
+setup_browser = login_quotex = place_trade = close_browser = None
+prepare_trade = click_trade_button = check_session = None
+
+def load_quotex_executor() -> None:
+    global setup_browser, login_quotex, place_trade, close_browser, prepare_trade, click_trade_button, check_session
+    if setup_browser is not None:
+        return
+    try:
+        from broker.quotex_executor import setup_browser, login_quotex, place_trade, close_browser
+        from broker.quotex_executor import prepare_trade, click_trade_button, check_session
+        print("Main: Successfully loaded Quotex executor.")
+    except ImportError:
+        print("Main Warning: broker/quotex_executor.py not found. Trading functions will be simulated.")
+        def setup_browser(headless=True, browser_type="chrome"): print("Mock: setup_browser"); return "mock_driver"
+        def login_quotex(driver, email, password): print("Mock: login_quotex"); return True
+        def place_trade(driver, asset, direction, amount, duration): print(f"Mock: place_trade for {asset}"); return True
+        def close_browser(driver): print("Mock: close_browser")
+        def prepare_trade(driver, asset, duration, amount): print(f"Mock: prepare_trade for {asset}"); return True
+        def click_trade_button(driver, direction): print(f"Mock: click_trade_button {direction}"); return True
+        def check_session(driver): return True
 
 
 # ========== إعدادات المستخدم الرئيسية للتشغيل ==========
@@ -61,12 +203,93 @@ TRADE_AMOUNT = 1
 TRADE_DURATION = "1m" 
 ANALYSIS_FRAMES = ["15min", "30min", "1h"] 
 CANDLE_COUNT_TO_FETCH = 250 
+CANDLE_STORE_DIR = "data/candles" # مخزن الشموع المحلي: نجلب فقط الشموع الجديدة بعد آخر شمعة مخزنة
+FETCH_CONCURRENCY = 8 # الحد الأقصى للطلبات المتزامنة نحو مصدر البيانات
+RESAMPLE_HIGHER_FRAMES = True # جلب أصغر إطار فقط واشتقاق الأطر الأعلى منه محليًا
+API_CREDITS_PER_MINUTE = 8 # حدود خطة TwelveData (الخطة المجانية: 8 في الدقيقة و800 في اليوم)
+API_CREDITS_PER_DAY = 800
+INGESTION_MODE = "POLL" # "POLL" (بعد إغلاق كل شمعة) أو "STREAM" (TwelveData websocket) أو "STREAM_REPLAY" (خادم stream_replay.py المحلي)
+STREAM_REPLAY_HOST = "127.0.0.1"
+STREAM_REPLAY_PORT = 8765
+STREAM_REPLAY_WALL_CLOCK = False # False: في إعادة التشغيل المسرّعة تُغلق الشموع بوقت التيكات فقط؛ True لوضع السير العشوائي الحي
+USE_INCREMENTAL_INDICATORS = True # تحديث المؤشرات بكلفة ثابتة لكل شمعة جديدة بدل إعادة حسابها على كامل النافذة
+USE_BATCH_SIGNAL_ENGINE = True # تحليل كل الأصول والأطر بتمريرة متجهة واحدة في الدورة الكاملة (لمئات الأصول)
+FRAME_CACHE_TTL_S = 50 # عمر الإطار المجلوب في الذاكرة: /check بعد دورة الخلفية مباشرة لا يعيد الجلب، والدورة التالية (بعد الإغلاق التالي) تجلب من جديد
+SIGNAL_CACHE_TTL_S = 3600 # نتيجة الإشارة مرتبطة بمحتوى الإطار نفسه، فلا تتقادم إلا بتغير الشموع
+CACHE_MAX_ENTRIES = 4096
+CANDLE_CLOSE_GRACE_S = 3 # مهلة بعد إغلاق الشمعة قبل الجلب، حتى ينشر المزود الشمعة المغلقة
+PROCESS_POOL_WORKERS = 2 # عمليات حساب المؤشرات الدفعي خارج حلقة أحداث تيليجرام
+FETCH_TIMEOUT_S = 60 # مهلة كل طلب جلب متزامن (يشمل انتظار دوره في مسار الخيوط)
+SIGNAL_COMPUTE_TIMEOUT_S = 60
+QUOTEX_LOGIN_TIMEOUT_S = 90 # فتح المتصفح وتسجيل الدخول
+QUOTEX_TRADE_TIMEOUT_S = 30
+QUOTEX_POOL_SIZE = 3 # جلسات متصفح مسجلة الدخول تنفذ صفقات الدورة بالتوازي، كل منها مثبتة على أصل (أول أصول ASSETS_TO_MONITOR)؛ 0 = جلسة واحدة متسلسلة
+QUOTEX_HEALTH_CHECK_S = 60 # فحص صحة الجلسات الخاملة؛ الجلسة الميتة يعاد تسجيل دخولها في الخلفية
+ORDER_QUEUE_SIZE = 50 # أوامر تنتظر التنفيذ؛ ما يزيد يُرفض
+ORDER_ENTRY_WINDOW_FRACTION = 0.5 # نافذة الدخول = هذا الجزء من TRADE_DURATION بعد الإشارة؛ أمر لم يبدأ تنفيذه خلالها يُسقط
+FAST_START = True # تشغيل المتصفح وتسجيل الدخول في الخلفية بالتوازي مع تيليجرام وأول دورة تحليل؛ False = انتظارهما قبل بدء الحلقة
+SHARDING_MODE = "OFF" # "OFF" أو "COORDINATOR" (يوزع الأصول على عمّال: محليين، أو `python main.py --shard-worker host:port` على أجهزة أخرى)
+SHARD_COORDINATOR_ADDRESS = ("127.0.0.1", 50555) # "0.0.0.0" لقبول عمّال من أجهزة أخرى (يتطلب SHARD_AUTHKEY)
+SHARD_AUTHKEY = None # مفتاح مشترك طويل وسري (bytes) للعمّال على أجهزة أخرى؛ None = مفتاح عشوائي لكل تشغيل للعمّال المحليين فقط
+LOCAL_SHARD_WORKERS = 2 # عمّال يشغلهم المنسّق على نفس الجهاز
+SHARD_HEARTBEAT_S = 5
+SHARD_WORKER_TIMEOUT_S = 30 # عامل بلا نبضة لهذه المدة يُعتبر ساقطًا وتوزع أصوله على الباقين
+METRICS_PORT = 9108 # نقطة Prometheus المحلية (http://127.0.0.1:9108/metrics)؛ None للتعطيل
+TELEGRAM_MESSAGES_PER_SECOND = 1 # حدود تيليجرام لمحادثة واحدة (رسالة في الثانية، 20 في الدقيقة للمجموعات)
+TELEGRAM_MESSAGES_PER_MINUTE = 20
+TELEGRAM_MAX_RETRIES = 5
+ASSET_UNIVERSE_FILE = "config/asset_universe.json" # قائمة JSON اختيارية بأصول إضافية (نفس حقول ASSETS_TO_MONITOR)
 
 ASSETS_TO_MONITOR = [
     {"COMMON_NAME": "EUR/USD", "IQOPTION_SYMBOL": "EURUSD", "TWELVEDATA_SYMBOL": "EUR/USD", "QUOTEX_SYMBOL": "EURUSD"},
     {"COMMON_NAME": "GBP/USD", "IQOPTION_SYMBOL": "GBPUSD", "TWELVEDATA_SYMBOL": "GBP/USD", "QUOTEX_SYMBOL": "GBPUSD"},
     {"COMMON_NAME": "USD/JPY", "IQOPTION_SYMBOL": "USDJPY", "TWELVEDATA_SYMBOL": "USD/JPY", "QUOTEX_SYMBOL": "USDJPY"},
 ]
+if ASSET_UNIVERSE_FILE and os.path.exists(ASSET_UNIVERSE_FILE):
+    with open(ASSET_UNIVERSE_FILE, encoding="utf-8") as universe_file:
+        _known_assets = {a["COMMON_NAME"] for a in ASSETS_TO_MONITOR}
+        ASSETS_TO_MONITOR = ASSETS_TO_MONITOR + [a for a in json.load(universe_file) if a["COMMON_NAME"] not in _known_assets]
+    print(f"Main: Loaded asset universe ({len(ASSETS_TO_MONITOR)} assets).")
+
+fetch_data_from_source = timed_fetch(fetch_data_from_source) # زمن كل جلب لكل (مصدر، إطار) في /metrics
+candle_store = CandleStore(CANDLE_STORE_DIR) if CandleStore else None
+# مسارات الخيوط: "io" للشبكة والقرص، "analysis" بخيط واحد لأن IndicatorEngine يحتفظ بحالة، "browser" بخيط واحد لـ Selenium
+execution = ExecutionLayer({"io": FETCH_CONCURRENCY, "analysis": 1, "browser": 1}, PROCESS_POOL_WORKERS) if ExecutionLayer else None
+loop_lag_monitor = LoopLagMonitor() if ExecutionLayer else None
+indicator_engine = IndicatorEngine(rule_evaluator=rule_evaluator) if (IndicatorEngine and USE_INCREMENTAL_INDICATORS) else None
+request_scheduler = RequestScheduler(API_CREDITS_PER_MINUTE, API_CREDITS_PER_DAY) if RequestScheduler else None
+async_fetcher = AsyncCandleFetcher(
+    fetch_data_from_source, candle_store, max_concurrency=FETCH_CONCURRENCY,
+    max_symbols_per_batch=API_CREDITS_PER_MINUTE, scheduler=request_scheduler,
+    run_blocking=execution.thread_runner("io", FETCH_TIMEOUT_S) if execution else None
+) if AsyncCandleFetcher else None
+frame_cache = TTLCache("frames", CACHE_MAX_ENTRIES, FRAME_CACHE_TTL_S) if TTLCache else None
+signal_cache = TTLCache("signals", CACHE_MAX_ENTRIES, SIGNAL_CACHE_TTL_S) if TTLCache else None
+close_scheduler = CandleCloseScheduler(ANALYSIS_FRAMES, CANDLE_CLOSE_GRACE_S) if CandleCloseScheduler else None
+last_frame_directions = {} # (COMMON_NAME, frame) -> "call"/"put"/None عند آخر إغلاق لذلك الإطار
+shard_coordinator = None
+telegram_outbox = None # يُنشأ في post_init مع application.bot
+quotex_warmup_task = None
+startup_milestones = {} # اسم المرحلة -> ثوانٍ منذ STARTUP_STARTED_AT
+
+
+def mark_startup(milestone: str) -> None:
+    # أول مرة فقط لكل مرحلة (بعد إعادة التشغيل: كم ثانية حتى أول دورة، أول إشارة، جاهزية Quotex)
+    if milestone not in startup_milestones:
+        startup_milestones[milestone] = time.time() - STARTUP_STARTED_AT
+        print(f"Startup: {milestone} after {startup_milestones[milestone]:.2f}s")
+
+
+def format_startup() -> str:
+    return ", ".join(f"{name} {seconds:.1f}s" for name, seconds in startup_milestones.items()) or "starting"
+
+
+if loop_lag_monitor is not None:
+    REGISTRY.gauge("signalbot_event_loop_lag_p95_seconds", "Event-loop lag p95.", lambda: loop_lag_monitor.stats().get("p95_s"))
+if request_scheduler is not None:
+    REGISTRY.gauge("signalbot_api_credits_left_today", "API credits left today.", request_scheduler.credits_left_today)
+if close_scheduler is not None:
+    REGISTRY.gauge("signalbot_close_to_signal_lag_seconds", "Last close-to-signal lag.", lambda: close_scheduler.stats().get("last_s"))
 
 # ... (بقية الكود: تهيئة بوت تيليجرام، دوال مساعدة، معالجات الأوامر، background_analysis_loop, post_init, main) ...
 
@@ -83,9 +306,23 @@ async def status_command(update, context: ContextTypes.DEFAULT_TYPE) -> None: #
     مصدر البيانات النشط: {ACTIVE_DATA_SOURCE}
     الأصول المراقبة: {[a['COMMON_NAME'] for a in ASSETS_TO_MONITOR]}
     الأطر الزمنية للتحليل: {ANALYSIS_FRAMES}
+    رصيد الطلبات: {request_scheduler.format_stats() if request_scheduler else "غير مفعل"}
+    تقييم الشروط: {rule_evaluator.format_stats()}
+    الذاكرة المؤقتة: {f"{frame_cache.format_stats()} | {signal_cache.format_stats()}" if frame_cache else "غير مفعلة"}
+    الجدولة: {close_scheduler.format_stats() if close_scheduler else "كل 60 ثانية"}
+    بدء التشغيل: {format_startup()}
+    التنفيذ: {f"{execution.format_stats()} | {loop_lag_monitor.format_stats()}" if execution else "asyncio.to_thread"}
+    التوزيع: {shard_coordinator.format_stats() if shard_coordinator else "عملية واحدة"}
+    جلسات Quotex: {quotex_pool.format_stats() if quotex_pool else ("جلسة واحدة" if quotex_driver_instance else "غير متصل")}
+    الأوامر: {order_queue.format_stats() if order_queue else "تنفيذ مباشر"}
+    رسائل تيليجرام: {telegram_outbox.format_stats() if telegram_outbox else "إرسال مباشر"}
     """
     await update.message.reply_text(status_message, parse_mode="Markdown")
 
+async def metrics_command(update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    # بدون Markdown: أسماء المقاييس فيها "_"؛ حد رسالة تيليجرام 4096 حرفًا
+    await update.message.reply_text(f"📈 زمن المراحل:\n{REGISTRY.format_summary()}"[:4000])
+
 async def check_asset_command(update, context: ContextTypes.DEFAULT_TYPE) -> None:
     try:
         if not context.args:
@@ -102,16 +339,12 @@ async def check_asset_command(update, context: ContextTypes.DEFAULT_TYPE) -> Non
 
         directions = []
         all_ok = True
+        frames_data = await fetch_frames_cached([asset_config_found], priority=PRIORITY_INTERACTIVE) # fetch_frames_cached معرفة في الأسفل
         for frame in ANALYSIS_FRAMES:
-            df = fetch_data_from_source(
-                source=ACTIVE_DATA_SOURCE,
-                symbol=asset_to_check_common,
-                interval_or_timeframe=frame,
-                count=CANDLE_COUNT_TO_FETCH,
-                asset_config=asset_config_found
-            )
+            df = frames_data.get((asset_config_found["COMMON_NAME"], frame))
             if df is None or df.empty: all_ok = False; break
-            signal = analyze_single_frame(df, asset_to_check_common, frame) # analyze_single_frame معرفة في الأسفل
+            signal = await run_blocking(analyze_single_frame, df, asset_to_check_common, frame, # analyze_single_frame معرفة في الأسفل
+                                        lane="analysis", timeout=SIGNAL_COMPUTE_TIMEOUT_S)
             if signal: directions.append(signal)
             else: all_ok = False; break
         
@@ -127,37 +360,243 @@ async def check_asset_command(update, context: ContextTypes.DEFAULT_TYPE) -> Non
 
 
 # --- دوال مساعدة (من الرد السابق) ---
+async def run_blocking(fn, *args, lane: str = "io", timeout: float | None = None, **kwargs):
+    # كل عمل متزامن (شبكة، قرص، pandas، Selenium) يمر من هنا بدل التنفيذ داخل coroutine على حلقة تيليجرام
+    if execution is None:
+        return await asyncio.wait_for(asyncio.to_thread(fn, *args, **kwargs), timeout)
+    return await execution.run_thread(fn, *args, lane=lane, timeout=timeout, **kwargs)
+
+async def run_compute(fn, *args, timeout: float | None = SIGNAL_COMPUTE_TIMEOUT_S):
+    # حساب متجه ثقيل بلا حالة (fn على مستوى وحدة ومعاملات قابلة لـ pickle) في مجمع العمليات
+    if execution is None:
+        return await asyncio.wait_for(asyncio.to_thread(fn, *args), timeout)
+    return await execution.run_process(fn, *args, timeout=timeout, fallback_lane="analysis")
+
+def fetch_candles(asset_info: dict, frame_tf: str, count: int = CANDLE_COUNT_TO_FETCH) -> pd.DataFrame | None:
+    common_name = asset_info["COMMON_NAME"]
+    if candle_store is None:
+        return fetch_data_from_source(
+            source=ACTIVE_DATA_SOURCE,
+            symbol=common_name,
+            interval_or_timeframe=frame_tf,
+            count=count,
+            asset_config=asset_info
+        )
+    # المخزن يطلب من المصدر الشموع الجديدة فقط ثم يعيد آخر CANDLE_COUNT_TO_FETCH شمعة من القرص
+    return candle_store.fetch(
+        fetch_data_from_source,
+        source=ACTIVE_DATA_SOURCE,
+        symbol=common_name,
+        interval=frame_tf,
+        count=count,
+        asset_config=asset_info
+    )
+
+async def fetch_remote_frames(assets: list, frames: list, count: int, priority: int = PRIORITY_BACKGROUND) -> dict:
+    if async_fetcher is not None:
+        return await async_fetcher.fetch_many(ACTIVE_DATA_SOURCE, assets, frames, count, priority=priority)
+    return {
+        (asset_info["COMMON_NAME"], frame_tf): await run_blocking(fetch_candles, asset_info, frame_tf, count, timeout=FETCH_TIMEOUT_S)
+        for asset_info in assets for frame_tf in frames
+    }
+
+async def fetch_frames_for_assets(assets: list, priority: int = PRIORITY_BACKGROUND, frames: list | None = None,
+                                  closed_at: float | None = None) -> dict:
+    # كل أزواج (الأصل، الإطار) تُجلب معًا؛ المفتاح في النتيجة (COMMON_NAME, frame)
+    # closed_at: كل إطار يُقص إلى الشموع المغلقة عند هذا الوقت (الشمعة الجارية وما اشتُق منها لا تُحلل)
+    frames = ANALYSIS_FRAMES if frames is None else frames
+    if not (RESAMPLE_HIGHER_FRAMES and plan_frames):
+        frames_data = await fetch_remote_frames(assets, frames, CANDLE_COUNT_TO_FETCH, priority)
+        return frames_data if closed_at is None else {
+            pair: closed_candles(df, pair[1], closed_at) for pair, df in frames_data.items()}
+
+    base_frame, derived_frames, remote_frames = plan_frames(frames)
+    base_count = base_count_for(frames, CANDLE_COUNT_TO_FETCH)
+    base_data, remote_data = await asyncio.gather(
+        fetch_remote_frames(assets, [base_frame], base_count, priority),
+        fetch_remote_frames(assets, remote_frames, CANDLE_COUNT_TO_FETCH, priority),
+    )
+    frames_data = remote_data if closed_at is None else {
+        pair: closed_candles(df, pair[1], closed_at) for pair, df in remote_data.items()}
+    for asset_info in assets:
+        common_name = asset_info["COMMON_NAME"]
+        base_df = base_data.get((common_name, base_frame))
+        derived = await run_blocking(
+            derive_frames, base_df, base_frame, derived_frames, CANDLE_COUNT_TO_FETCH,
+            candle_store, ACTIVE_DATA_SOURCE, common_name, closed_at
+        )
+        base_df = base_df.tail(CANDLE_COUNT_TO_FETCH) if base_df is not None else None
+        frames_data[(common_name, base_frame)] = base_df if closed_at is None else closed_candles(base_df, base_frame, closed_at)
+        for frame_tf, df in derived.items():
+            frames_data[(common_name, frame_tf)] = df
+    return frames_data
+
+async def fetch_frames_cached(assets: list, priority: int = PRIORITY_BACKGROUND, frames: list | None = None) -> dict:
+    # نفس fetch_frames_for_assets لكن عبر frame_cache: المفتاح (source, symbol, frame, بداية الشمعة الحالية)
+    # والأصل الذي يجلبه طلب آخر الآن (الدورة أو /check) ننتظر نتيجته بدل جلبه مرة ثانية
+    # الأطر مقصوصة إلى الشموع المغلقة عند بداية الطلب، فالدورة و /check يحللان الشمعة نفسها
+    frames = ANALYSIS_FRAMES if frames is None else frames
+    now = time.time()
+    if frame_cache is None:
+        return await fetch_frames_for_assets(assets, priority, frames, closed_at=now)
+    keys = {(a["COMMON_NAME"], f): (ACTIVE_DATA_SOURCE, a["COMMON_NAME"], f, candle_open_time(now, f))
+            for a in assets for f in frames}
+    # لكل زوج: من الذاكرة، أو انتظار جلب جارٍ له (دورة تجلب بعض الأطر و /check لنفس الأصل)، أو جلبه هنا؛
+    # نحجز المفاتيح الناقصة فقط، فلا نستولي على حجز طلب آخر
+    frames_data, waiting, missing = {}, {}, {}
+    for pair, key in keys.items():
+        value = frame_cache.lookup(key)
+        if value is not MISSING:
+            frames_data[pair] = value
+            continue
+        future = frame_cache.pending(key)
+        if future is not None:
+            waiting[pair] = future
+            continue
+        frame_cache.claim(key)
+        missing.setdefault(pair[0], []).append(pair[1])
+
+    groups = {} # الأطر الناقصة -> الأصول التي تنقصها نفس الأطر (جلب واحد لكل مجموعة)
+    for asset_info in assets:
+        if asset_info["COMMON_NAME"] in missing:
+            groups.setdefault(tuple(missing[asset_info["COMMON_NAME"]]), []).append(asset_info)
+
+    async def fetch_group(group_frames: tuple, group_assets: list) -> None:
+        claimed = [(a["COMMON_NAME"], f) for a in group_assets for f in group_frames]
+        try:
+            fetched = await fetch_frames_for_assets(group_assets, priority, list(group_frames), closed_at=now)
+        except BaseException as e:
+            for pair in claimed: frame_cache.fail(keys[pair], e)
+            raise
+        for pair in claimed:
+            # فشل الجلب (None) لا يُخزن حتى تعيد الدورة التالية المحاولة
+            frames_data[pair] = fetched.get(pair)
+            frame_cache.resolve(keys[pair], frames_data[pair], store=frames_data[pair] is not None)
+
+    await asyncio.gather(*(fetch_group(group_frames, group_assets) for group_frames, group_assets in groups.items()))
+    for pair, future in waiting.items():
+        frames_data[pair] = await asyncio.shield(future)
+    return frames_data
+
+def _signal_cache_key(data_df: pd.DataFrame, asset_common_name: str, timeframe: str) -> tuple:
+    return (ACTIVE_DATA_SOURCE, asset_common_name, timeframe, frame_fingerprint(data_df))
+
 def analyze_single_frame(data_df: pd.DataFrame, asset_common_name: str, timeframe: str) -> str | None:
     if data_df is None or data_df.empty: return None
+    if signal_cache is not None:
+        return signal_cache.get_or_compute_sync(
+            _signal_cache_key(data_df, asset_common_name, timeframe),
+            lambda: _analyze_single_frame_uncached(data_df, asset_common_name, timeframe)
+        )
+    return _analyze_single_frame_uncached(data_df, asset_common_name, timeframe)
+
+def _analyze_single_frame_uncached(data_df: pd.DataFrame, asset_common_name: str, timeframe: str) -> str | None:
+    if indicator_engine is not None:
+        # المسار الفعلي في الإعداد الافتراضي (generate_signals لا يُستدعى هنا)، فيُقاس تحت اسمه
+        with INDICATOR_SECONDS.time(function="IndicatorEngine.signal"):
+            return indicator_engine.signal(asset_common_name, timeframe, data_df)
     return get_single_signal_from_engine(data_df, timeframe=f"{asset_common_name} {timeframe}")
 
-def generate_multiframe_signals() -> list:
+def analyze_frames(assets: list, frames_data: dict, frames: list) -> dict:
+    # المسار الفردي (IndicatorEngine/pandas) لكل أزواج (الأصل، الإطار) لهذه الأصول فقط (حصة العامل)؛ يُشغل في مسار "analysis"
+    return {
+        (asset_info["COMMON_NAME"], frame_tf): analyze_single_frame(
+            frames_data.get((asset_info["COMMON_NAME"], frame_tf)), asset_info["COMMON_NAME"], frame_tf)
+        for asset_info in assets for frame_tf in frames
+    }
+
+def decide_multiframe_signal(asset_info: dict, frames_data: dict) -> dict | None:
+    common_name = asset_info["COMMON_NAME"]
+    directions_from_frames = []
+    for frame_tf in ANALYSIS_FRAMES:
+        df_candles = frames_data.get((common_name, frame_tf))
+        if df_candles is None or df_candles.empty: return None
+        signal_on_frame = analyze_single_frame(df_candles, common_name, frame_tf)
+        if not signal_on_frame: return None
+        directions_from_frames.append(signal_on_frame)
+
+    first_signal = directions_from_frames[0]
+    if all(s == first_signal for s in directions_from_frames):
+        return signal_payload(asset_info, first_signal)
+    return None
+
+def signal_payload(asset_info: dict, direction: str) -> dict:
+    common_name = asset_info["COMMON_NAME"]
+    return {
+        "asset_common_name": common_name,
+        "asset_quotex_symbol": asset_info.get("QUOTEX_SYMBOL", common_name.replace("/", "")),
+        "direction": direction,
+        "generated_at": time.time() # أساس قياس زمن الإشارة حتى النقر
+    }
+
+def decide_multiframe_signals_batch(assets: list, frames_data: dict, directions=None) -> list:
+    # directions: اتجاهات (أصل، إطار) محسوبة مسبقًا (مثلًا من signal_cache)؛ وإلا تُحسب كلها دفعة واحدة
+    if directions is None:
+        batch = stack_frames(frames_data, [a["COMMON_NAME"] for a in assets], ANALYSIS_FRAMES, CANDLE_COUNT_TO_FETCH)
+        directions = batch_frame_directions(batch)
+    consensus = multiframe_consensus(directions)
+    signals = []
+    for asset_info, direction in zip(assets, consensus):
+        if direction == 0: continue
+        signals.append(signal_payload(asset_info, "call" if direction > 0 else "put"))
+    return signals
+
+async def batch_directions_cached(assets: list, frames_data: dict, frames: list | None = None):
+    # نحسب دفعيًا فقط الأصول التي تغير أحد أطرها منذ آخر دورة؛ الباقي من signal_cache
+    frames = ANALYSIS_FRAMES if frames is None else frames
+    direction_codes = {"call": 1, "put": -1, None: 0}
+    keys = [[_signal_cache_key(frames_data.get((a["COMMON_NAME"], f)), a["COMMON_NAME"], f) for f in frames]
+            for a in assets]
+    cached = [[signal_cache.lookup(key) for key in row] for row in keys]
+    stale = [i for i, row in enumerate(cached) if any(value is MISSING for value in row)]
+    if stale:
+        batch = stack_frames(frames_data, [assets[i]["COMMON_NAME"] for i in stale], frames, CANDLE_COUNT_TO_FETCH)
+        with INDICATOR_SECONDS.time(function="batch_frame_directions"):
+            computed = await run_compute(batch_frame_directions, batch)
+        for row_index, i in enumerate(stale):
+            cached[i] = [{1: "call", -1: "put"}.get(int(code)) for code in computed[row_index]]
+            for key, direction in zip(keys[i], cached[i]):
+                signal_cache.put(key, direction)
+    return np.array([[direction_codes[d] for d in row] for row in cached], dtype=np.int8).reshape(len(assets), len(frames))
+
+@DECISION_SECONDS.timed(stage="cycle")
+async def generate_multiframe_signals(closed_frames: list | None = None, assets: list | None = None) -> list:
+    # closed_frames: الأطر التي أُغلقت لها شمعة منذ الدورة السابقة؛ تُجلب وتُحلل أزواجها فقط، وباقي الأطر
+    # تحتفظ بالاتجاه المحسوب عند آخر إغلاق لها (last_frame_directions). None = كل الأطر
+    # الأطر التي فشل جلبها سابقًا (لا اتجاه محفوظ) تُعاد محاولتها في كل دورة حتى تنجح
+    # assets: حصة هذا العامل في وضع التوزيع (sharding.py)؛ None = ASSETS_TO_MONITOR
+    assets = ASSETS_TO_MONITOR if assets is None else assets
+    frames = [f for f in ANALYSIS_FRAMES if closed_frames is None or f in closed_frames or
+              any((a["COMMON_NAME"], f) not in last_frame_directions for a in assets)]
+    with DECISION_SECONDS.time(stage="fetch"):
+        frames_data = await fetch_frames_cached(assets, frames=frames)
+    with DECISION_SECONDS.time(stage="directions"):
+        if stack_frames is not None and USE_BATCH_SIGNAL_ENGINE:
+            if signal_cache is not None:
+                codes = await batch_directions_cached(assets, frames_data, frames)
+            else:
+                batch = stack_frames(frames_data, [a["COMMON_NAME"] for a in assets], frames, CANDLE_COUNT_TO_FETCH)
+                with INDICATOR_SECONDS.time(function="batch_frame_directions"):
+                    codes = await run_compute(batch_frame_directions, batch)
+            for asset_info, row in zip(assets, codes):
+                for frame_tf, code in zip(frames, row):
+                    last_frame_directions[(asset_info["COMMON_NAME"], frame_tf)] = {1: "call", -1: "put"}.get(int(code))
+        else:
+            last_frame_directions.update(await run_blocking(analyze_frames, assets, frames_data, frames,
+                                                            lane="analysis", timeout=SIGNAL_COMPUTE_TIMEOUT_S))
+    for pair in [(a["COMMON_NAME"], f) for a in assets for f in frames]:
+        if frames_data.get(pair) is None or frames_data[pair].empty:
+            last_frame_directions.pop(pair, None)
+
+    if stack_frames is not None and USE_BATCH_SIGNAL_ENGINE:
+        codes = np.array([[{"call": 1, "put": -1}.get(last_frame_directions.get((a["COMMON_NAME"], f)), 0)
+                           for f in ANALYSIS_FRAMES] for a in assets], dtype=np.int8)
+        return decide_multiframe_signals_batch(assets, frames_data, codes.reshape(len(assets), len(ANALYSIS_FRAMES)))
     final_signals_for_trading = []
-    for asset_info in ASSETS_TO_MONITOR:
-        common_name = asset_info["COMMON_NAME"]
-        directions_from_frames = []
-        all_frames_ok = True
-        for frame_tf in ANALYSIS_FRAMES:
-            df_candles = fetch_data_from_source(
-                source=ACTIVE_DATA_SOURCE,
-                symbol=common_name,
-                interval_or_timeframe=frame_tf,
-                count=CANDLE_COUNT_TO_FETCH,
-                asset_config=asset_info
-            )
-            if df_candles is None or df_candles.empty: all_frames_ok = False; break 
-            signal_on_frame = analyze_single_frame(df_candles, common_name, frame_tf)
-            if signal_on_frame: directions_from_frames.append(signal_on_frame)
-            else: all_frames_ok = False; break
-        
-        if all_frames_ok and len(directions_from_frames) == len(ANALYSIS_FRAMES):
-            first_signal = directions_from_frames[0]
-            if all(s == first_signal for s in directions_from_frames):
-                final_signals_for_trading.append({
-                    "asset_common_name": common_name,
-                    "asset_quotex_symbol": asset_info.get("QUOTEX_SYMBOL", common_name.replace("/", "")), 
-                    "direction": first_signal
-                })
+    for asset_info in assets:
+        directions = [last_frame_directions.get((asset_info["COMMON_NAME"], f)) for f in ANALYSIS_FRAMES]
+        if directions[0] and all(d == directions[0] for d in directions):
+            final_signals_for_trading.append(signal_payload(asset_info, directions[0]))
     return final_signals_for_trading
 
 def format_telegram_message(asset_name: str, direction: str, frames_list: list) -> str:
@@ -168,79 +607,301 @@ def format_telegram_message(asset_name: str, direction: str, frames_list: list)
 
 
 # --- دالة التشغيل الرئيسية للبوت (التي تعمل في الخلفية) ---
-async def background_analysis_loop(context: ContextTypes.DEFAULT_TYPE):
-    global quotex_driver_instance, is_quotex_logged_in 
+def order_expired(asset: str, direction: str, signal_at: float | None, deadline_at: float | None, waited_for: str) -> bool:
+    # بعد كل انتظار (التسخين، تسجيل الدخول): أمر فات موعده لا يُنفذ متأخرًا
+    if deadline_at is None or time.time() < deadline_at:
+        return False
+    since_signal = f" ({time.time() - signal_at:.1f}s after signal)" if signal_at else ""
+    print(f"Quotex: {asset} {direction.upper()} past its deadline after waiting for {waited_for}{since_signal}. Trade skipped.")
+    return True
+
+async def execute_order(asset: str, direction: str, signal_at: float | None = None, deadline_at: float | None = None) -> bool | None:
+    # تنفيذ صفقة واحدة (من عمّال order_queue، أو مباشرة بدونه): جلسة من المجمع، أو الجلسة الواحدة المتسلسلة
+    # None = فات deadline_at قبل النقر (يُعد الأمر منتهيًا لا فاشلًا)
+    global is_quotex_logged_in
+    if quotex_warmup_task is not None and not quotex_warmup_task.done():
+        # أمر قبل اكتمال التسخين: مع المجمع يقتصر على استيراد المنفذ وبدء الجلسات، وبدونه يشمل تسجيل الدخول
+        await asyncio.shield(quotex_warmup_task)
+        if order_expired(asset, direction, signal_at, deadline_at, "the Quotex warm-up"):
+            return None
+    if quotex_pool is not None:
+        return await quotex_pool.execute(asset, direction, signal_at, deadline_at)
+    if not quotex_driver_instance:
+        return False
+    # Selenium في مسار "browser" بخيط واحد ومهلة: تسجيل دخول عالق لا يوقف /status أو بقية المعالجات
+    if not is_quotex_logged_in:
+        try:
+            is_quotex_logged_in = await run_blocking(login_quotex, quotex_driver_instance, QUOTEX_EMAIL, QUOTEX_PASSWORD,
+                                                     lane="browser", timeout=QUOTEX_LOGIN_TIMEOUT_S)
+        except asyncio.TimeoutError:
+            print(f"Quotex login timed out after {QUOTEX_LOGIN_TIMEOUT_S}s.")
+    if not is_quotex_logged_in:
+        return False
+    if order_expired(asset, direction, signal_at, deadline_at, "the Quotex login"):
+        return None
+    try:
+        trade_executed = await run_blocking(
+            place_trade, quotex_driver_instance,
+            asset=asset, direction=direction,
+            amount=TRADE_AMOUNT, duration=TRADE_DURATION,
+            lane="browser", timeout=QUOTEX_TRADE_TIMEOUT_S
+        )
+    except asyncio.TimeoutError:
+        print(f"Quotex trade for {asset} timed out after {QUOTEX_TRADE_TIMEOUT_S}s.")
+        trade_executed = False
+    if not trade_executed: is_quotex_logged_in = False
+    return trade_executed
+
+async def dispatch_signals(context: ContextTypes.DEFAULT_TYPE, generated_signals: list) -> None:
+    print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] 🔥 {len(generated_signals)} Signals Found! Processing...")
+    if telegram_outbox is not None:
+        # كل رسائل الدورة إلى الطابور فورًا (تُدمج وتُرسل في الخلفية)، ثم الصفقات دون انتظار تيليجرام
+        telegram_outbox.enqueue_many([format_telegram_message(s["asset_common_name"], s["direction"], ANALYSIS_FRAMES)
+                                      for s in generated_signals])
+    if order_queue is not None:
+        # الأوامر إلى طابور التنفيذ فورًا بوقت إشارتها؛ عمّاله ينفذونها في الخلفية ويسقطون ما فاتت نافذة دخوله
+        for s in generated_signals:
+            order_queue.submit(s["asset_quotex_symbol"], s["direction"], s.get("generated_at"))
+    for idx, signal_data in enumerate(generated_signals):
+        asset_name_common = signal_data["asset_common_name"]
+        asset_name_quotex = signal_data["asset_quotex_symbol"]
+        trade_direction = signal_data["direction"]
+        
+        SIGNALS_TOTAL.inc(direction=trade_direction)
+        tg_message = format_telegram_message(asset_name_common, trade_direction, ANALYSIS_FRAMES)
+        if telegram_outbox is None and context.bot and TELEGRAM_CHAT_ID and TELEGRAM_CHAT_ID != "YOUR_TELEGRAM_CHAT_ID_PLACEHOLDER":
+            try:
+                with TELEGRAM_SECONDS.time():
+                    await context.bot.send_message(chat_id=TELEGRAM_CHAT_ID, text=tg_message, parse_mode="Markdown")
+            except Exception as e_tg_send:
+                 TELEGRAM_ERRORS.inc()
+                 print(f"Telegram send error in background loop: {e_tg_send}")
+        mark_startup("first_signal")
+        
+        if order_queue is None:
+            await execute_order(asset_name_quotex, trade_direction, signal_data.get("generated_at"))
+        
+        if telegram_outbox is None and idx < len(generated_signals) - 1: await asyncio.sleep(3)
 
+async def background_analysis_loop(context: ContextTypes.DEFAULT_TYPE):
     iteration_num = 0
     while True:
         iteration_num += 1
+        # الاستيقاظ بعد إغلاق الشمعة التالية (+ مهلة المزود) بدل كل 60 ثانية، ومعرفة أي الأطر أُغلقت
+        close_time, closed_frames = await close_scheduler.wait() if close_scheduler else (None, None)
         start_time_loop = time.time()
         
         try:
-            generated_signals = generate_multiframe_signals() 
+            generated_signals = await generate_multiframe_signals(closed_frames) 
+            mark_startup("first_cycle")
+            if close_scheduler is not None and close_time is not None:
+                lag = close_scheduler.record_lag(close_time)
+                print(f"Scheduler: {closed_frames} closed at {datetime.utcfromtimestamp(close_time).strftime('%H:%M')} UTC, "
+                      f"close-to-signal lag {lag:.2f}s, {len(generated_signals)} signals")
             
             if generated_signals:
-                print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] 🔥 {len(generated_signals)} Signals Found! Processing...")
-                for idx, signal_data in enumerate(generated_signals):
-                    asset_name_common = signal_data["asset_common_name"]
-                    asset_name_quotex = signal_data["asset_quotex_symbol"]
-                    trade_direction = signal_data["direction"]
-                    
-                    tg_message = format_telegram_message(asset_name_common, trade_direction, ANALYSIS_FRAMES)
-                    if context.bot and TELEGRAM_CHAT_ID and TELEGRAM_CHAT_ID != "YOUR_TELEGRAM_CHAT_ID_PLACEHOLDER":
-                        try:
-                            await context.bot.send_message(chat_id=TELEGRAM_CHAT_ID, text=tg_message, parse_mode="Markdown")
-                        except Exception as e_tg_send:
-                             print(f"Telegram send error in background loop: {e_tg_send}")
-                    
-                    if quotex_driver_instance:
-                        if not is_quotex_logged_in:
-                            is_quotex_logged_in = login_quotex(quotex_driver_instance, QUOTEX_EMAIL, QUOTEX_PASSWORD)
-                        
-                        if is_quotex_logged_in:
-                            trade_executed = place_trade(
-                                quotex_driver_instance,
-                                asset=asset_name_quotex, direction=trade_direction,
-                                amount=TRADE_AMOUNT, duration=TRADE_DURATION
-                            )
-                            if not trade_executed: is_quotex_logged_in = False 
-                        # else: # لا حاجة لطباعة SIMULATED هنا إذا لم يتم تسجيل الدخول
-                    # else: # لا حاجة لطباعة SIMULATED هنا إذا لم يكن الدرايفر متاحًا
-                    
-                    if idx < len(generated_signals) - 1: await asyncio.sleep(3)
+                await dispatch_signals(context, generated_signals)
             
         except Exception as e_main:
             print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] [CRITICAL BACKGROUND LOOP ERROR] {type(e_main).__name__}: {e_main}")
             import traceback
             print(traceback.format_exc())
 
-        loop_exec_time = time.time() - start_time_loop
-        desired_cycle_interval = 60 
-        sleep_duration = max(10, desired_cycle_interval - loop_exec_time)
-        await asyncio.sleep(sleep_duration)
+        if close_scheduler is None:
+            loop_exec_time = time.time() - start_time_loop
+            desired_cycle_interval = 60 
+            sleep_duration = max(10, desired_cycle_interval - loop_exec_time)
+            await asyncio.sleep(sleep_duration)
+
+def decide_from_store(assets: list, close_time: float | None = None) -> list:
+    # قراءة الأطر من المخزن وتحليلها (متزامن، يُشغل في مسار "analysis")
+    generated_signals = []
+    for asset_info in assets:
+        common_name = asset_info["COMMON_NAME"]
+        # close_time: الدلو الجاري (شمعة المزود الناقصة أو دلو مشتق لم يُغلق بعد) لا يُحلل
+        frames_data = {
+            (common_name, frame_tf): closed_candles(
+                candle_store.read(ACTIVE_DATA_SOURCE, common_name, frame_tf, count=CANDLE_COUNT_TO_FETCH),
+                frame_tf, close_time)
+            for frame_tf in ANALYSIS_FRAMES
+        }
+        signal_data = decide_multiframe_signal(asset_info, frames_data)
+        if signal_data: generated_signals.append(signal_data)
+    return generated_signals
+
+async def stream_analysis_loop(context: ContextTypes.DEFAULT_TYPE):
+    # تعبئة المخزن بالتاريخ مرة واحدة عبر الجلب العادي، ثم تُبنى الشموع الجديدة من التيكات مباشرة
+    await fetch_frames_for_assets(ASSETS_TO_MONITOR, closed_at=time.time())
+    assets_by_name = {a["COMMON_NAME"]: a for a in ASSETS_TO_MONITOR}
+    symbol_map = {a.get("TWELVEDATA_SYMBOL", a["COMMON_NAME"]): a["COMMON_NAME"] for a in ASSETS_TO_MONITOR}
+    if INGESTION_MODE == "STREAM_REPLAY":
+        stream = LineJsonPriceStream(list(symbol_map), STREAM_REPLAY_HOST, STREAM_REPLAY_PORT)
+    else:
+        stream = TwelveDataPriceStream(list(symbol_map))
+    ingestor = StreamIngestor(stream, ANALYSIS_FRAMES, candle_store=candle_store,
+                              source=ACTIVE_DATA_SOURCE, symbol_map=symbol_map,
+                              use_wall_clock=INGESTION_MODE != "STREAM_REPLAY" or STREAM_REPLAY_WALL_CLOCK)
+    ingestor.start()
+
+    while True:
+        batch = await ingestor.next_batch()
+        try:
+            closed_assets = [assets_by_name[name] for name in sorted({e["symbol"] for e in batch}) if name in assets_by_name]
+            if any(event["candle"]["partial"] for event in batch):
+                # أول إغلاق بعد الاشتراك: الشمعة المبنية من التيكات ناقصة، نأخذ النسخة الكاملة من المزود
+                await fetch_frames_for_assets(closed_assets, closed_at=time.time())
+
+            close_time = max(event["close_time"] for event in batch)
+            generated_signals = await run_blocking(decide_from_store, closed_assets, close_time,
+                                                   lane="analysis", timeout=SIGNAL_COMPUTE_TIMEOUT_S)
+
+            print(f"Stream: {len(batch)} candle closes analysed, close-to-signal lag {time.time() - close_time:.3f}s")
+            if generated_signals:
+                await dispatch_signals(context, generated_signals)
+        except Exception as e_stream:
+            print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] [STREAM LOOP ERROR] {type(e_stream).__name__}: {e_stream}")
 
 quotex_driver_instance = None
 is_quotex_logged_in = False
-
-async def post_init(application: Application) -> None:
-    global quotex_driver_instance, is_quotex_logged_in
-    # print("Bot post_init: Setting up Quotex browser and logging in...")
+quotex_pool = None # QuotexSessionPool عند QUOTEX_POOL_SIZE > 0
+order_queue = None # OrderQueue يُنشأ في post_init
+
+def apply_shard_assignment(assets: list, n_workers: int) -> None:
+    # كل عامل يستهلك حصته فقط من رصيد مفتاح TwelveData المشترك، وينسى اتجاهات الأصول التي انتقلت لعامل آخر
+    # (إذا عادت إليه لاحقًا تُحسب من جديد بدل اتجاه قديم)
+    if request_scheduler is not None:
+        per_minute = max(1, API_CREDITS_PER_MINUTE // n_workers)
+        request_scheduler.set_budget(per_minute, max(1, API_CREDITS_PER_DAY // n_workers))
+        if async_fetcher is not None:
+            async_fetcher.max_symbols_per_batch = per_minute
+    names = {a["COMMON_NAME"] for a in assets}
+    for pair in [pair for pair in last_frame_directions if pair[0] not in names]:
+        del last_frame_directions[pair]
+
+async def run_shard_worker(address: tuple) -> None:
+    # عامل بلا تيليجرام ولا Quotex: يمسح حصته عند كل إغلاق ويرسل الإشارات للمنسّق
+    if execution is not None:
+        loop_lag_monitor.start()
+        execution.warm_up()
+
+    async def wait_next_close():
+        if close_scheduler is not None:
+            return await close_scheduler.wait()
+        await asyncio.sleep(60)
+        return None, None
+
+    worker = ShardWorker(address, worker_authkey(SHARD_AUTHKEY), wait_next_close,
+                         lambda assets, closed_frames: generate_multiframe_signals(closed_frames, assets),
+                         on_assign=apply_shard_assignment, heartbeat_s=SHARD_HEARTBEAT_S)
+    try:
+        await worker.run()
+    finally:
+        if async_fetcher is not None:
+            await async_fetcher.aclose()
+        if execution is not None:
+            loop_lag_monitor.stop()
+            execution.shutdown()
+
+def start_shard_coordinator(application: Application) -> None:
+    global shard_coordinator
+    shard_coordinator = ShardCoordinator(ASSETS_TO_MONITOR, SHARD_COORDINATOR_ADDRESS, SHARD_AUTHKEY, SHARD_WORKER_TIMEOUT_S)
+    shard_coordinator.start()
+    host, port = shard_coordinator.address
+    worker_address = f"{'127.0.0.1' if host == '0.0.0.0' else host}:{port}"
+    shard_coordinator.spawn_local_workers(LOCAL_SHARD_WORKERS, [sys.executable, os.path.abspath(__file__), "--shard-worker", worker_address])
+    # المنسّق وحده يرسل إلى تيليجرام وينفذ على Quotex
+    asyncio.create_task(shard_coordinator.run(lambda signals: dispatch_signals(application, signals)))
+
+async def warm_up_quotex() -> None:
+    global quotex_driver_instance, is_quotex_logged_in, quotex_pool
     try:
-        quotex_driver_instance = setup_browser(headless=True)
+        await run_blocking(load_quotex_executor, lane="browser") # استيراد selenium خارج حلقة الأحداث
+        if QuotexSessionPool and QUOTEX_POOL_SIZE > 0:
+            # الجلسات تفتح وتسجل الدخول بالتوازي في الخلفية؛ الأوامر تنتظر أول جلسة جاهزة (حتى QUOTEX_LOGIN_TIMEOUT_S)
+            quotex_pool = QuotexSessionPool(
+                run_blocking, lambda: setup_browser(headless=True),
+                lambda driver: login_quotex(driver, QUOTEX_EMAIL, QUOTEX_PASSWORD),
+                prepare_trade, click_trade_button, check_session, close_browser,
+                pinned_assets=[a.get("QUOTEX_SYMBOL", a["COMMON_NAME"].replace("/", "")) for a in ASSETS_TO_MONITOR],
+                size=QUOTEX_POOL_SIZE, duration=TRADE_DURATION, amount=TRADE_AMOUNT,
+                login_timeout_s=QUOTEX_LOGIN_TIMEOUT_S, trade_timeout_s=QUOTEX_TRADE_TIMEOUT_S,
+                acquire_timeout_s=QUOTEX_LOGIN_TIMEOUT_S, health_interval_s=QUOTEX_HEALTH_CHECK_S,
+                on_ready=lambda session: mark_startup("quotex_ready")
+            )
+            quotex_pool.start()
+            return
+        quotex_driver_instance = await run_blocking(setup_browser, headless=True, lane="browser", timeout=QUOTEX_LOGIN_TIMEOUT_S)
         if quotex_driver_instance:
-            is_quotex_logged_in = login_quotex(quotex_driver_instance, QUOTEX_EMAIL, QUOTEX_PASSWORD) # QUOTEX_EMAIL from config
+            is_quotex_logged_in = await run_blocking(login_quotex, quotex_driver_instance, QUOTEX_EMAIL, QUOTEX_PASSWORD, # QUOTEX_EMAIL from config
+                                                     lane="browser", timeout=QUOTEX_LOGIN_TIMEOUT_S)
             # if not is_quotex_logged_in: print("Bot post_init: Quotex login failed initially.")
         # else: print("Bot post_init: Quotex browser setup failed.")
     except Exception as e_setup:
         print(f"Bot post_init: Error during Quotex initial setup/login: {e_setup}")
         if quotex_driver_instance: close_browser(quotex_driver_instance)
         quotex_driver_instance = None; is_quotex_logged_in = False
+    mark_startup("quotex_ready")
+
+async def post_init(application: Application) -> None:
+    global quotex_warmup_task, telegram_outbox, order_queue
+    mark_startup("post_init")
+    if TelegramOutbox and TELEGRAM_CHAT_ID and TELEGRAM_CHAT_ID != "YOUR_TELEGRAM_CHAT_ID_PLACEHOLDER":
+        telegram_outbox = TelegramOutbox(application.bot, TELEGRAM_CHAT_ID, TELEGRAM_MESSAGES_PER_SECOND,
+                                         TELEGRAM_MESSAGES_PER_MINUTE, max_retries=TELEGRAM_MAX_RETRIES)
+        telegram_outbox.start()
+        REGISTRY.gauge("signalbot_telegram_queue_depth", "Messages waiting in the Telegram outbox.",
+                       lambda: telegram_outbox.stats()["depth"])
+    if execution is not None:
+        loop_lag_monitor.start()
+        execution.warm_up()
+    if METRICS_PORT and METRICS_ENABLED:
+        try:
+            REGISTRY.serve(METRICS_PORT)
+            print(f"Metrics: Prometheus endpoint on http://127.0.0.1:{METRICS_PORT}/metrics")
+        except OSError as e_metrics:
+            print(f"Metrics Warning: Could not bind port {METRICS_PORT}: {e_metrics}")
+    # print("Bot post_init: Setting up Quotex browser and logging in...")
+    # FAST_START: المتصفح وتسجيل الدخول (حتى دقيقة أو أكثر) في مسار "browser" بينما يبدأ تيليجرام وأول دورة فورًا
+    quotex_warmup_task = asyncio.create_task(warm_up_quotex())
+    if not FAST_START:
+        await quotex_warmup_task
+    if OrderQueue:
+        # عامل لكل جلسة في المجمع (صفقات متوازية)، وعامل واحد للجلسة الواحدة
+        order_queue = OrderQueue(
+            lambda order: execute_order(order.asset, order.direction, order.signal_at, order.deadline_at),
+            TRADE_DURATION, ORDER_ENTRY_WINDOW_FRACTION, ORDER_QUEUE_SIZE,
+            workers=QUOTEX_POOL_SIZE if (QuotexSessionPool and QUOTEX_POOL_SIZE > 0) else 1
+        )
+        order_queue.start()
+        REGISTRY.gauge("signalbot_order_queue_depth", "Orders waiting for execution.", lambda: order_queue.stats()["depth"])
     
     # تأكد من أن application.job_queue متاح إذا كنت تستخدمه (في v20+، create_task هو الأفضل للمهام الطويلة)
-    asyncio.create_task(background_analysis_loop(application)) # تمرير application كـ context
+    if SHARDING_MODE == "COORDINATOR" and ShardCoordinator:
+        start_shard_coordinator(application)
+    elif INGESTION_MODE in ("STREAM", "STREAM_REPLAY") and StreamIngestor and candle_store is not None:
+        asyncio.create_task(stream_analysis_loop(application))
+    else:
+        asyncio.create_task(background_analysis_loop(application)) # تمرير application كـ context
     # print("Bot post_init: Background analysis loop scheduled.")
 
 
+async def post_shutdown(application: Application) -> None:
+    if telegram_outbox is not None:
+        await telegram_outbox.aclose() # إرسال ما تبقى في الطابور قبل إغلاق البوت
+    if order_queue is not None:
+        await order_queue.aclose()
+    if quotex_pool is not None:
+        await quotex_pool.aclose()
+    REGISTRY.shutdown()
+    if shard_coordinator is not None:
+        shard_coordinator.stop()
+    if async_fetcher is not None:
+        await async_fetcher.aclose()
+    if execution is not None:
+        loop_lag_monitor.stop()
+        execution.shutdown()
+
+
 def main_telegram_app() -> None: # تم تغيير اسم الدالة
     print("✅ Initializing Telegram Bot Application...")
     
@@ -248,11 +909,12 @@ def main_telegram_app() -> None: # تم تغيير اسم الدالة
         print("CRITICAL: TELEGRAM_BOT_TOKEN is a placeholder. Bot cannot start.")
         return
 
-    application = Application.builder().token(TELEGRAM_BOT_TOKEN).post_init(post_init).build()
+    application = Application.builder().token(TELEGRAM_BOT_TOKEN).post_init(post_init).post_shutdown(post_shutdown).build()
 
     application.add_handler(CommandHandler("start", start_command))
     application.add_handler(CommandHandler("status", status_command))
     application.add_handler(CommandHandler("check", check_asset_command))
+    application.add_handler(CommandHandler("metrics", metrics_command))
     
     print("Telegram Bot Application created. Starting polling...")
     application.run_polling()
@@ -268,6 +930,14 @@ def main_telegram_app() -> None: # تم تغيير اسم الدالة
 if __name__ == "__main__":
     # هذا القسم يتم تنفيذه عند تشغيل الملف مباشرة
     # طباعة الإعدادات تتم هنا مرة واحدة
+    mark_startup("imports")
+    if "--shard-worker" in sys.argv and ShardCoordinator:
+        # عامل مسح موزع: python main.py --shard-worker [host:port]
+        position = sys.argv.index("--shard-worker")
+        worker_address = parse_address(sys.argv[position + 1]) if len(sys.argv) > position + 1 else SHARD_COORDINATOR_ADDRESS
+        print(f"Shard worker: connecting to coordinator at {worker_address[0]}:{worker_address[1]}")
+        asyncio.run(run_shard_worker(worker_address))
+        sys.exit(0)
     print(f"Data Source: {ACTIVE_DATA_SOURCE} | Quotex User: {QUOTEX_EMAIL}")
     print(f"Assets: {[a['COMMON_NAME'] for a in ASSETS_TO_MONITOR]}")
     print(f"Timeframes: {ANALYSIS_FRAMES}")
@@ -0,0 +1,337 @@
+# metrics.py
+# قياس زمن كل مرحلة بكلفة منخفضة بدل print المتفرقة:
+# - Histogram بحدود ثابتة (bucket) على نمط Prometheus: الملاحظة الواحدة = bisect + زيادة عدادين تحت قفل (~1 ميكروثانية)،
+#   والذاكرة ثابتة مهما طال التشغيل. p50/p95 تُقدّر من الحدود بالاستيفاء الخطي (مثل histogram_quantile).
+# - Counter للأحداث (أخطاء، إشارات، خطوات Quotex الفاشلة)، وgauge محسوب عند القراءة من إحصاءات موجودة.
+# - REGISTRY مشترك: أمر /metrics في تيليجرام يعرض ملخصًا، و serve() يصدر نص Prometheus على منفذ محلي.
+import bisect
+import functools
+import inspect
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _format_labels(labels: tuple) -> str:
+    if not labels:
+        return ""
+    escaped = (f'{key}="{str(value).replace(chr(92), chr(92) * 2).replace(chr(34), chr(92) + chr(34))}"'
+               for key, value in labels)
+    return "{" + ",".join(escaped) + "}"
+
+
+class Histogram:
+    def __init__(self, buckets: tuple = DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # الأخير: أكبر من آخر حد (+Inf)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float) -> None:
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.count += 1
+            self.sum += value
+            if value > self.max:
+                self.max = value
+
+    def quantile(self, q: float) -> float | None:
+        if self.count == 0:
+            return None
+        rank = q * self.count
+        cumulative = 0
+        for index, bucket_count in enumerate(self.counts):
+            if cumulative + bucket_count >= rank and bucket_count:
+                if index == len(self.buckets):
+                    return self.max
+                lower = self.buckets[index - 1] if index else 0.0
+                upper = min(self.buckets[index], self.max)
+                return lower + (upper - lower) * (rank - cumulative) / bucket_count
+            cumulative += bucket_count
+        return self.max
+
+
+class Counter:
+    def __init__(self):
+        self.value = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1) -> None:
+        with self._lock:
+            self.value += amount
+
+
+class _Family:
+    kind = ""
+
+    def __init__(self, name: str, help_text: str, label_names: tuple, factory):
+        self.name = name
+        self.help = help_text
+        self.label_names = label_names
+        self._factory = factory
+        self._children: dict[tuple, object] = {}
+        self._lock = threading.Lock()
+
+    def labels(self, **labels):
+        key = tuple((name, labels.get(name, "")) for name in self.label_names)
+        child = self._children.get(key)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(key, self._factory())
+        return child
+
+    def items(self) -> list:
+        return sorted(self._children.items(), key=lambda item: item[0])
+
+
+class HistogramFamily(_Family):
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, label_names: tuple = (), buckets: tuple = DEFAULT_BUCKETS):
+        super().__init__(name, help_text, label_names, lambda: Histogram(buckets))
+
+    def observe(self, value: float, **labels) -> None:
+        self.labels(**labels).observe(value)
+
+    def time(self, **labels):
+        return _Timer(self.labels(**labels))
+
+    def timed(self, **labels):
+        # مُزخرف لدوال متزامنة أو coroutines
+        child = self.labels(**labels)
+
+        def decorator(fn):
+            if inspect.iscoroutinefunction(fn):
+                @functools.wraps(fn)
+                async def async_wrapper(*args, **kwargs):
+                    with _Timer(child):
+                        return await fn(*args, **kwargs)
+                return async_wrapper
+
+            @functools.wraps(fn)
+            def wrapper(*args, **kwargs):
+                with _Timer(child):
+                    return fn(*args, **kwargs)
+            return wrapper
+        return decorator
+
+
+class CounterFamily(_Family):
+    kind = "counter"
+
+    def __init__(self, name: str, help_text: str, label_names: tuple = ()):
+        super().__init__(name, help_text, label_names, Counter)
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        self.labels(**labels).inc(amount)
+
+
+class _Timer:
+    __slots__ = ("_histogram", "_started")
+
+    def __init__(self, histogram: Histogram):
+        self._histogram = histogram
+
+    def __enter__(self):
+        self._started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        # يُسجل الزمن حتى عند الاستثناء: المرحلة البطيئة التي تفشل بمهلة هي بالضبط ما نبحث عنه
+        self._histogram.observe(time.perf_counter() - self._started)
+        return False
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._families: dict[str, _Family] = {}
+        self._gauges: dict[str, tuple] = {}  # name -> (help, fn)
+        self._lock = threading.Lock()
+        self._server = None
+
+    def _register(self, family: _Family) -> _Family:
+        with self._lock:
+            existing = self._families.get(family.name)
+            if existing is not None:
+                return existing  # إعادة استيراد الوحدة (مثل __mp_main__) لا تكرر المقياس
+            self._families[family.name] = family
+            return family
+
+    def histogram(self, name: str, help_text: str, label_names: tuple = (), buckets: tuple = DEFAULT_BUCKETS) -> HistogramFamily:
+        return self._register(HistogramFamily(name, help_text, label_names, buckets))
+
+    def counter(self, name: str, help_text: str, label_names: tuple = ()) -> CounterFamily:
+        return self._register(CounterFamily(name, help_text, label_names))
+
+    def gauge(self, name: str, help_text: str, fn) -> None:
+        # fn بلا معاملات تُرجع رقمًا أو None (غير متاح) عند كل قراءة
+        self._gauges[name] = (help_text, fn)
+
+    # --- التصدير ---
+    def render_prometheus(self) -> str:
+        lines = []
+        for family in self._families.values():
+            exposed = f"{family.name}_total" if family.kind == "counter" else family.name
+            lines += [f"# HELP {exposed} {family.help}", f"# TYPE {exposed} {family.kind}"]
+            for labels, child in family.items():
+                if family.kind == "counter":
+                    lines.append(f"{exposed}{_format_labels(labels)} {child.value:g}")
+                    continue
+                cumulative = 0
+                for bound, bucket_count in zip(child.buckets + (float("inf"),), child.counts):
+                    cumulative += bucket_count
+                    le = "+Inf" if bound == float("inf") else f"{bound:g}"
+                    lines.append(f"{family.name}_bucket{_format_labels(labels + (('le', le),))} {cumulative}")
+                lines.append(f"{family.name}_sum{_format_labels(labels)} {child.sum:.9g}")
+                lines.append(f"{family.name}_count{_format_labels(labels)} {child.count}")
+        for name, (help_text, fn) in self._gauges.items():
+            try:
+                value = fn()
+            except Exception:
+                value = None
+            if value is None:
+                continue
+            lines += [f"# HELP {name} {help_text}", f"# TYPE {name} gauge", f"{name} {float(value):.9g}"]
+        return "\n".join(lines) + "\n"
+
+    def format_summary(self) -> str:
+        # نص مختصر لأمر /metrics: لكل سلسلة العدد والمتوسط وp50/p95 والأقصى
+        lines = []
+        for family in self._families.values():
+            for labels, child in family.items():
+                label_text = ",".join(str(value) for _, value in labels)
+                title = f"{family.name.removeprefix('signalbot_')}{f'[{label_text}]' if label_text else ''}"
+                if family.kind == "counter":
+                    lines.append(f"{title}: {child.value:g}")
+                elif child.count:
+                    lines.append(f"{title}: n={child.count} mean {child.sum / child.count * 1000:.1f}ms "
+                                 f"p50 {child.quantile(0.5) * 1000:.1f}ms p95 {child.quantile(0.95) * 1000:.1f}ms "
+                                 f"max {child.max * 1000:.1f}ms")
+        return "\n".join(lines) if lines else "no measurements yet"
+
+    def serve(self, port: int, host: str = "127.0.0.1") -> int:
+        # نقطة /metrics بصيغة Prometheus في خيط خلفي؛ يرجع المنفذ الفعلي (port=0 لمنفذ حر)
+        registry = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] not in ("/metrics", "/"):
+                    self.send_error(404)
+                    return
+                body = registry.render_prometheus().encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass  # لا نملأ السجل بطلبات الجمع الدورية
+
+        self._server = ThreadingHTTPServer((host, port), Handler)
+        threading.Thread(target=self._server.serve_forever, name="metrics-http", daemon=True).start()
+        return self._server.server_address[1]
+
+    def shutdown(self) -> None:
+        if self._server is not None:
+            self._server.shutdown()
+            self._server = None
+
+
+REGISTRY = MetricsRegistry()
+
+# --- مقاييس المراحل المشتركة بين الوحدات ---
+FETCH_SECONDS = REGISTRY.histogram("signalbot_fetch_seconds", "Candle fetch duration per source and interval.",
+                                   ("source", "interval"))
+FETCH_ERRORS = REGISTRY.counter("signalbot_fetch_errors", "Fetches that raised or returned no data.",
+                                ("source", "interval"))
+INDICATOR_SECONDS = REGISTRY.histogram("signalbot_indicators_seconds", "Indicator computation per frame.",
+                                       ("function",))
+PATTERN_SECONDS = REGISTRY.histogram("signalbot_patterns_seconds", "detect_candlestick_patterns duration.")
+DECISION_SECONDS = REGISTRY.histogram("signalbot_decision_seconds", "Multi-frame decision stages per cycle.",
+                                      ("stage",))
+TELEGRAM_SECONDS = REGISTRY.histogram("signalbot_telegram_send_seconds", "Telegram send_message duration.")
+TELEGRAM_ERRORS = REGISTRY.counter("signalbot_telegram_errors", "Telegram sends that failed.")
+QUOTEX_STEP_SECONDS = REGISTRY.histogram("signalbot_quotex_step_seconds", "Quotex browser step duration.", ("step",))
+QUOTEX_STEP_FAILURES = REGISTRY.counter("signalbot_quotex_step_failures", "Quotex steps that returned False or raised.",
+                                        ("step",))
+SIGNALS_TOTAL = REGISTRY.counter("signalbot_signals", "Multi-frame signals generated.", ("direction",))
+SIGNAL_TO_CLICK_SECONDS = REGISTRY.histogram("signalbot_signal_to_click_seconds",
+                                             "Signal generation to Quotex trade click.", ("path",))
+ORDER_QUEUE_SECONDS = REGISTRY.histogram("signalbot_order_queue_seconds", "Time an order waited in the order queue.")
+ORDER_FILL_SECONDS = REGISTRY.histogram("signalbot_order_fill_seconds", "Order execution attempt duration.", ("outcome",))
+ORDERS_TOTAL = REGISTRY.counter("signalbot_orders", "Orders by outcome (filled, failed, expired, duplicate, full).",
+                                ("outcome",))
+
+
+def timed_step(step: str):
+    # خطوات Quotex (ترجع True/False): الزمن في QUOTEX_STEP_SECONDS والفشل في QUOTEX_STEP_FAILURES
+    child, failures = QUOTEX_STEP_SECONDS.labels(step=step), QUOTEX_STEP_FAILURES.labels(step=step)
+
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            try:
+                with _Timer(child):
+                    result = fn(*args, **kwargs)
+            except Exception:
+                failures.inc()
+                raise
+            if result is False:
+                failures.inc()
+            return result
+        return wrapper
+    return decorator
+
+
+def timed_fetch(fetch_fn):
+    # يغلف fetch_data_from_source (نفس التوقيع) ويقيسه لكل (source, interval)
+    @functools.wraps(fetch_fn)
+    def wrapper(source, symbol, interval_or_timeframe, count, asset_config=None):
+        labels = {"source": source, "interval": interval_or_timeframe}
+        try:
+            with FETCH_SECONDS.time(**labels):
+                df = fetch_fn(source=source, symbol=symbol, interval_or_timeframe=interval_or_timeframe,
+                              count=count, asset_config=asset_config)
+        except Exception:
+            FETCH_ERRORS.inc(**labels)
+            raise
+        if df is None or df.empty:
+            FETCH_ERRORS.inc(**labels)
+        return df
+    return wrapper
+
+
+if __name__ == "__main__":
+    # كلفة الملاحظة الواحدة، ثم ملخص /metrics ونص Prometheus من نقطة HTTP محلية
+    import random
+    import urllib.request
+
+    rounds = 200_000
+    histogram = FETCH_SECONDS.labels(source="TWELVEDATA", interval="15min")
+    values = [random.lognormvariate(-3, 1) for _ in range(rounds)]
+    started = time.perf_counter()
+    for value in values:
+        histogram.observe(value)
+    observe_us = (time.perf_counter() - started) / rounds * 1e6
+    started = time.perf_counter()
+    for _ in range(rounds):
+        with QUOTEX_STEP_SECONDS.time(step="select_asset"):
+            pass
+    timer_us = (time.perf_counter() - started) / rounds * 1e6
+    print(f"observe: {observe_us:.2f} us, timer context: {timer_us:.2f} us per call")
+    exact = sorted(values)
+    print(f"p50 estimate {histogram.quantile(0.5) * 1000:.1f}ms vs exact {exact[rounds // 2] * 1000:.1f}ms, "
+          f"p95 estimate {histogram.quantile(0.95) * 1000:.1f}ms vs exact {exact[int(rounds * 0.95)] * 1000:.1f}ms")
+    SIGNALS_TOTAL.inc(direction="call")
+    REGISTRY.gauge("signalbot_demo_gauge", "Demo gauge.", lambda: 42)
+    print(REGISTRY.format_summary())
+    port = REGISTRY.serve(0)
+    text = urllib.request.urlopen(f"http://127.0.0.1:{port}/metrics").read().decode()
+    print("\n".join(text.splitlines()[:8]), "\n...", f"({len(text.splitlines())} lines)")
+    REGISTRY.shutdown()
@@ -0,0 +1,164 @@
+# order_queue.py
+# طابور أوامر غير متزامن بين التحليل والتنفيذ:
+# - submit لا ينتظر المتصفح أبدًا؛ عمّال خلفيون (بعدد جلسات Quotex) ينفذون الأوامر من طابور محدود.
+# - لكل أمر وقت الإشارة وموعد نهائي = وقت الإشارة + جزء من TRADE_DURATION (نافذة الدخول)؛ أمر يصل دوره بعد موعده
+#   يُسقط ويُعد بدل تنفيذه متأخرًا.
+# - أمر مكرر (نفس الأصل والاتجاه) يُرفض ما دام أمر مماثل في الطابور أو قيد التنفيذ أو صفقته ما زالت مفتوحة.
+# - زمن الانتظار في الطابور وزمن محاولة التنفيذ ونتيجة كل أمر في metrics و /status.
+import asyncio
+import time
+
+try:
+    from metrics import ORDER_FILL_SECONDS, ORDER_QUEUE_SECONDS, ORDERS_TOTAL
+except ImportError: # metrics.py اختياري: الطابور يعمل كما هو بلا قياس، والعدادات في self.counts تبقى
+    class _NoMetrics:
+        # ما يستخدمه هذا الملف من metrics (observe/labels/quantile/inc) بلا قياس
+        def observe(self, value, **labels): pass
+        def labels(self, **labels): return self
+        def quantile(self, q): return None
+        def inc(self, amount=1, **labels): pass
+    ORDER_FILL_SECONDS = ORDER_QUEUE_SECONDS = ORDERS_TOTAL = _NoMetrics()
+from timeframes import interval_to_seconds
+
+
+class Order:
+    def __init__(self, asset: str, direction: str, signal_at: float, deadline_at: float):
+        self.asset = asset
+        self.direction = direction
+        self.signal_at = signal_at
+        self.deadline_at = deadline_at
+        self.enqueued_at = time.time()
+
+    @property
+    def key(self) -> tuple:
+        return self.asset, self.direction
+
+    def __repr__(self) -> str:
+        return f"Order({self.asset} {self.direction.upper()}, {self.deadline_at - time.time():.1f}s left)"
+
+
+class OrderQueue:
+    def __init__(self, execute_fn, trade_duration: str, entry_window_fraction: float = 0.5, max_pending: int = 50,
+                 workers: int = 1):
+        # execute_fn(order) -> coroutine تُرجع True عند تنفيذ الصفقة، False عند فشلها، None إذا فات موعد الأمر قبل النقر
+        # (انتظار تسجيل الدخول أو جلسة حرة)
+        self._execute = execute_fn
+        self.trade_duration_s = interval_to_seconds(trade_duration)
+        self.entry_window_s = self.trade_duration_s * entry_window_fraction
+        self.workers = workers
+        self._queue: asyncio.Queue = asyncio.Queue(max_pending)
+        self._active: dict = {}  # (asset, direction) -> حتى متى يُعتبر أمر جديد مكررًا (time.time())
+        self._tasks: list = []
+        self.counts = {outcome: 0 for outcome in ("submitted", "filled", "failed", "expired", "duplicate", "full")}
+
+    def start(self) -> None:
+        loop = asyncio.get_running_loop()
+        self._tasks = [loop.create_task(self._worker()) for _ in range(self.workers)]
+
+    def _count(self, outcome: str) -> None:
+        self.counts[outcome] += 1
+        if outcome != "submitted":
+            ORDERS_TOTAL.inc(outcome=outcome)
+
+    def submit(self, asset: str, direction: str, signal_at: float | None = None) -> bool:
+        # فوري؛ False إذا رُفض الأمر (انتهت نافذته، مكرر، أو الطابور ممتلئ)
+        now = time.time()
+        signal_at = now if signal_at is None else signal_at
+        order = Order(asset, direction, signal_at, signal_at + self.entry_window_s)
+        self._count("submitted")
+        if now >= order.deadline_at:
+            self._count("expired")
+            print(f"Order queue: Dropped stale {asset} {direction.upper()} ({now - signal_at:.1f}s after signal).")
+            return False
+        if self._active.get(order.key, 0) > now:
+            self._count("duplicate")
+            print(f"Order queue: Rejected duplicate {asset} {direction.upper()}.")
+            return False
+        try:
+            self._queue.put_nowait(order)
+        except asyncio.QueueFull:
+            self._count("full")
+            print(f"Order queue: Queue full, rejected {asset} {direction.upper()}.")
+            return False
+        self._active[order.key] = order.deadline_at
+        return True
+
+    async def _worker(self) -> None:
+        while True:
+            order = await self._queue.get()
+            try:
+                await self._process(order)
+            except Exception as e:
+                print(f"Order queue: Error executing {order}: {type(e).__name__} - {e}")
+                self._release(order, filled=False)
+                self._count("failed")
+            finally:
+                self._queue.task_done()
+
+    async def _process(self, order: Order) -> None:
+        picked_at = time.time()
+        ORDER_QUEUE_SECONDS.observe(picked_at - order.enqueued_at)
+        if picked_at >= order.deadline_at:
+            self._release(order, filled=False)
+            self._count("expired")
+            print(f"Order queue: Dropped stale {order.asset} {order.direction.upper()} "
+                  f"({picked_at - order.signal_at:.1f}s after signal, window {self.entry_window_s:.0f}s).")
+            return
+        started = time.perf_counter()
+        result = await self._execute(order)
+        outcome = "expired" if result is None else ("filled" if result else "failed")
+        ORDER_FILL_SECONDS.observe(time.perf_counter() - started, outcome=outcome)
+        self._release(order, outcome == "filled")
+        self._count(outcome)
+
+    def _release(self, order: Order, filled: bool) -> None:
+        # بعد التنفيذ: الاتجاه نفسه على الأصل نفسه مكرر حتى تنتهي الصفقة المفتوحة؛ بعد الفشل أو الإسقاط يُقبل أمر جديد
+        if filled:
+            self._active[order.key] = time.time() + self.trade_duration_s
+        else:
+            self._active.pop(order.key, None)
+
+    async def join(self) -> None:
+        # انتظار تنفيذ (أو إسقاط) كل الأوامر المقبولة حتى الآن
+        await self._queue.join()
+
+    async def aclose(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    # --- المراقبة ---
+    def stats(self) -> dict:
+        waited, filled = ORDER_QUEUE_SECONDS.labels(), ORDER_FILL_SECONDS.labels(outcome="filled")
+        return {"depth": self._queue.qsize(), **self.counts,
+                "queue_p95_s": waited.quantile(0.95), "fill_p50_s": filled.quantile(0.5),
+                "fill_p95_s": filled.quantile(0.95)}
+
+    def format_stats(self) -> str:
+        s = self.stats()
+        timings = (f", queue p95 {s['queue_p95_s']:.2f}s, fill p50 {s['fill_p50_s']:.2f}s p95 {s['fill_p95_s']:.2f}s"
+                   if s["fill_p50_s"] is not None else "")
+        return (f"queue {s['depth']}, {s['filled']}/{s['submitted']} filled, {s['failed']} failed, "
+                f"{s['expired']} expired, {s['duplicate']} duplicates, {s['full']} rejected (full){timings}")
+
+
+if __name__ == "__main__":
+    # منفذ وهمي بطيء (عامل واحد، 4 ثوانٍ لكل صفقة) ونافذة دخول 10 ثوانٍ: الأوامر المتأخرة تُسقط، والمكررة تُرفض
+    async def demo():
+        async def slow_execute(order):
+            await asyncio.sleep(4)
+            return True
+
+        orders = OrderQueue(slow_execute, "1m", entry_window_fraction=10 / 60, max_pending=5, workers=1)
+        orders.start()
+        started = time.time()
+        for asset in ["EURUSD", "GBPUSD", "USDJPY", "AUDUSD", "EURUSD"]:
+            orders.submit(asset, "call", started)
+        orders.submit("USDCAD", "put", started - 20) # إشارة قديمة بالفعل (دورة بطيئة)
+        await orders.join()
+        orders.submit("EURUSD", "call") # صفقة EURUSD CALL ما زالت مفتوحة
+        print(orders.format_stats())
+        await orders.aclose()
+
+    asyncio.run(demo())
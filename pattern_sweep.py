@@ -0,0 +1,178 @@
+# pattern_sweep.py
+# مسح شبكة عتبات detect_candlestick_patterns دفعة واحدة: محور التركيبات (P) × محور الشموع (T) بعملية مبثوثة
+# واحدة على candlestick_pattern_mask، مع عدد الظهور وإحصاءات العائد اللاحق (forward return) لكل نمط وتركيبة.
+# الشموع تُعالج على قطع (chunk_size) بتداخل شمعتين (أطول lookback) حتى تبقى الذاكرة محدودة على سنوات من البيانات.
+import itertools
+
+import numpy as np
+import pandas as pd
+
+from strategy.candle_patterns import PATTERN_NAMES, PATTERN_RULES, candlestick_pattern_mask, decode_pattern_mask
+
+THRESHOLD_NAMES = ("doji_threshold", "hammer_body_max_ratio",
+                   "hammer_lower_shadow_min_ratio", "hammer_upper_shadow_max_ratio")
+# الاتجاه المتوقع بعد النمط: 1 صعود، -1 هبوط، 0 محايد (doji)
+PATTERN_DIRECTION = {
+    'bullish_engulfing': 1, 'bearish_engulfing': -1, 'hammer': 1, 'shooting_star': -1, 'doji': 0,
+    'morning_star': 1, 'evening_star': -1, 'three_white_soldiers': 1, 'three_black_crows': -1,
+}
+PATTERN_LOOKBACK = 2
+# الحقول المشتقة في candlestick_pattern_mask التي تعتمد على العتبات
+FIELD_THRESHOLDS = {
+    'doji': ("doji_threshold",),
+    'hammer': THRESHOLD_NAMES[1:],
+    'shooting_star': THRESHOLD_NAMES[1:],
+}
+
+
+def pattern_threshold_dependencies(name: str) -> tuple:
+    # نستدعي قاعدة النمط بحقول وهمية ونسجل ما تقرؤه، فيُعرف أي العتبات تؤثر فيه دون تعريف يدوي لكل نمط جديد
+    fields_read = set()
+
+    def at(field, lag):
+        fields_read.add(field)
+        return np.zeros(1, dtype=bool if field not in ('open', 'close') else np.float64)
+
+    PATTERN_RULES[name][1](at)
+    return tuple(t for t in THRESHOLD_NAMES if any(t in FIELD_THRESHOLDS.get(f, ()) for f in fields_read))
+
+
+def threshold_grid(doji_threshold=(0.1,), hammer_body_max_ratio=(0.4,),
+                   hammer_lower_shadow_min_ratio=(0.5,), hammer_upper_shadow_max_ratio=(0.2,)) -> pd.DataFrame:
+    # الجداء الديكارتي للقيم: صف لكل تركيبة
+    combos = list(itertools.product(doji_threshold, hammer_body_max_ratio,
+                                    hammer_lower_shadow_min_ratio, hammer_upper_shadow_max_ratio))
+    return pd.DataFrame(combos, columns=list(THRESHOLD_NAMES))
+
+
+def forward_returns(close: np.ndarray, horizon: int) -> np.ndarray:
+    # عائد الإغلاق بعد horizon شمعة؛ NaN في آخر horizon شمعة (لا مستقبل معروف)
+    out = np.full(close.shape, np.nan)
+    out[:-horizon] = close[horizon:] / close[:-horizon] - 1
+    return out
+
+
+def sweep_pattern_thresholds(open_: np.ndarray, high: np.ndarray, low: np.ndarray, close: np.ndarray,
+                             grid: pd.DataFrame, horizons=(1,), chunk_size: int = 20_000) -> pd.DataFrame:
+    # يرجع جدولًا طويلًا: (تركيبة × نمط × أفق) مع hits, mean_return, std_return, up_rate, win_rate
+    open_, high, low, close = (np.asarray(x, dtype=np.float64) for x in (open_, high, low, close))
+    n, n_combos = len(close), len(grid)
+    returns = np.stack([forward_returns(close, h) for h in horizons])  # (H, T)
+    has_return = ~np.isnan(returns)
+    returns_0 = np.where(has_return, returns, 0.0)
+
+    # الأنماط تُجمع حسب العتبات التي تعتمد عليها، وكل مجموعة تُحسب على التركيبات الفريدة لتلك العتبات فقط
+    # (الابتلاع والجنود/الغربان لا تعتمد على أي عتبة: تركيبة واحدة بدل P)
+    groups: dict = {}
+    for k, name in enumerate(PATTERN_NAMES):
+        groups.setdefault(pattern_threshold_dependencies(name), []).append(k)
+    group_grids = {}
+    for deps, members in groups.items():
+        if deps:
+            unique = grid[list(deps)].drop_duplicates(ignore_index=True)
+            inverse = grid[list(deps)].merge(unique.reset_index(), on=list(deps), how="left")["index"].to_numpy()
+        else:
+            unique, inverse = grid.iloc[:1], np.zeros(n_combos, dtype=np.int64)
+        thresholds = [unique[t].to_numpy(dtype=np.float64)[:, None] if t in deps
+                      else np.full((len(unique), 1), grid[t].iloc[0]) for t in THRESHOLD_NAMES]
+        group_grids[deps] = (members, thresholds, inverse, len(unique))
+
+    n_h = len(horizons)
+    # لكل نمط وتركيبة: [عدد الظهور | عدد العوائد المعروفة (H) | مجموع العائد (H) | مجموع المربعات (H) | عدد الصعود (H)]
+    group_totals = {deps: np.zeros((len(members), size, 1 + 4 * n_h))
+                    for deps, (members, _, _, size) in group_grids.items()}
+    for lo in range(0, n, chunk_size):
+        hi = min(lo + chunk_size, n)
+        start = max(0, lo - PATTERN_LOOKBACK)
+        r = returns_0[:, lo:hi]
+        moments = np.ascontiguousarray(np.concatenate(
+            [np.ones((1, hi - lo)), has_return[:, lo:hi], r, r * r, r > 0]).T)  # (chunk, 1 + 4H)
+        for deps, (members, thresholds, _, _) in group_grids.items():
+            mask = candlestick_pattern_mask(open_[start:hi], high[start:hi], low[start:hi], close[start:hi],
+                                            *thresholds)[:, lo - start:]  # (P_group, chunk)
+            names = [PATTERN_NAMES[k] for k in members]
+            for i, flags in enumerate(decode_pattern_mask(mask, names).values()):
+                # جداء مصفوفي واحد (P, chunk) @ (chunk, 1 + 4H) يعطي كل المجاميع لكل التركيبات والآفاق
+                group_totals[deps][i] += flags.astype(np.float64) @ moments
+
+    totals = np.zeros((len(PATTERN_NAMES), n_combos, 1 + 4 * n_h))
+    for deps, (members, _, inverse, _) in group_grids.items():
+        for i, k in enumerate(members):
+            totals[k] = group_totals[deps][i][inverse]
+    hits = totals[..., 0]
+    counted, sum_ret, sum_sq, ups = (totals[..., 1 + i * n_h:1 + (i + 1) * n_h] for i in range(4))
+
+    rows = []
+    with np.errstate(divide="ignore", invalid="ignore"):
+        mean = sum_ret / counted
+        std = np.sqrt(np.maximum(sum_sq / counted - mean * mean, 0.0))
+        up_rate = ups / counted
+    for k, name in enumerate(PATTERN_NAMES):
+        direction = PATTERN_DIRECTION[name]
+        for h, horizon in enumerate(horizons):
+            part = grid.copy()
+            part["pattern"] = name
+            part["horizon"] = horizon
+            part["hits"] = hits[k].astype(np.int64)
+            part["mean_return"] = mean[k, :, h]
+            part["std_return"] = std[k, :, h]
+            part["up_rate"] = up_rate[k, :, h]
+            # win_rate: نسبة تحرك السعر في اتجاه النمط (غير معرّفة لـ doji المحايد)
+            part["win_rate"] = up_rate[k, :, h] if direction > 0 else (1 - up_rate[k, :, h] if direction < 0 else np.nan)
+            rows.append(part)
+    return pd.concat(rows, ignore_index=True)
+
+
+def sweep_from_store(store, source: str, symbol: str, interval, grid: pd.DataFrame, horizons=(1,),
+                     start=None, end=None, chunk_size: int = 20_000) -> pd.DataFrame | None:
+    # يعمل مباشرة على شرائح memmap من CandleStore (سنوات من البيانات دون تحميل DataFrame)
+    arrays = store.read_arrays(source, symbol, interval, start=start, end=end)
+    if arrays is None:
+        return None
+    result = sweep_pattern_thresholds(arrays["open"], arrays["high"], arrays["low"], arrays["close"],
+                                      grid, horizons, chunk_size)
+    result.insert(0, "interval", interval)
+    result.insert(0, "symbol", symbol)
+    return result
+
+
+if __name__ == "__main__":
+    # مقارنة نتائج المسح مع حلقة بايثون تستدعي detect_candlestick_patterns لكل تركيبة، وقياس الزمن
+    import time
+
+    from strategy.candle_patterns import _detect_candlestick_patterns_pandas, detect_candlestick_patterns
+
+    rng = np.random.default_rng(9)
+    n = 200_000  # ~ 5.7 سنة من شموع 15min
+    close = 1.1 * np.exp(np.cumsum(rng.normal(0, 0.0008, n)))
+    open_ = np.r_[close[0], close[:-1]] * (1 + rng.normal(0, 0.0002, n))
+    high = np.maximum(open_, close) * (1 + rng.uniform(0, 0.0006, n))
+    low = np.minimum(open_, close) * (1 - rng.uniform(0, 0.0006, n))
+    grid = threshold_grid(np.linspace(0.05, 0.2, 4), np.linspace(0.25, 0.45, 5),
+                          np.linspace(0.4, 0.7, 4), np.linspace(0.1, 0.3, 3))
+    horizons = (1, 4)
+
+    started = time.perf_counter()
+    result = sweep_pattern_thresholds(open_, high, low, close, grid, horizons)
+    sweep_s = time.perf_counter() - started
+    print(f"Sweep: {len(grid)} combinations x {n} candles x {len(horizons)} horizons in {sweep_s:.2f}s")
+
+    df = pd.DataFrame({"open": open_, "high": high, "low": low, "close": close})
+    fwd = forward_returns(close, 1)
+    sample = grid.sample(5, random_state=1)
+    for label, detect in (("bitmask", detect_candlestick_patterns), ("legacy pandas", _detect_candlestick_patterns_pandas)):
+        started = time.perf_counter()
+        loop_results = {i: detect(df, *combo.to_numpy()) for i, combo in sample.iterrows()}
+        loop_s = (time.perf_counter() - started) / len(sample) * len(grid)
+        print(f"Python loop over {label} detect (extrapolated to {len(grid)} combinations): {loop_s:.1f}s")
+
+    for combo_index, patterns in loop_results.items():
+        for name in PATTERN_NAMES:
+            flags = patterns[name].to_numpy(dtype=bool)
+            row = result[(result["pattern"] == name) & (result["horizon"] == 1)].iloc[combo_index]
+            assert row["hits"] == flags.sum(), (name, combo_index)
+            expected_mean = np.nanmean(fwd[flags]) if flags.any() else np.nan
+            assert np.isclose(row["mean_return"], expected_mean, equal_nan=True), (name, combo_index)
+    print(f"Sweep results match the loop on {len(sample)} sampled combinations.")
+    best = result[(result["pattern"] == "hammer") & (result["horizon"] == 4) & (result["hits"] >= 50)]
+    print(best.sort_values("win_rate", ascending=False).head(3).to_string(index=False))
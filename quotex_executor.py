@@ -5,7 +5,13 @@ from selenium.webdriver.chrome.options import Options
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
 from selenium.common.exceptions import TimeoutException, NoSuchElementException, ElementClickInterceptedException
+import os
+import re
 import time
+try:
+    from metrics import timed_step
+except ImportError: # metrics.py اختياري: الخطوات تعمل كما هي بلا قياس
+    def timed_step(step): return lambda fn: fn
 
 # --- !!! قم بتحديث هذه المعرفات بدقة لتطابق واجهة Quotex الحالية !!! ---
 LOGIN_URL = "https://qxbroker.com/en/sign-in" # أو الرابط الصحيح لمنطقتك/لغتك
@@ -14,20 +20,104 @@ PASSWORD_INPUT_NAME = "password"
 # مثال: عنصر يظهر بعد تسجيل الدخول (مثل رصيد الحساب أو اسم المستخدم)
 LOGIN_SUCCESS_INDICATOR_XPATH = "//div[contains(@class,'header-avatar__photo') or contains(@class,'user-balance')]" # مثال مركب
 
-ASSET_SELECTOR_BUTTON_CSS = "button.pair-button" # مثال من واجهة حديثة
+ASSET_SELECTOR_BUTTON_CSS = "button.pair-button" # مثال من واجهة حديثة (نصه هو الأصل المعروض حاليًا)
 ASSET_SEARCH_MODAL_CSS = "div.search-modal" # مثال للنافذة المنبثقة للبحث
 ASSET_SEARCH_INPUT_CSS = "div.search-modal input[type='text']" # مثال لحقل البحث داخل النافذة
 ASSET_SEARCH_RESULT_XPATH_TEMPLATE = "//div[contains(@class,'asset-item')]//div[contains(normalize-space(),'{}')]" # {} لاسم الأصل (EUR/USD)
 
-TIME_SELECTOR_BUTTON_CSS = "button.time-button" # مثال
+TIME_SELECTOR_BUTTON_CSS = "button.time-button" # مثال (نصه هو المدة الحالية، مثل "00:01:00")
 # مثال لزر مدة دقيقة واحدة (قد يكون النص "1:00" أو "1m" أو أيقونة)
 DURATION_1M_BUTTON_XPATH = "//button[contains(@class,'time-item') and normalize-space(text())='1:00']" # مثال شائع لـ 1 دقيقة
+DURATION_BUTTON_XPATHS = {"1m": DURATION_1M_BUTTON_XPATH} # المدد المدعومة: زرها ونصها المعروض في TIME_SELECTOR_BUTTON_CSS
+DURATION_LABELS = {"1m": "1:00"}
 
 AMOUNT_INPUT_CSS = "input.input-sum" # مثال
 CALL_BUTTON_CSS = "button.deal-button--up" # مثال
 PUT_BUTTON_CSS = "button.deal-button--down" # مثال
 # -----------------------------------------------------------------------
 
+POLL_S = 0.05 # فترة فحص WebDriverWait (الافتراضي 0.5 ثانية يضيف حتى نصف ثانية لكل انتظار)
+STANDIN_PAGE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "quotex_standin.html") # نسخة محلية ثابتة لقياس الزمن
+
+# قراءة حالة التذكرة (الأصل، المدة، المبلغ) وتطبيق المدة والمبلغ الناقصين في رحلة واحدة للمتصفح بدل عدة أوامر WebDriver
+SYNC_TICKET_JS = """
+const [pairCss, timeCss, amountCss, durationXpath, durationLabel, amount, force] = arguments;
+const normalizeTime = (text) => text.trim().replace(/^[0:]+(?=\\d)/, '');
+const pair = document.querySelector(pairCss), time = document.querySelector(timeCss), input = document.querySelector(amountCss);
+const state = {asset: pair ? pair.textContent.trim() : null, duration: time ? time.textContent.trim() : null,
+               amount: input ? input.value : null, changed: []};
+if (durationXpath !== null && (force || !(time && normalizeTime(time.textContent) === normalizeTime(durationLabel)))) {
+    const option = document.evaluate(durationXpath, document, null, XPathResult.FIRST_ORDERED_NODE_TYPE, null).singleNodeValue;
+    if (option) { option.click(); state.changed.push('duration'); }
+}
+if (amount !== null && input && (force || Number(input.value) !== Number(amount))) {
+    // setter الأصلي حتى يرى React/Vue القيمة الجديدة، ثم أحداث input/change كما لو كتبها المستخدم
+    Object.getOwnPropertyDescriptor(HTMLInputElement.prototype, 'value').set.call(input, amount);
+    input.dispatchEvent(new Event('input', {bubbles: true}));
+    input.dispatchEvent(new Event('change', {bubbles: true}));
+    state.changed.push('amount');
+}
+return state;
+"""
+
+
+def normalize_asset(name: str | None) -> str:
+    # "EUR/USD (OTC)" و "EURUSD_otc" نفس الأصل
+    return re.sub(r"[^A-Z0-9]", "", (name or "").upper())
+
+
+def normalize_duration(label: str | None) -> str:
+    # "00:01:00" و "1:00" نفس المدة
+    return re.sub(r"^[0:]+(?=\d)", "", (label or "").strip())
+
+
+class TicketState:
+    # ما تعرضه تذكرة الصفقة الآن؛ كل خطوة تُنفَّذ فقط إذا لم تكن الحالة المطلوبة قائمة بالفعل
+    def __init__(self, asset: str | None, duration: str | None, amount: str | None, changed: list | None = None):
+        self.asset = asset
+        self.duration = duration
+        self.amount = amount
+        self.changed = changed or []
+
+    @classmethod
+    def sync(cls, driver: webdriver.Chrome, duration: str | None = None, amount=None, force: bool = False) -> "TicketState":
+        # duration/amount = None: قراءة فقط؛ الحالة المُرجعة هي ما قبل التطبيق، و changed ما طُبق
+        result = driver.execute_script(
+            SYNC_TICKET_JS, ASSET_SELECTOR_BUTTON_CSS, TIME_SELECTOR_BUTTON_CSS, AMOUNT_INPUT_CSS,
+            DURATION_BUTTON_XPATHS.get(duration), DURATION_LABELS.get(duration, ""),
+            None if amount is None else str(amount), force
+        ) or {}
+        return cls(result.get("asset"), result.get("duration"), result.get("amount"), result.get("changed"))
+
+    def has_asset(self, asset: str) -> bool:
+        return bool(self.asset) and normalize_asset(self.asset) == normalize_asset(asset)
+
+    def has_duration(self, duration: str) -> bool:
+        return duration in DURATION_LABELS and normalize_duration(self.duration) == normalize_duration(DURATION_LABELS[duration])
+
+    def has_amount(self, amount) -> bool:
+        try:
+            return self.amount is not None and float(self.amount) == float(amount)
+        except ValueError:
+            return False
+
+    def satisfies(self, asset: str | None = None, duration: str | None = None, amount=None) -> bool:
+        return ((asset is None or self.has_asset(asset)) and (duration is None or self.has_duration(duration))
+                and (amount is None or self.has_amount(amount)))
+
+    def __repr__(self) -> str:
+        return f"TicketState(asset={self.asset!r}, duration={self.duration!r}, amount={self.amount!r})"
+
+
+def wait_for_ticket(driver: webdriver.Chrome, timeout: float, asset: str | None = None, duration: str | None = None,
+                    amount=None) -> TicketState:
+    # انتظار مبني على الحدث بدل sleep ثابت: يعود فور ظهور الحالة المطلوبة في الصفحة
+    def satisfied(d):
+        state = TicketState.sync(d)
+        return state if state.satisfies(asset, duration, amount) else False
+    return WebDriverWait(driver, timeout, poll_frequency=POLL_S).until(satisfied)
+
+
 def setup_browser(headless: bool = True, browser_type: str = "chrome") -> webdriver.Chrome | None:
     try:
         # print(f"Quotex: Setting up {browser_type} browser (headless={headless})...")
@@ -50,22 +140,23 @@ def setup_browser(headless: bool = True, browser_type: str = "chrome") -> webdri
         print(f"Quotex: Error setting up browser: {e}")
         return None
 
-def login_quotex(driver: webdriver.Chrome, email: str, password: str, timeout: int = 30) -> bool:
+@timed_step("login")
+def login_quotex(driver: webdriver.Chrome, email: str, password: str, timeout: int = 30, login_url: str = LOGIN_URL) -> bool:
     if not driver: return False
     try:
-        # print(f"Quotex: Navigating to login page: {LOGIN_URL}")
-        driver.get(LOGIN_URL)
-        
-        WebDriverWait(driver, timeout).until(
+        # print(f"Quotex: Navigating to login page: {login_url}")
+        driver.get(login_url)
+
+        WebDriverWait(driver, timeout, poll_frequency=POLL_S).until(
             EC.visibility_of_element_located((By.NAME, EMAIL_INPUT_NAME))
         ).send_keys(email)
         # print("Quotex: Email entered.")
 
         driver.find_element(By.NAME, PASSWORD_INPUT_NAME).send_keys(password)
         # print("Quotex: Password entered.")
-        
+
         try:
-            login_button = WebDriverWait(driver, 5).until(
+            login_button = WebDriverWait(driver, 5, poll_frequency=POLL_S).until(
                 EC.element_to_be_clickable((By.XPATH, "//button[@type='submit' and (contains(normalize-space(),'Sign in') or contains(normalize-space(),'Log In'))]"))
             )
             login_button.click()
@@ -74,7 +165,7 @@ def login_quotex(driver: webdriver.Chrome, email: str, password: str, timeout: i
             # print("Quotex: Login button not found by XPATH, attempting submit on password field.")
             driver.find_element(By.NAME, PASSWORD_INPUT_NAME).submit()
 
-        WebDriverWait(driver, timeout).until(
+        WebDriverWait(driver, timeout, poll_frequency=POLL_S).until(
             EC.presence_of_element_located((By.XPATH, LOGIN_SUCCESS_INDICATOR_XPATH))
         )
         print("Quotex: Login successful.")
@@ -86,112 +177,137 @@ def login_quotex(driver: webdriver.Chrome, email: str, password: str, timeout: i
         print(f"Quotex: Error during login: {e}")
     return False
 
-def select_asset(driver: webdriver.Chrome, asset_name_quotex: str, timeout: int = 15) -> bool:
+@timed_step("select_asset")
+def select_asset(driver: webdriver.Chrome, asset_name_quotex: str, timeout: int = 15, force: bool = False) -> bool:
     if not driver: return False
     try:
+        if not force and TicketState.sync(driver).has_asset(asset_name_quotex):
+            return True # الأصل معروض بالفعل: لا حاجة لفتح نافذة البحث
         # print(f"Quotex: Selecting asset '{asset_name_quotex}'...")
-        WebDriverWait(driver, timeout).until(
+        WebDriverWait(driver, timeout, poll_frequency=POLL_S).until(
             EC.element_to_be_clickable((By.CSS_SELECTOR, ASSET_SELECTOR_BUTTON_CSS))
         ).click()
 
-        WebDriverWait(driver, timeout).until(
-            EC.visibility_of_element_located((By.CSS_SELECTOR, ASSET_SEARCH_MODAL_CSS))
+        search_input = WebDriverWait(driver, timeout, poll_frequency=POLL_S).until(
+            EC.visibility_of_element_located((By.CSS_SELECTOR, ASSET_SEARCH_INPUT_CSS))
         )
-        
-        search_input = driver.find_element(By.CSS_SELECTOR, ASSET_SEARCH_INPUT_CSS)
         search_input.clear()
         search_input.send_keys(asset_name_quotex) # Quotex عادة لا تستخدم "/" في البحث
-        time.sleep(0.5) 
 
         # يجب أن يكون asset_name_quotex هو النص المعروض في القائمة (مثل "EUR/USD" أو "EURUSD")
+        # الانتظار حتى تظهر النتيجة قابلة للنقر يغني عن sleep بعد الكتابة
         asset_xpath = ASSET_SEARCH_RESULT_XPATH_TEMPLATE.format(asset_name_quotex)
-        WebDriverWait(driver, timeout).until(
+        WebDriverWait(driver, timeout, poll_frequency=POLL_S).until(
             EC.element_to_be_clickable((By.XPATH, asset_xpath))
         ).click()
+        # بدل sleep: انتظار أن يعرض زر الأصل الأصل الجديد
+        wait_for_ticket(driver, timeout, asset=asset_name_quotex)
         # print(f"Quotex: Asset '{asset_name_quotex}' selected.")
-        time.sleep(0.5) 
         return True
     except Exception as e:
         print(f"Quotex: Error selecting asset '{asset_name_quotex}': {type(e).__name__} - {e}")
     return False
 
-def set_trade_duration(driver: webdriver.Chrome, duration_str: str, timeout: int = 10) -> bool:
+def apply_ticket(driver: webdriver.Chrome, duration: str | None, amount, timeout: int = 10, force: bool = False,
+                 state: TicketState | None = None) -> bool:
+    # المدة و/أو المبلغ في execute_script واحد (state: نتيجة sync أُجريت بالفعل)؛ الانتظار فقط إذا تغير شيء فعلًا
+    if duration is not None and duration not in DURATION_BUTTON_XPATHS:
+        print(f"Quotex: Duration '{duration}' not directly supported for automated click. Please adapt.")
+        return False
+    if state is None:
+        state = TicketState.sync(driver, duration, amount, force)
+    if state.duration is None and "duration" in state.changed:
+        duration = None # لا يوجد TIME_SELECTOR_BUTTON_CSS يعرض المدة الحالية: نكتفي بالنقر كما في السابق (لا تخطٍّ ولا تحقق)
+    if state.changed:
+        wait_for_ticket(driver, timeout, duration=duration, amount=amount)
+        return True
+    if state.satisfies(duration=duration, amount=amount):
+        return True
+    print(f"Quotex: Could not set duration '{duration}' / amount {amount}: ticket controls not found.")
+    return False
+
+@timed_step("set_trade_duration")
+def set_trade_duration(driver: webdriver.Chrome, duration_str: str, timeout: int = 10, force: bool = False) -> bool:
     if not driver: return False
     # هذا الجزء يعتمد بشدة على كيفية اختيار المدة في Quotex
     # قد يكون هناك أزرار محددة ("1m", "5m") أو قائمة منسدلة أو حقل إدخال
-    # المثال التالي يفترض وجود زر محدد لـ 1m (أو ما يعادله "1:00")
+    # المثال يفترض وجود زر محدد لكل مدة في DURATION_BUTTON_XPATHS (مثل "1:00")؛ قد تحتاج لفتح TIME_SELECTOR_BUTTON_CSS أولًا
     try:
         # print(f"Quotex: Setting trade duration to '{duration_str}'...")
-        # انقر لفتح قائمة اختيار المدة إذا كانت موجودة
-        # WebDriverWait(driver, timeout).until(
-        #     EC.element_to_be_clickable((By.CSS_SELECTOR, TIME_SELECTOR_BUTTON_CSS))
-        # ).click()
-        
-        # اختر المدة (هذا مثال لـ 1m، قد تحتاج لتعديله)
-        if duration_str == "1m": # أو أي مدة أخرى تدعمها
-            duration_button_xpath = DURATION_1M_BUTTON_XPATH # مثال لـ 1m
-            WebDriverWait(driver, timeout).until(
-                EC.element_to_be_clickable((By.XPATH, duration_button_xpath))
-            ).click()
-            # print(f"Quotex: Duration '{duration_str}' set.")
-            return True
-        else:
-            print(f"Quotex: Duration '{duration_str}' not explicitly supported by this function's example. Please adapt.")
-            return False # أو حاول إدخالها بطريقة أخرى إذا كانت الواجهة تسمح
-            
+        return apply_ticket(driver, duration_str, None, timeout, force)
     except Exception as e:
         print(f"Quotex: Error setting duration '{duration_str}': {e}")
     return False
 
-def set_trade_amount(driver: webdriver.Chrome, amount: int, timeout: int = 10) -> bool:
+@timed_step("set_trade_amount")
+def set_trade_amount(driver: webdriver.Chrome, amount: int, timeout: int = 10, force: bool = False) -> bool:
     if not driver: return False
     try:
         # print(f"Quotex: Setting trade amount to {amount}...")
-        amount_field = WebDriverWait(driver, timeout).until(
-            EC.visibility_of_element_located((By.CSS_SELECTOR, AMOUNT_INPUT_CSS))
-        )
-        # طريقة موثوقة لمسح الحقل وإدخال القيمة
-        amount_field.click() # انقر أولاً لتنشيط الحقل
-        driver.execute_script(f"arguments[0].value = '{str(amount)}'; arguments[0].dispatchEvent(new Event('input'));", amount_field)
-        # print(f"Quotex: Amount {amount} set.")
-        time.sleep(0.2) # انتظر قليلاً لتحديث الواجهة
-        return True
+        return apply_ticket(driver, None, amount, timeout, force)
     except Exception as e:
         print(f"Quotex: Error setting amount {amount}: {e}")
     return False
 
-def place_trade(driver: webdriver.Chrome, asset: str, direction: str, amount: int, duration: str, timeout: int = 15) -> bool:
+@timed_step("prepare_trade")
+def prepare_trade(driver: webdriver.Chrome, asset: str, duration: str, amount: int, timeout: int = 15, force: bool = False) -> bool:
+    # تجهيز التذكرة (الأصل، المدة، المبلغ) دون النقر: جلسة مثبتة على أصل تُجهَّز مرة واحدة ثم يكفي النقر عند الإشارة
+    # التذكرة الجاهزة بالفعل = رحلة execute_script واحدة؛ force=True يعيد كل الخطوات
     if not driver: return False
+    # Quotex عادة ما يكون لديها أزرار مدة ثابتة. مثال 1m
+    if duration not in DURATION_BUTTON_XPATHS: # أو أي مدة أخرى تريد دعمها
+        print(f"Quotex: Duration '{duration}' not directly supported for automated click. Trade aborted.")
+        return False
     try:
-        # print(f"\nQuotex: Attempting trade -> {asset}, {direction.upper()}, Amt: {amount}, Dur: {duration}")
-        
-        if not select_asset(driver, asset, timeout): # asset هو asset_quotex_symbol
-            return False
-        
-        # Quotex عادة ما يكون لديها أزرار مدة ثابتة. مثال 1m
-        if duration == "1m": # أو أي مدة أخرى تريد دعمها
-            if not set_trade_duration(driver, "1m", timeout): # يستخدم الزر المحدد لـ 1m
-                 print(f"Quotex: Failed to set 1m duration. Trade aborted.")
-                 return False
-        else:
-            print(f"Quotex: Duration '{duration}' not directly supported for automated click. Trade aborted.")
+        # رحلة واحدة: قراءة الأصل وتطبيق المدة والمبلغ الناقصين
+        state = None if force else TicketState.sync(driver, duration, amount)
+        if state is not None and state.has_asset(asset):
+            return apply_ticket(driver, duration, amount, timeout, state=state)
+        # تغيير الأصل قد يعيد المدة أو المبلغ لقيمهما الافتراضية، فيُطبقان بعده
+        # (force=True في select_asset: الأصل المعروض معروف أنه مختلف فلا داعي لقراءته مجددًا)
+        if not select_asset(driver, asset, timeout, force=True): # asset هو asset_quotex_symbol
             return False
+        return apply_ticket(driver, duration, amount, timeout, force)
+    except Exception as e:
+        print(f"Quotex: Error preparing trade for {asset}: {type(e).__name__} - {e}")
+    return False
+
+@timed_step("health_check")
+def check_session(driver: webdriver.Chrome) -> bool:
+    # فحص سريع بلا انتظار: المتصفح يستجيب ومؤشر تسجيل الدخول وأزرار الصفقة موجودة (لم تنتهِ الجلسة)
+    if not driver: return False
+    try:
+        return bool(driver.find_elements(By.XPATH, LOGIN_SUCCESS_INDICATOR_XPATH)) and \
+            bool(driver.find_elements(By.CSS_SELECTOR, CALL_BUTTON_CSS))
+    except Exception as e:
+        print(f"Quotex: Session health check failed: {type(e).__name__} - {e}")
+    return False
 
-        if not set_trade_amount(driver, amount, timeout):
+@timed_step("click")
+def click_trade_button(driver: webdriver.Chrome, direction: str, timeout: int = 15) -> bool:
+    button_css = CALL_BUTTON_CSS if direction.lower() == "call" else PUT_BUTTON_CSS
+    WebDriverWait(driver, timeout, poll_frequency=POLL_S).until(
+        EC.element_to_be_clickable((By.CSS_SELECTOR, button_css))
+    ).click()
+    return True
+
+@timed_step("place_trade")
+def place_trade(driver: webdriver.Chrome, asset: str, direction: str, amount: int, duration: str, timeout: int = 15, force: bool = False) -> bool:
+    if not driver: return False
+    try:
+        # print(f"\nQuotex: Attempting trade -> {asset}, {direction.upper()}, Amt: {amount}, Dur: {duration}")
+
+        if not prepare_trade(driver, asset, duration, amount, timeout, force):
             return False
 
-        button_css = CALL_BUTTON_CSS if direction.lower() == "call" else PUT_BUTTON_CSS
-        trade_button = WebDriverWait(driver, timeout).until(
-            EC.element_to_be_clickable((By.CSS_SELECTOR, button_css))
-        )
-        trade_button.click()
+        click_trade_button(driver, direction, timeout)
         # print(f"Quotex: {direction.upper()} button clicked for {asset}.")
-        time.sleep(0.5) # انتظار قصير بعد النقر
+        # لا انتظار بعد النقر: لا شيء يُتحقق منه هنا، والصفقة التالية تنتظر حالة التذكرة التي تحتاجها
         # هنا يمكنك محاولة التحقق من أن الصفقة ظهرت في قائمة الصفقات المفتوحة
         # هذا الجزء معقد ويعتمد على واجهة Quotex
         print(f"Quotex: Trade for {asset} - {direction.upper()} presumed placed.")
         return True
-        
+
     except Exception as e:
         print(f"Quotex: Error placing trade for {asset}: {type(e).__name__} - {e}")
     return False
@@ -203,4 +319,40 @@ def close_browser(driver: webdriver.Chrome | None):
             driver.quit()
             # print("Quotex: Browser closed.")
         except Exception as e:
-            print(f"Quotex: Error closing browser: {e}")
\ No newline at end of file
+            print(f"Quotex: Error closing browser: {e}")
+
+
+if __name__ == "__main__":
+    # قياس زمن المنفذ دون اتصال على quotex_standin.html (نفس المعرفات وتأخيرات واجهة محاكاة):
+    # نفس الأصل (الحالة الشائعة لجلسة مثبتة) وأصل متغير في كل صفقة، مع force=True (كل الخطوات) مقابل التخطي
+    import argparse
+    import statistics
+    from pathlib import Path
+    from metrics import REGISTRY
+
+    parser = argparse.ArgumentParser(description="Benchmark the Quotex executor against the local stand-in page.")
+    parser.add_argument("--trades", type=int, default=10)
+    parser.add_argument("--visible", action="store_true", help="show the browser window")
+    args = parser.parse_args()
+
+    driver = setup_browser(headless=not args.visible)
+    if driver is None:
+        raise SystemExit("Quotex: Could not start Chrome for the stand-in benchmark.")
+    try:
+        if not login_quotex(driver, "bench@example.com", "bench", login_url=Path(STANDIN_PAGE).as_uri()):
+            raise SystemExit("Quotex: Stand-in login failed.")
+        assets = ["EURUSD", "GBPUSD", "USDJPY"]
+        for scenario in ("same_asset", "rotating_assets"):
+            for force in (True, False):
+                durations = []
+                for i in range(args.trades):
+                    asset = assets[0] if scenario == "same_asset" else assets[i % len(assets)]
+                    started = time.perf_counter()
+                    if not place_trade(driver, asset, "call" if i % 2 else "put", 1, "1m", force=force):
+                        raise SystemExit(f"Quotex: Stand-in trade failed ({scenario}, force={force}).")
+                    durations.append(time.perf_counter() - started)
+                print(f"{scenario:16} {'all steps' if force else 'stateful':10} median {statistics.median(durations) * 1000:7.1f} ms"
+                      f"  max {max(durations) * 1000:7.1f} ms")
+        print(REGISTRY.format_summary())
+    finally:
+        close_browser(driver)
@@ -0,0 +1,331 @@
+# quotex_pool.py
+# مجمع جلسات Quotex مسجلة الدخول مسبقًا لتنفيذ صفقات الدورة الواحدة بالتوازي:
+# - كل جلسة متصفح مستقل (WebDriver لا يقبل أوامر متزامنة، فالتبويبات في متصفح واحد تبقى متسلسلة) يعمل في مسار
+#   خيط خاص به ("quotex-0"، "quotex-1"، ...)، فتتوازى الجلسات وتبقى أوامر كل جلسة متسلسلة.
+# - الجلسة مثبتة على أصل: تُجهَّز مرة واحدة (الأصل، المدة، المبلغ) فيقتصر التنفيذ عند الإشارة على النقر. أصل بلا جلسة
+#   مثبتة يذهب لجلسة احتياطية (أو مستعارة) تُجهَّز له أولًا، ثم تعود الجلسة المستعارة لأصلها في الخلفية.
+# - فحص صحة دوري للجلسات الخاملة؛ جلسة فاشلة (فحص، تجهيز، نقر، مهلة) تُغلق ويعاد فتحها وتسجيل دخولها في الخلفية
+#   بتراجع أسي، بينما تخدم الجلسات الأخرى الأوامر.
+# - زمن الإشارة حتى النقر لكل صفقة في SIGNAL_TO_CLICK_SECONDS (path: "pinned" تحقق ثم نقر، "prepared" تجهيز ثم نقر).
+# دوال المتصفح تُمرَّر من الخارج (broker/quotex_executor أو بدائل وهمية) و run_blocking(fn, *args, lane=, timeout=).
+import asyncio
+import time
+
+try:
+    from metrics import SIGNAL_TO_CLICK_SECONDS
+except ImportError: # metrics.py اختياري: المجمع يعمل كما هو بلا زمن الإشارة حتى النقر
+    class _NoMetrics:
+        # ما يستخدمه هذا الملف من metrics (observe/items) بلا قياس
+        def observe(self, value, **labels): pass
+        def items(self): return []
+    SIGNAL_TO_CLICK_SECONDS = _NoMetrics()
+
+STARTING, READY, DEAD = "starting", "ready", "dead"
+
+
+class QuotexSession:
+    def __init__(self, index: int, pinned_asset: str | None):
+        self.index = index
+        self.lane = f"quotex-{index}"
+        self.pinned_asset = pinned_asset
+        self.driver = None
+        self.state = STARTING
+        self.busy = False
+        self.prepared = None  # (asset, duration, amount) المعروضة حاليًا في تذكرة الصفقة
+        self.logins = 0
+        self.trades = 0
+        self.failures = 0
+
+    def describe(self) -> str:
+        return f"#{self.index}{f' {self.pinned_asset}' if self.pinned_asset else ''} {'busy' if self.busy else self.state}"
+
+
+class QuotexSessionPool:
+    def __init__(self, run_blocking, setup_fn, login_fn, prepare_fn, click_fn, health_fn, close_fn,
+                 pinned_assets: list[str], size: int, duration: str, amount,
+                 login_timeout_s: float = 90, trade_timeout_s: float = 30, acquire_timeout_s: float = 90,
+                 health_interval_s: float = 60, relogin_backoff_s: float = 5, max_relogin_backoff_s: float = 300,
+                 on_ready=None):
+        # login_fn(driver) -> bool (بيانات الاعتماد مربوطة مسبقًا)؛ prepare_fn(driver, asset, duration, amount) -> bool؛
+        # click_fn(driver, direction) -> bool؛ health_fn(driver) -> bool؛ on_ready(session) بعد كل تسجيل دخول ناجح
+        self._run = run_blocking
+        self._setup, self._login, self._prepare_fn = setup_fn, login_fn, prepare_fn
+        self._click, self._health, self._close = click_fn, health_fn, close_fn
+        self.duration = duration
+        self.amount = amount
+        self.login_timeout_s = login_timeout_s
+        self.trade_timeout_s = trade_timeout_s
+        self.acquire_timeout_s = acquire_timeout_s
+        self.health_interval_s = health_interval_s
+        self.relogin_backoff_s = relogin_backoff_s
+        self.max_relogin_backoff_s = max_relogin_backoff_s
+        self._on_ready = on_ready
+        # أول `size` أصول تحصل على جلسات مثبتة؛ الجلسات الزائدة عن عدد الأصول احتياطية بلا تثبيت
+        self.sessions = [QuotexSession(i, pinned_assets[i] if i < len(pinned_assets) else None) for i in range(size)]
+        self._changed: asyncio.Event | None = None
+        self._tasks: set = set()
+        self._health_task: asyncio.Task | None = None
+        self.orders = 0
+        self.orders_failed = 0
+        self.orders_unserved = 0
+        self.orders_expired = 0
+        self.relogins = 0
+
+    # --- دورة حياة الجلسات ---
+    def start(self) -> None:
+        self._changed = asyncio.Event()
+        for session in self.sessions:
+            self._spawn(self._revive(session))
+        self._health_task = asyncio.get_running_loop().create_task(self._health_loop())
+
+    def _spawn(self, coro) -> None:
+        task = asyncio.get_running_loop().create_task(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    def _notify(self) -> None:
+        self._changed.set()
+
+    async def _call(self, session: QuotexSession, fn, *args, timeout: float | None = None):
+        return await self._run(fn, *args, lane=session.lane, timeout=self.trade_timeout_s if timeout is None else timeout)
+
+    async def _revive(self, session: QuotexSession) -> None:
+        # فتح متصفح جديد وتسجيل الدخول وتجهيز الأصل المثبت؛ يعيد المحاولة بتراجع أسي حتى ينجح
+        backoff = self.relogin_backoff_s
+        while True:
+            await self._discard_driver(session)
+            session.state, session.prepared = STARTING, None
+            try:
+                session.driver = await self._call(session, self._setup, timeout=self.login_timeout_s)
+                if session.driver and await self._call(session, self._login, session.driver, timeout=self.login_timeout_s):
+                    session.logins += 1
+                    if session.pinned_asset is None or await self._prepare(session, session.pinned_asset):
+                        session.state = READY
+                        print(f"Quotex pool: Session {session.describe()}.")
+                        self._notify()
+                        if self._on_ready is not None:
+                            self._on_ready(session)
+                        return
+            except Exception as e:
+                print(f"Quotex pool: Session #{session.index} start failed: {type(e).__name__} - {e}")
+            session.failures += 1
+            print(f"Quotex pool: Session #{session.index} not ready, retrying in {backoff:.0f}s.")
+            await asyncio.sleep(backoff)
+            backoff = min(self.max_relogin_backoff_s, backoff * 2)
+
+    async def _discard_driver(self, session: QuotexSession) -> None:
+        driver, session.driver = session.driver, None
+        if driver is not None:
+            try:
+                await self._call(session, self._close, driver)
+            except Exception as e:
+                print(f"Quotex pool: Error closing session #{session.index}: {e}")
+
+    def _mark_dead(self, session: QuotexSession, reason: str) -> None:
+        if session.state == DEAD:
+            return
+        print(f"Quotex pool: Session #{session.index} marked dead ({reason}); re-logging in in the background.")
+        session.state = DEAD
+        session.failures += 1
+        self.relogins += 1
+        self._spawn(self._revive(session))
+
+    async def _prepare(self, session: QuotexSession, asset: str) -> bool:
+        # يُستدعى حتى لو كانت التذكرة مجهزة: prepare_trade يتحقق من الصفحة برحلة واحدة ويتخطى ما هو قائم،
+        # فلا تُنقر صفقة على أصل خاطئ إذا أعاد الموقع تحميل الصفحة
+        ticket = (asset, self.duration, self.amount)
+        session.prepared = None
+        if await self._call(session, self._prepare_fn, session.driver, asset, self.duration, self.amount):
+            session.prepared = ticket
+            return True
+        return False
+
+    async def _restore(self, session: QuotexSession) -> None:
+        # جلسة مثبتة استُعيرت لأصل آخر: إعادتها لأصلها حتى تبقى إشارته التالية نقرة واحدة
+        if session.state != READY or session.busy or session.pinned_asset is None:
+            return
+        session.busy = True
+        try:
+            if not await self._prepare(session, session.pinned_asset):
+                self._mark_dead(session, f"could not restore {session.pinned_asset}")
+        except Exception as e:
+            self._mark_dead(session, f"{type(e).__name__} while restoring")
+        finally:
+            session.busy = False
+            self._notify()
+
+    async def _health_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.health_interval_s)
+            checks = [self._check(session) for session in self.sessions if session.state == READY and not session.busy]
+            await asyncio.gather(*checks)
+
+    async def _check(self, session: QuotexSession) -> None:
+        if session.state != READY or session.busy: # أخذها أمر بين جدولة الفحص وبدئه
+            return
+        session.busy = True
+        try:
+            healthy = await self._call(session, self._health, session.driver)
+        except Exception:
+            healthy = False
+        finally:
+            session.busy = False
+            self._notify()
+        if not healthy:
+            self._mark_dead(session, "health check failed")
+
+    # --- الأوامر ---
+    def _pick(self, asset: str) -> QuotexSession | None:
+        idle = [s for s in self.sessions if s.state == READY and not s.busy]
+        ticket = (asset, self.duration, self.amount)
+        for candidates in ([s for s in idle if s.prepared == ticket],
+                           [s for s in idle if s.pinned_asset is None],
+                           idle):
+            if candidates:
+                return candidates[0]
+        return None
+
+    async def _acquire(self, asset: str, timeout: float) -> QuotexSession | None:
+        deadline = time.monotonic() + timeout
+        while True:
+            session = self._pick(asset)
+            if session is not None:
+                session.busy = True
+                return session
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return None
+            self._changed.clear()
+            try:
+                await asyncio.wait_for(self._changed.wait(), remaining)
+            except asyncio.TimeoutError:
+                pass
+
+    async def execute(self, asset: str, direction: str, signal_at: float | None = None,
+                      deadline_at: float | None = None) -> bool | None:
+        # signal_at: time.time() لحظة توليد الإشارة (وإلا لحظة الاستدعاء)؛ deadline_at: لا انتظار لجلسة بعد هذا الوقت
+        # None = فات الموعد قبل النقر (انتظار جلسة أو تجهيزها)، فلم تُنفذ الصفقة
+        signal_at = time.time() if signal_at is None else signal_at
+        self.orders += 1
+        if deadline_at is not None and time.time() >= deadline_at:
+            self.orders_expired += 1
+            print(f"Quotex pool: {asset} {direction.upper()} past its deadline "
+                  f"({time.time() - signal_at:.1f}s after signal). Trade skipped.")
+            return None
+        wait_s = self.acquire_timeout_s if deadline_at is None else min(self.acquire_timeout_s, deadline_at - time.time())
+        session = await self._acquire(asset, wait_s)
+        if session is None:
+            print(f"Quotex pool: No ready session for {asset} within {max(0.0, wait_s):.0f}s. Trade skipped.")
+            if deadline_at is not None and time.time() >= deadline_at:
+                self.orders_expired += 1
+                return None
+            self.orders_unserved += 1
+            return False
+        borrowed = session.pinned_asset not in (None, asset)
+        try:
+            path = "pinned" if session.prepared == (asset, self.duration, self.amount) else "prepared"
+            if not await self._prepare(session, asset):
+                self.orders_failed += 1
+                self._mark_dead(session, f"trade for {asset} failed")
+                return False
+            if deadline_at is not None and time.time() >= deadline_at:
+                # التجهيز (select_asset) قد يستغرق ثوانٍ: لا نقر بعد الموعد، والتذكرة المجهزة تبقى للإشارة التالية
+                self.orders_expired += 1
+                print(f"Quotex pool: {asset} {direction.upper()} passed its deadline while preparing "
+                      f"({time.time() - signal_at:.1f}s after signal). Trade skipped.")
+                return None
+            clicked = await self._call(session, self._click, session.driver, direction)
+            if clicked:
+                session.trades += 1
+                SIGNAL_TO_CLICK_SECONDS.observe(time.time() - signal_at, path=path)
+                print(f"Quotex pool: {asset} {direction.upper()} clicked on session #{session.index} "
+                      f"({time.time() - signal_at:.2f}s after signal, {path}).")
+            else:
+                self.orders_failed += 1
+                self._mark_dead(session, f"trade for {asset} failed")
+            return bool(clicked)
+        except Exception as e:
+            self.orders_failed += 1
+            self._mark_dead(session, f"{type(e).__name__} during trade for {asset}")
+            return False
+        finally:
+            session.busy = False
+            self._notify()
+            if borrowed and session.state == READY:
+                self._spawn(self._restore(session))
+
+    async def aclose(self) -> None:
+        for task in [self._health_task, *self._tasks]:
+            if task is not None:
+                task.cancel()
+        await asyncio.gather(*[t for t in [self._health_task, *self._tasks] if t is not None], return_exceptions=True)
+        await asyncio.gather(*(self._discard_driver(session) for session in self.sessions))
+
+    # --- المراقبة ---
+    def stats(self) -> dict:
+        latency = {dict(key)["path"]: child for key, child in SIGNAL_TO_CLICK_SECONDS.items()}
+        return {"sessions": len(self.sessions), "ready": sum(s.state == READY for s in self.sessions),
+                "busy": sum(s.busy for s in self.sessions), "orders": self.orders, "failed": self.orders_failed,
+                "unserved": self.orders_unserved, "expired": self.orders_expired, "relogins": self.relogins,
+                "click_p50_s": {path: child.quantile(0.5) for path, child in latency.items()},
+                "click_p95_s": {path: child.quantile(0.95) for path, child in latency.items()},
+                "clicks": sum(s.trades for s in self.sessions)}
+
+    def format_stats(self) -> str:
+        s = self.stats()
+        latency = ", ".join(f"{path} p50 {s['click_p50_s'][path]:.2f}s p95 {s['click_p95_s'][path]:.2f}s"
+                            for path in s["click_p50_s"] if s["click_p50_s"][path] is not None)
+        return (f"{s['ready']}/{s['sessions']} sessions ready ({', '.join(x.describe() for x in self.sessions)}), "
+                f"{s['clicks']}/{s['orders']} orders clicked, {s['failed']} failed, {s['unserved']} unserved, "
+                f"{s['expired']} expired, {s['relogins']} re-logins{f'; signal→click {latency}' if latency else ''}")
+
+
+if __name__ == "__main__":
+    # متصفح وهمي بأزمنة تقريبية لخطوات Selenium: 5 إشارات في نفس الدورة، تنفيذ متسلسل بجلسة واحدة مقابل المجمع
+    import random
+
+    from execution import ExecutionLayer
+
+    STEP_S = {"setup": 1.0, "login": 1.5, "prepare": 0.6, "verify": 0.005, "click": 0.15, "health": 0.05}
+
+    def fake_setup(): time.sleep(STEP_S["setup"]); return {"alive": True}
+    def fake_login(driver): time.sleep(STEP_S["login"]); return True
+    def fake_prepare(driver, asset, duration, amount):
+        # مثل prepare_trade: تذكرة جاهزة = رحلة تحقق واحدة
+        time.sleep(STEP_S["verify"] if driver.get("ticket") == (asset, duration, amount) else STEP_S["prepare"])
+        driver["ticket"] = (asset, duration, amount)
+        return driver["alive"]
+    def fake_click(driver, direction): time.sleep(STEP_S["click"]); return driver["alive"]
+    def fake_health(driver): time.sleep(STEP_S["health"]); return driver["alive"]
+    def fake_close(driver): pass
+
+    def serial_place_trade(driver, asset, direction):
+        return fake_prepare(driver, asset, "1m", 1) and fake_click(driver, direction)
+
+    async def demo():
+        execution = ExecutionLayer({"browser": 1})
+        assets = ["EURUSD", "GBPUSD", "USDJPY", "AUDUSD", "USDCAD"]
+
+        driver = fake_setup()
+        started = time.time()
+        for asset in assets:
+            await execution.run_thread(serial_place_trade, driver, asset, "call", lane="browser")
+        print(f"Serial, one session: last click {time.time() - started:.2f}s after the signal")
+
+        pool = QuotexSessionPool(execution.run_thread, fake_setup, fake_login, fake_prepare, fake_click, fake_health,
+                                 fake_close, pinned_assets=assets[:4], size=4, duration="1m", amount=1,
+                                 health_interval_s=1.0, relogin_backoff_s=0.5)
+        pool.start()
+        while pool.stats()["ready"] < 4:
+            await asyncio.sleep(0.1)
+        started = time.time()
+        results = await asyncio.gather(*(pool.execute(asset, random.choice(["call", "put"]), started) for asset in assets))
+        print(f"Pool, 4 pinned sessions: last click {time.time() - started:.2f}s after the signal, results {results}")
+
+        pool.sessions[0].driver["alive"] = False  # جلسة انتهت: يكتشفها الفحص ويعيد تسجيل الدخول في الخلفية
+        await asyncio.sleep(6)
+        print(pool.format_stats())
+        await pool.aclose()
+        execution.shutdown()
+
+    asyncio.run(demo())
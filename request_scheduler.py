@@ -0,0 +1,201 @@
+# request_scheduler.py
+# مجدول مركزي أمام مصدر البيانات يحترم حدود رصيد TwelveData (في الدقيقة وفي اليوم).
+# - دلو رموز (token bucket) للحد الدقيقي + عداد يومي.
+# - طابور أولويات: أوامر /check التفاعلية قبل فحوصات الخلفية، وداخل كل أولوية الأقرب لإغلاق الشمعة أولًا.
+# - دمج الطلبات المكررة: طلبان بنفس المفتاح ينتظران نفس النتيجة.
+import asyncio
+import heapq
+import itertools
+import time
+from datetime import datetime, timezone
+
+from timeframes import next_candle_close
+
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BACKGROUND = 10
+
+
+class CreditBudgetExceeded(Exception):
+    pass
+
+
+class TokenBucket:
+    def __init__(self, capacity: float, refill_per_second: float):
+        self.capacity = capacity
+        self.refill_per_second = refill_per_second
+        self.tokens = capacity
+        self._updated = time.monotonic()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.refill_per_second)
+        self._updated = now
+
+    def available(self) -> float:
+        self._refill()
+        return self.tokens
+
+    def try_acquire(self, amount: float = 1) -> bool:
+        self._refill()
+        if self.tokens >= amount:
+            self.tokens -= amount
+            return True
+        return False
+
+    def time_until(self, amount: float = 1) -> float:
+        self._refill()
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) / self.refill_per_second
+
+    async def acquire(self, amount: float = 1) -> None:
+        while not self.try_acquire(amount):
+            await asyncio.sleep(self.time_until(amount))
+
+
+def candle_close_urgency(interval, now: float | None = None) -> float:
+    # عدد الثواني حتى إغلاق الشمعة الحالية: كلما كان أصغر كان تحديث الإطار أكثر إلحاحًا
+    now_s = time.time() if now is None else now
+    return next_candle_close(now_s, interval) - now_s
+
+
+class RequestScheduler:
+    def __init__(self, credits_per_minute: int = 8, credits_per_day: int = 800, max_in_flight: int = 8):
+        self.credits_per_minute = credits_per_minute
+        self.credits_per_day = credits_per_day
+        self.max_in_flight = max_in_flight
+        self._bucket = TokenBucket(credits_per_minute, credits_per_minute / 60.0)
+        self._heap: list = []
+        self._sequence = itertools.count()
+        self._pending: dict = {}  # key -> Future (في الطابور أو قيد التنفيذ)
+        self._wakeup = None
+        self._worker_task = None
+        self._in_flight = 0
+        self._day = None
+        self.credits_used_today = 0
+        self.credits_used_total = 0
+        self.requests_completed = 0
+        self.requests_failed = 0
+        self.requests_deduplicated = 0
+
+    # --- الرصيد اليومي ---
+    def _roll_day(self) -> None:
+        today = datetime.now(timezone.utc).date()
+        if today != self._day:
+            self._day = today
+            self.credits_used_today = 0
+
+    def credits_left_today(self) -> int:
+        self._roll_day()
+        return max(0, self.credits_per_day - self.credits_used_today)
+
+    def set_budget(self, credits_per_minute: int, credits_per_day: int) -> None:
+        # حصة هذه العملية من رصيد مفتاح مشترك (مثل عمّال sharding.py): تطبق على الطلبات التالية
+        self.credits_per_minute = credits_per_minute
+        self.credits_per_day = credits_per_day
+        self._bucket.capacity = credits_per_minute
+        self._bucket.refill_per_second = credits_per_minute / 60.0
+        self._bucket.tokens = min(self._bucket.tokens, credits_per_minute)
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    # --- الإرسال ---
+    def submit(self, key, request_fn, credits: int = 1, priority: int = PRIORITY_BACKGROUND,
+               urgency: float = 0.0) -> asyncio.Future:
+        # request_fn دالة بلا معاملات تُرجع coroutine؛ لا تُستدعى إلا عند توفر الرصيد
+        existing = self._pending.get(key)
+        if existing is not None and not existing.done():
+            self.requests_deduplicated += 1
+            return existing
+        if credits > self.credits_per_minute:
+            raise ValueError(f"Request needs {credits} credits but the minute budget is {self.credits_per_minute}.")
+
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending[key] = future
+        heapq.heappush(self._heap, (priority, urgency, next(self._sequence), key, request_fn, credits, future))
+        self._ensure_worker()
+        self._wakeup.set()
+        return future
+
+    async def run(self, key, request_fn, credits: int = 1, priority: int = PRIORITY_BACKGROUND,
+                  urgency: float = 0.0):
+        # shield حتى لا يُلغى الطلب المشترك إذا أُلغي أحد المنتظرين
+        return await asyncio.shield(self.submit(key, request_fn, credits, priority, urgency))
+
+    def _ensure_worker(self) -> None:
+        if self._wakeup is None:
+            self._wakeup = asyncio.Event()
+        if self._worker_task is None or self._worker_task.done():
+            self._worker_task = asyncio.create_task(self._worker())
+
+    async def _worker(self) -> None:
+        while True:
+            if not self._heap or self._in_flight >= self.max_in_flight:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+
+            priority, urgency, _, key, request_fn, credits, future = self._heap[0]
+            self._roll_day()
+            if credits and self.credits_used_today + credits > self.credits_per_day:
+                heapq.heappop(self._heap)
+                self._pending.pop(key, None)
+                self.requests_failed += 1
+                print(f"Scheduler: Daily credit budget exhausted ({self.credits_used_today}/{self.credits_per_day}), request {key} rejected.")
+                future.set_exception(CreditBudgetExceeded(f"Daily credit budget exhausted for {key}"))
+                continue
+            if credits and not self._bucket.try_acquire(credits):
+                # ننتظر تجدد الرصيد، لكن نستيقظ مبكرًا إذا وصل طلب بأولوية أعلى
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=self._bucket.time_until(credits))
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            heapq.heappop(self._heap)
+            self.credits_used_today += credits
+            self.credits_used_total += credits
+            self._in_flight += 1
+            asyncio.create_task(self._execute(key, request_fn, future))
+
+    async def _execute(self, key, request_fn, future: asyncio.Future) -> None:
+        try:
+            result = await request_fn()
+            self.requests_completed += 1
+            if not future.done():
+                future.set_result(result)
+        except Exception as e:
+            self.requests_failed += 1
+            if not future.done():
+                future.set_exception(e)
+        finally:
+            self._in_flight -= 1
+            if self._pending.get(key) is future:
+                del self._pending[key]
+            if self._wakeup is not None:
+                self._wakeup.set()
+
+    # --- المراقبة ---
+    def stats(self) -> dict:
+        self._roll_day()
+        return {
+            "credits_available_minute": int(self._bucket.available()),
+            "credits_per_minute": self.credits_per_minute,
+            "credits_used_today": self.credits_used_today,
+            "credits_left_today": self.credits_left_today(),
+            "credits_per_day": self.credits_per_day,
+            "queued": len(self._heap),
+            "in_flight": self._in_flight,
+            "completed": self.requests_completed,
+            "failed": self.requests_failed,
+            "deduplicated": self.requests_deduplicated,
+        }
+
+    def format_stats(self) -> str:
+        s = self.stats()
+        return (f"Credits: {s['credits_available_minute']}/{s['credits_per_minute']} this minute, "
+                f"{s['credits_left_today']}/{s['credits_per_day']} left today | "
+                f"Queue: {s['queued']} queued, {s['in_flight']} in flight | "
+                f"Done: {s['completed']} ok, {s['failed']} failed, {s['deduplicated']} deduplicated")
@@ -0,0 +1,105 @@
+# resampler.py
+# بناء الأطر الزمنية الأعلى (30min, 1h, ...) محليًا من إطار أساسي واحد (15min) بدل تنزيل كل إطار على حدة.
+# المحاذاة على حدود UTC (epoch) مثل شموع المزود، والتجميع: open=الأول، high=الأعلى، low=الأدنى، close=الأخير، volume=المجموع.
+import numpy as np
+import pandas as pd
+
+from candle_store import COLUMNS, TIMESTAMP_COLUMN, arrays_to_frame, frame_to_arrays
+from timeframes import closed_candles, interval_to_seconds
+
+
+def plan_frames(frames: list) -> tuple[str, list, list]:
+    # يعيد (الإطار الأساسي، الأطر القابلة للاشتقاق منه، الأطر التي يجب جلبها من المصدر)
+    base = min(frames, key=interval_to_seconds)
+    base_s = interval_to_seconds(base)
+    derivable, remote = [], []
+    for frame in frames:
+        if frame == base:
+            continue
+        if interval_to_seconds(frame) % base_s == 0:
+            derivable.append(frame)
+        else:
+            remote.append(frame)
+    return base, derivable, remote
+
+
+def base_count_for(frames: list, count: int) -> int:
+    # عدد شموع الإطار الأساسي اللازمة لإنتاج count شمعة في أعلى إطار (+ دلو إضافي لتعويض البداية الناقصة)
+    base, derivable, _ = plan_frames(frames)
+    if not derivable:
+        return count
+    ratio = max(interval_to_seconds(f) for f in derivable) // interval_to_seconds(base)
+    return (count + 1) * ratio
+
+
+def resample_arrays(timestamps: np.ndarray, columns: dict[str, np.ndarray], target_interval,
+                    drop_partial_head: bool = True) -> tuple[np.ndarray, dict[str, np.ndarray]]:
+    target_ns = interval_to_seconds(target_interval) * 1_000_000_000
+    timestamps = np.asarray(timestamps, dtype="<i8")
+    if drop_partial_head and len(timestamps) and timestamps[0] % target_ns != 0:
+        # الدلو الأول لا يبدأ من حدّه الزمني: بياناته ناقصة ولا تطابق شمعة المزود
+        first_full = np.searchsorted(timestamps, (timestamps[0] // target_ns + 1) * target_ns)
+        timestamps = timestamps[first_full:]
+        columns = {col: np.asarray(columns[col])[first_full:] for col in COLUMNS}
+    if len(timestamps) == 0:
+        return timestamps, {col: np.empty(0) for col in COLUMNS}
+
+    buckets = (timestamps // target_ns) * target_ns
+    starts = np.flatnonzero(np.r_[True, buckets[1:] != buckets[:-1]])
+    ends = np.r_[starts[1:], len(timestamps)]
+    out = {
+        "open": np.asarray(columns["open"])[starts],
+        "high": np.maximum.reduceat(np.asarray(columns["high"]), starts),
+        "low": np.minimum.reduceat(np.asarray(columns["low"]), starts),
+        "close": np.asarray(columns["close"])[ends - 1],
+        "volume": np.add.reduceat(np.asarray(columns["volume"]), starts),
+    }
+    return buckets[starts], out
+
+
+def resample_ohlcv(df: pd.DataFrame, target_interval) -> pd.DataFrame | None:
+    if df is None or df.empty:
+        return None
+    timestamps, columns = frame_to_arrays(df)
+    out_ts, out_cols = resample_arrays(timestamps, columns, target_interval)
+    if len(out_ts) == 0:
+        return None
+    return arrays_to_frame({TIMESTAMP_COLUMN: out_ts, **out_cols})
+
+
+def derive_frame_from_store(store, source: str, symbol: str, base_interval, target_interval,
+                            count: int) -> pd.DataFrame | None:
+    # تحديث تزايدي: نعيد تجميع الشموع الأساسية بدءًا من آخر دلو مشتق مخزن فقط،
+    # فيُحدَّث الدلو الأخير في مكانه وتُلحق الدلاء الجديدة دون إعادة حساب التاريخ كله
+    last_derived = store.last_timestamp(source, symbol, target_interval)
+    if last_derived is None:
+        ratio = interval_to_seconds(target_interval) // interval_to_seconds(base_interval)
+        base = store.read_arrays(source, symbol, base_interval, count=(count + 1) * ratio)
+    else:
+        base = store.read_arrays(source, symbol, base_interval, start=last_derived)
+    if base is None or len(base[TIMESTAMP_COLUMN]) == 0:
+        return store.read(source, symbol, target_interval, count=count)
+
+    out_ts, out_cols = resample_arrays(base[TIMESTAMP_COLUMN], base, target_interval)
+    if len(out_ts):
+        store.append(source, symbol, target_interval, arrays_to_frame({TIMESTAMP_COLUMN: out_ts, **out_cols}))
+    return store.read(source, symbol, target_interval, count=count)
+
+
+def derive_frames(base_df: pd.DataFrame | None, base_interval, target_intervals: list, count: int,
+                  store=None, source: str | None = None, symbol: str | None = None,
+                  closed_at: float | None = None) -> dict:
+    # base_df هو آخر ما تم جلبه للإطار الأساسي (ومخزن مسبقًا في store إن وُجد)
+    # closed_at: إسقاط الدلو الجاري عند هذا الوقت (ما زالت شموعه الأساسية تتكون)؛ None = إبقاؤه
+    derived = {}
+    for target in target_intervals:
+        if base_df is None or base_df.empty:
+            derived[target] = None
+        elif store is not None:
+            derived[target] = derive_frame_from_store(store, source, symbol, base_interval, target, count)
+        else:
+            resampled = resample_ohlcv(base_df, target)
+            derived[target] = resampled.tail(count) if resampled is not None else None
+        if closed_at is not None:
+            derived[target] = closed_candles(derived[target], target, closed_at)
+    return derived
@@ -0,0 +1,375 @@
+# sharding.py
+# وضع منسّق/عمّال لمسح عالم أصول كبير (مئات الأزواج):
+# - المنسّق يملك قائمة الأصول ومخرجات تيليجرام/Quotex، ويوزع الأصول على العمّال بـ rendezvous hashing
+#   (عند انضمام عامل أو سقوطه لا تنتقل إلا أصول ذلك العامل تقريبًا).
+# - الاتصال عبر طوابير multiprocessing.managers على TCP (نفس الجهاز أو عدة أجهزة): طابور نتائج واحد
+#   (عمّال -> منسّق) وطابور تحكم لكل عامل (منسّق -> عامل).
+# - كل عامل عملية مستقلة بذاكرته المؤقتة وحالة مؤشراته، يمسح حصته عند كل إغلاق شمعة ويرسل الإشارات مع نبضات حياة.
+# - المنسّق يدمج الإشارات: يقبل إشارة الأصل فقط من مالكه الحالي، ويزيل المكرر (الأصل، الاتجاه، وقت الإغلاق).
+# - BaseManager ينقل رسائل pickle، فمن يعرف المفتاح ويصل للمنفذ ينفذ كودًا على الجهاز: بلا مفتاح مُعد يولد المنسّق
+#   مفتاحًا عشوائيًا لكل تشغيل ويمرره لعمّاله المحليين عبر متغير بيئة، ويرفض الاستماع على عنوان غير محلي.
+import asyncio
+import hashlib
+import ipaddress
+import os
+import queue
+import secrets
+import socket
+import subprocess
+import threading
+import time
+from collections import OrderedDict
+from multiprocessing.managers import BaseManager
+
+DEFAULT_ADDRESS = ("127.0.0.1", 50555)
+AUTHKEY_ENV = "SIGNALBOT_SHARD_AUTHKEY" # مفتاح التشغيل الحالي (hex) للعمّال المحليين
+
+
+class _CoordinatorManager(BaseManager):
+    pass
+
+
+class _WorkerManager(BaseManager):
+    pass
+
+
+_WorkerManager.register("results")
+_WorkerManager.register("control")
+
+
+def parse_address(text: str) -> tuple[str, int]:
+    host, _, port = text.rpartition(":")
+    return host or DEFAULT_ADDRESS[0], int(port)
+
+
+def is_loopback(host: str) -> bool:
+    if host == "localhost":
+        return True
+    try:
+        return ipaddress.ip_address(host).is_loopback
+    except ValueError:
+        return False
+
+
+def worker_authkey(configured: bytes | None) -> bytes:
+    # عامل محلي يرث مفتاح المنسّق من البيئة؛ عامل على جهاز آخر يحتاج المفتاح المشترك المُعد
+    inherited = os.environ.get(AUTHKEY_ENV)
+    if inherited:
+        return bytes.fromhex(inherited)
+    if not configured:
+        raise ValueError(f"No shard authkey: set SHARD_AUTHKEY (the coordinator's shared key) or {AUTHKEY_ENV}.")
+    return configured
+
+
+def _owner_weight(worker_id: str, asset_name: str) -> bytes:
+    return hashlib.blake2b(f"{worker_id}|{asset_name}".encode(), digest_size=8).digest()
+
+
+def assign_shards(asset_names: list[str], worker_ids: list[str]) -> dict[str, str]:
+    # rendezvous hashing: مالك كل أصل هو العامل صاحب أعلى وزن (اسم العامل، اسم الأصل)
+    if not worker_ids:
+        return {}
+    return {name: max(worker_ids, key=lambda worker_id: _owner_weight(worker_id, name)) for name in asset_names}
+
+
+class ShardCoordinator:
+    def __init__(self, assets: list[dict], address: tuple[str, int] = DEFAULT_ADDRESS, authkey: bytes | None = None,
+                 worker_timeout_s: float = 20.0, dedupe_history: int = 10_000):
+        # authkey None: مفتاح عشوائي لهذا التشغيل (عمّال محليون فقط)؛ عنوان غير محلي يتطلب مفتاحًا مشتركًا مُعدًا
+        if not authkey and not is_loopback(address[0]):
+            raise ValueError(f"Refusing to listen on {address[0]} without a shared authkey (set SHARD_AUTHKEY).")
+        self.assets = {a["COMMON_NAME"]: a for a in assets}
+        self.address = address
+        self.authkey = authkey or secrets.token_bytes(32)
+        self.worker_timeout_s = worker_timeout_s
+        self._results: queue.Queue = queue.Queue()
+        self._controls: dict[str, queue.Queue] = {}
+        self._controls_lock = threading.Lock()
+        self._server = None
+        self._local_workers: list[subprocess.Popen] = []
+        self.workers: dict[str, dict] = {}  # worker_id -> {"last_seen", "assets", "scans", "scan_s"}
+        self.owner: dict[str, str] = {}
+        self.epoch = 0
+        self._seen: OrderedDict = OrderedDict()
+        self._dedupe_history = dedupe_history
+        self.signals_accepted = 0
+        self.signals_rejected = 0
+        self.signals_duplicate = 0
+        self.rebalances = 0
+        self.assets_moved = 0
+
+    # --- الخادم ---
+    def _control_queue(self, worker_id: str) -> queue.Queue:
+        with self._controls_lock:
+            return self._controls.setdefault(worker_id, queue.Queue())
+
+    def start(self) -> None:
+        # خادم الطوابير في خيط داخل عملية المنسّق: المنسّق يقرأ الطوابير مباشرة والعمّال عبر proxies
+        _CoordinatorManager.register("results", callable=lambda: self._results)
+        _CoordinatorManager.register("control", callable=self._control_queue)
+        manager = _CoordinatorManager(address=self.address, authkey=self.authkey)
+        self._server = manager.get_server()
+        self.address = self._server.address  # المنفذ الفعلي إذا طُلب المنفذ 0
+        threading.Thread(target=self._server.serve_forever, name="shard-server", daemon=True).start()
+        print(f"Sharding: Coordinator listening on {self.address[0]}:{self.address[1]} for {len(self.assets)} assets.")
+
+    def spawn_local_workers(self, count: int, command: list[str]) -> None:
+        # command: سطر تشغيل عامل (مثلًا [python, main.py, --shard-worker, host:port])؛ المفتاح في البيئة لا في سطر الأوامر
+        env = {**os.environ, AUTHKEY_ENV: self.authkey.hex()}
+        for _ in range(count):
+            self._local_workers.append(subprocess.Popen(command, env=env))
+
+    def stop(self) -> None:
+        for worker_id in list(self.workers):
+            self._control_queue(worker_id).put({"type": "stop"})
+        for process in self._local_workers:
+            try:
+                process.wait(timeout=5)
+            except subprocess.TimeoutExpired:
+                process.terminate()
+        self._local_workers.clear()
+        if self._server is not None:
+            self._server.stop_event.set()
+
+    # --- العضوية وإعادة التوزيع ---
+    def _rebalance(self, reason: str) -> None:
+        owner = assign_shards(sorted(self.assets), sorted(self.workers))
+        moved = sum(1 for name, worker_id in owner.items() if self.owner.get(name) != worker_id)
+        self.owner = owner
+        self.epoch += 1
+        self.rebalances += 1
+        self.assets_moved += moved
+        shards = {worker_id: [] for worker_id in self.workers}
+        for name, worker_id in owner.items():
+            shards[worker_id].append(self.assets[name])
+        for worker_id, shard in shards.items():
+            self.workers[worker_id]["assets"] = len(shard)
+            self._control_queue(worker_id).put({"type": "assign", "epoch": self.epoch, "assets": shard,
+                                                "workers": len(self.workers)})
+        print(f"Sharding: Rebalanced ({reason}) epoch {self.epoch}: {len(self.workers)} workers, {moved} assets moved, "
+              f"shard sizes {sorted(len(s) for s in shards.values())}.")
+
+    def _expire_workers(self, now: float) -> None:
+        dead = [w for w, info in self.workers.items() if now - info["last_seen"] > self.worker_timeout_s]
+        for worker_id in dead:
+            del self.workers[worker_id]
+            with self._controls_lock:
+                self._controls.pop(worker_id, None)
+        if dead:
+            self._rebalance(f"lost {', '.join(dead)}")
+
+    def handle(self, message: dict, now: float | None = None) -> list:
+        # يرجع الإشارات المقبولة من هذه الرسالة (للإرسال إلى تيليجرام/Quotex)
+        now = time.time() if now is None else now
+        worker_id, kind = message["worker"], message["type"]
+        if kind == "leave":
+            if self.workers.pop(worker_id, None) is not None:
+                self._rebalance(f"{worker_id} left")
+            return []
+        if worker_id not in self.workers:
+            # انضمام (أو عامل عاد بعد اعتباره ساقطًا)
+            self.workers[worker_id] = {"last_seen": now, "assets": 0, "scans": 0, "scan_s": 0.0}
+            self._rebalance(f"{worker_id} joined")
+        info = self.workers[worker_id]
+        info["last_seen"] = now
+        if kind != "signals":
+            return []
+        info["scans"] += 1
+        info["scan_s"] = message.get("scan_s", 0.0)
+        accepted = []
+        for signal in message["signals"]:
+            name = signal["asset_common_name"]
+            if self.owner.get(name) != worker_id:
+                self.signals_rejected += 1  # إشارة من مالك سابق أثناء انتقال الأصل
+                continue
+            if message.get("close_time") is not None:
+                # close_time = None: مسح أولي عند انضمام العامل، لا يرتبط بإغلاق محدد
+                key = (name, signal["direction"], message["close_time"])
+                if key in self._seen:
+                    self.signals_duplicate += 1
+                    continue
+                self._seen[key] = None
+                if len(self._seen) > self._dedupe_history:
+                    self._seen.popitem(last=False)
+            self.signals_accepted += 1
+            accepted.append(signal)
+        return accepted
+
+    async def run(self, on_signals) -> None:
+        # on_signals: coroutine تستقبل قائمة الإشارات المدمجة (dispatch_signals في main.py)
+        while True:
+            try:
+                message = await asyncio.to_thread(self._results.get, True, 1.0)
+            except queue.Empty:
+                message = None
+            now = time.time()
+            signals = self.handle(message, now) if message is not None else []
+            self._expire_workers(now)
+            if signals:
+                close_time = message.get("close_time")
+                lag = f", close-to-merge lag {now - close_time:.2f}s" if close_time else ""
+                print(f"Sharding: {len(signals)} signals from {message['worker']}{lag}")
+                await on_signals(signals)
+
+    def stats(self) -> dict:
+        return {"workers": len(self.workers), "epoch": self.epoch, "rebalances": self.rebalances,
+                "assets_moved": self.assets_moved, "accepted": self.signals_accepted,
+                "rejected": self.signals_rejected, "duplicates": self.signals_duplicate,
+                "shards": {w: info["assets"] for w, info in self.workers.items()}}
+
+    def format_stats(self) -> str:
+        s = self.stats()
+        return (f"{s['workers']} workers (shards {sorted(s['shards'].values())}), epoch {s['epoch']}, "
+                f"{s['accepted']} signals merged, {s['rejected']} from stale owners, {s['duplicates']} duplicates")
+
+
+class ShardWorker:
+    # wait_fn: coroutine ترجع (close_time, closed_frames) عند الإغلاق التالي (CandleCloseScheduler.wait)
+    # scan_fn: coroutine (assets, closed_frames) -> قائمة إشارات، بذاكرة وحالة مؤشرات هذه العملية
+    # on_assign: دالة (assets, workers) اختيارية لتعديل حصة رصيد API لهذا العامل
+    def __init__(self, address: tuple[str, int], authkey: bytes, wait_fn, scan_fn, on_assign=None,
+                 heartbeat_s: float = 5.0, worker_id: str | None = None):
+        self.address = address
+        self.authkey = authkey
+        self.wait_fn = wait_fn
+        self.scan_fn = scan_fn
+        self.on_assign = on_assign
+        self.heartbeat_s = heartbeat_s
+        self.worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}"
+        self.assets: list[dict] = []
+        self.epoch = 0
+        self._stopped = False
+        self._added: list[dict] = []  # أصول انتقلت إلى هذا العامل ولم تُمسح بعد
+        self._assigned = asyncio.Event()
+        self.scans = 0
+        self._results = None
+        self._control = None
+
+    def _connect(self) -> None:
+        manager = _WorkerManager(address=self.address, authkey=self.authkey)
+        manager.connect()
+        self._results = manager.results()
+        self._control = manager.control(self.worker_id)
+
+    async def _send(self, message: dict) -> None:
+        await asyncio.to_thread(self._results.put, {"worker": self.worker_id, **message})
+
+    def _apply_control(self, message: dict) -> None:
+        if message["type"] == "stop":
+            self._stopped = True
+            self._assigned.set()
+        elif message["type"] == "assign" and message["epoch"] > self.epoch:
+            self.epoch = message["epoch"]
+            known = {a["COMMON_NAME"] for a in self.assets}
+            self._added += [a for a in message["assets"] if a["COMMON_NAME"] not in known]
+            self.assets = message["assets"]
+            self._assigned.set()
+            if self.on_assign is not None:
+                self.on_assign(self.assets, message["workers"])
+            print(f"Shard worker {self.worker_id}: epoch {self.epoch}, {len(self.assets)} assets.")
+
+    async def _control_loop(self) -> None:
+        while not self._stopped:
+            try:
+                self._apply_control(await asyncio.to_thread(self._control.get, True, 1.0))
+            except queue.Empty:
+                pass
+
+    async def _heartbeat_loop(self) -> None:
+        while not self._stopped:
+            await self._send({"type": "heartbeat", "epoch": self.epoch})
+            await asyncio.sleep(self.heartbeat_s)
+
+    async def _scan(self, assets: list[dict], closed_frames, close_time, send: bool = True) -> None:
+        started = time.perf_counter()
+        try:
+            signals = await self.scan_fn(assets, closed_frames)
+        except Exception as e:
+            # دورة فاشلة لا توقف العامل؛ النبضات مستمرة فلا تنتقل أصوله إلى عامل آخر
+            print(f"Shard worker {self.worker_id}: Scan failed: {type(e).__name__}: {e}")
+            return
+        self.scans += 1
+        await self._send({"type": "signals", "epoch": self.epoch, "close_time": close_time,
+                          "signals": signals if send else [], "scan_s": time.perf_counter() - started})
+
+    async def run(self) -> None:
+        await asyncio.to_thread(self._connect)
+        await self._send({"type": "join"})
+        background = [asyncio.create_task(self._control_loop()), asyncio.create_task(self._heartbeat_loop())]
+        close_task = None
+        try:
+            while not self._stopped:
+                if close_task is None:
+                    close_task = asyncio.ensure_future(self.wait_fn())
+                assigned_task = asyncio.ensure_future(self._assigned.wait())
+                await asyncio.wait({close_task, assigned_task}, return_when=asyncio.FIRST_COMPLETED)
+                assigned_task.cancel()
+                if self._stopped:
+                    break
+                if self._assigned.is_set():
+                    # أصول جديدة تُمسح فورًا بدل انتظار الإغلاق التالي، فتصبح حالتها جاهزة عنده؛ إشاراتها تُرسل
+                    # فقط في أول توزيع (مثل المسح الأولي عند تشغيل البوت)، أما بعد إعادة التوزيع فقد أرسلها مالكها السابق
+                    self._assigned.clear()
+                    added, self._added = self._added, []
+                    if added:
+                        await self._scan(added, None, None, send=self.scans == 0)
+                if close_task.done():
+                    close_time, closed_frames = close_task.result()
+                    close_task = None
+                    if self.assets:
+                        await self._scan(self.assets, closed_frames, close_time)
+        finally:
+            for task in background + ([close_task] if close_task is not None else []):
+                task.cancel()
+            if not self._stopped:
+                try:
+                    await self._send({"type": "leave"})
+                except (OSError, EOFError):
+                    pass
+
+if __name__ == "__main__":
+    # عرض محلي: منسّق بـ 600 أصل وهمي، عمّال يمسحون حصتهم بكلفة ثابتة لكل أصل (محاكاة)، انضمام وسقوط عامل
+    import sys
+
+    DEMO_COST_PER_ASSET_S = 0.002
+    DEMO_CYCLE_S = 0.5
+
+    async def demo_worker(address):
+        async def wait_fn():
+            await asyncio.sleep(DEMO_CYCLE_S)
+            return time.time(), ["15min"]
+
+        async def scan_fn(assets, closed_frames):
+            await asyncio.sleep(DEMO_COST_PER_ASSET_S * len(assets))  # fetch + تحليل وهمي
+            return [{"asset_common_name": a["COMMON_NAME"], "asset_quotex_symbol": a["COMMON_NAME"], "direction": "call"}
+                    for a in assets if hash((a["COMMON_NAME"], int(time.time() / DEMO_CYCLE_S))) % 97 == 0]
+
+        await ShardWorker(address, worker_authkey(None), wait_fn, scan_fn, heartbeat_s=0.5).run()
+
+    async def demo_coordinator():
+        assets = [{"COMMON_NAME": f"SYM{i:04d}"} for i in range(600)]
+        coordinator = ShardCoordinator(assets, ("127.0.0.1", 0), worker_timeout_s=2.0)
+        coordinator.start()
+        command = [sys.executable, os.path.abspath(__file__), "--worker", f"127.0.0.1:{coordinator.address[1]}"]
+        merged = []
+
+        async def on_signals(signals):
+            merged.extend(signals)
+
+        runner = asyncio.create_task(coordinator.run(on_signals))
+        coordinator.spawn_local_workers(2, command)
+        await asyncio.sleep(4)
+        coordinator.spawn_local_workers(1, command)  # عامل ينضم
+        await asyncio.sleep(4)
+        coordinator._local_workers[0].kill()  # عامل يسقط دون رسالة leave
+        await asyncio.sleep(5)
+        print(coordinator.format_stats())
+        for worker_id, info in coordinator.workers.items():
+            print(f"  {worker_id}: {info['assets']} assets, {info['scans']} scans, last scan {info['scan_s']:.2f}s")
+        coordinator.stop()
+        runner.cancel()
+
+    if len(sys.argv) > 2 and sys.argv[1] == "--worker":
+        asyncio.run(demo_worker(parse_address(sys.argv[2])))
+    else:
+        asyncio.run(demo_coordinator())
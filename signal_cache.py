@@ -0,0 +1,116 @@
+# signal_cache.py
+# ذاكرة مؤقتة محدودة (LRU + TTL) للإطارات المجلوبة ولنتائج الإشارة لكل إطار، يتشاركها background_analysis_loop و/check.
+# - المفتاح يتضمن (source, symbol, interval, توقيت آخر شمعة)، فشمعة جديدة = مفتاح جديد تلقائيًا.
+# - single-flight: طلبان متزامنان لنفس المفتاح ينتظران نفس الحساب بدل تكراره.
+# - عدادات hit/miss/evictions لكل ذاكرة تظهر في /status.
+# - القيم المخزنة محمية بقفل: signal_cache يُقرأ ويُكتب من حلقة الأحداث ومن خيط "analysis" معًا؛
+#   single-flight (_in_flight) يبقى على حلقة الأحداث وحدها.
+import asyncio
+import threading
+import time
+from collections import OrderedDict
+
+import pandas as pd
+
+MISSING = object()
+
+
+class TTLCache:
+    def __init__(self, name: str, max_entries: int = 1024, ttl_s: float | None = None):
+        self.name = name
+        self.max_entries = max_entries
+        self.ttl_s = ttl_s
+        self._entries: OrderedDict = OrderedDict()  # key -> (expires_at, value)
+        self._lock = threading.Lock()  # يحمي _entries والعدادات
+        self._in_flight: dict = {}  # key -> Future
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.coalesced = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def clear(self) -> None:
+        # حذف القيم المخزنة فقط؛ الحسابات الجارية (_in_flight) تكمل لمنتظريها
+        with self._lock:
+            self._entries.clear()
+
+    def lookup(self, key):
+        # يُرجع القيمة أو MISSING، ويحدّث ترتيب LRU والعدادات
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires_at, value = entry
+                if expires_at is None or expires_at > time.monotonic():
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._entries[key]
+                self.expirations += 1
+            self.misses += 1
+            return MISSING
+
+    def put(self, key, value, ttl_s: float | None = None) -> None:
+        ttl = self.ttl_s if ttl_s is None else ttl_s
+        with self._lock:
+            self._entries[key] = (None if ttl is None else time.monotonic() + ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    # --- single-flight ---
+    def pending(self, key) -> asyncio.Future | None:
+        future = self._in_flight.get(key)
+        if future is not None and not future.done():
+            self.coalesced += 1
+            return future
+        return None
+
+    def claim(self, key) -> asyncio.Future:
+        future = asyncio.get_running_loop().create_future()
+        self._in_flight[key] = future
+        return future
+
+    def resolve(self, key, value, store: bool = True) -> None:
+        if store:
+            self.put(key, value)
+        future = self._in_flight.pop(key, None)
+        if future is not None and not future.done():
+            future.set_result(value)
+
+    def fail(self, key, error: BaseException) -> None:
+        future = self._in_flight.pop(key, None)
+        if future is not None and not future.done():
+            future.set_exception(error)
+            # لا نريد تحذير "exception was never retrieved" إذا لم ينتظره أحد
+            future.exception()
+
+    def get_or_compute_sync(self, key, compute):
+        # compute يُشغل خارج القفل؛ خيطان على نفس المفتاح قد يحسبانه مرتين، والنتيجة واحدة
+        value = self.lookup(key)
+        if value is MISSING:
+            value = compute()
+            self.put(key, value)
+        return value
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses,
+                    "hit_rate": self.hits / lookups if lookups else 0.0, "evictions": self.evictions,
+                    "expirations": self.expirations, "coalesced": self.coalesced}
+
+    def format_stats(self) -> str:
+        s = self.stats()
+        return (f"{self.name}: {s['hit_rate']:.0%} hits ({s['hits']}/{s['hits'] + s['misses']}), "
+                f"{s['entries']} entries, {s['coalesced']} coalesced")
+
+
+def frame_fingerprint(df: pd.DataFrame | None) -> tuple | None:
+    # يميز محتوى النافذة دون تجزئتها كلها: الحدود وعدد الصفوف وقيم آخر شمعة (التي قد تكون قيد التكوين وتتغير)
+    if df is None or df.empty:
+        return None
+    return (df.index[0].value, df.index[-1].value, len(df), tuple(df.iloc[-1].to_numpy().tolist()))
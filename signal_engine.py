@@ -4,8 +4,16 @@ from ta.trend import EMAIndicator, MACD
 from ta.momentum import RSIIndicator, StochasticOscillator
 from ta.volume import OnBalanceVolumeIndicator
 from ta.volatility import BollingerBands, AverageTrueRange
-from strategy.candle_patterns import detect_candlestick_patterns
+from strategy.candle_patterns import candlestick_pattern_mask, decode_pattern_mask
+from indicator_engine import evaluate_signal_conditions
+from signal_rules import LastBarIndicators, RuleEvaluator
+try:
+    from metrics import INDICATOR_SECONDS
+    timed_indicators = INDICATOR_SECONDS.timed
+except ImportError: # metrics.py اختياري: الدوال تعمل كما هي بلا قياس
+    def timed_indicators(**labels): return lambda fn: fn
 
+@timed_indicators(function="generate_signals")
 def generate_signals(df: pd.DataFrame, timeframe: str) -> pd.DataFrame:
     df = df.copy()
 
@@ -36,8 +44,10 @@ def generate_signals(df: pd.DataFrame, timeframe: str) -> pd.DataFrame:
 
     df['atr'] = AverageTrueRange(df['high'], df['low'], df['close'], window=14).average_true_range()
 
-    patterns = detect_candlestick_patterns(df)
-    df = pd.concat([df, patterns], axis=1)
+    # القناع المضغوط يُفك مباشرة إلى أعمدة بدل بناء DataFrame منفصل ثم pd.concat
+    mask = candlestick_pattern_mask(df['open'].to_numpy(), df['high'].to_numpy(), df['low'].to_numpy(), df['close'].to_numpy())
+    for name, flags in decode_pattern_mask(mask).items():
+        df[name] = flags
 
     df['buy_signal'] = (
         df['trend_up'] & df['ichimoku_up'] &
@@ -58,3 +68,62 @@ def generate_signals(df: pd.DataFrame, timeframe: str) -> pd.DataFrame:
     df['signal_reason'] = ""  # لم نعد نعرض السبب
 
     return df[['buy_signal', 'sell_signal', 'signal_reason']]
+
+
+# --- مسار سريع للشمعة الأخيرة: يعمل على مصفوفات NumPy مباشرة دون بناء DataFrame ---
+rule_evaluator = RuleEvaluator()
+
+
+def evaluate_last_bar(open_: np.ndarray, high: np.ndarray, low: np.ndarray,
+                      close: np.ndarray, volume: np.ndarray) -> dict:
+    # كل المؤشرات محسوبة (للعرض والمقارنة)؛ لاتخاذ القرار فقط استخدم get_single_signal_from_engine
+    values = LastBarIndicators(open_, high, low, close, volume).compute_all()
+    buy, sell = evaluate_signal_conditions(values)
+    return {"buy": buy, "sell": sell, "values": values}
+
+
+@timed_indicators(function="get_single_signal_from_engine")
+def get_single_signal_from_engine(df: pd.DataFrame, timeframe: str) -> str | None:
+    if df is None or df.empty:
+        return None
+    arrays = [df[col].to_numpy(dtype=np.float64) for col in ('open', 'high', 'low', 'close', 'volume')]
+    # تقييم كسول: المؤشرات لا تُحسب إلا إذا وصل إليها التقييم قبل أول شرط مرفوض
+    return rule_evaluator.decide(rule_evaluator.indicators(*arrays))
+
+if __name__ == "__main__":
+    # مقارنة المسار السريع بالمسار الكامل على بيانات عشوائية: نفس القرار ونفس القيم، مع قياس الزمن
+    import time
+    from indicator_engine import IndicatorState
+
+    rng = np.random.default_rng(7)
+    n = 1000
+    close = 1.1 + np.cumsum(rng.normal(0, 0.0005, n))
+    open_ = np.r_[close[0], close[:-1]]
+    high = np.maximum(open_, close) + rng.uniform(0, 0.0004, n)
+    low = np.minimum(open_, close) - rng.uniform(0, 0.0004, n)
+    volume = rng.uniform(100, 1000, n)
+    df = pd.DataFrame({'open': open_, 'high': high, 'low': low, 'close': close, 'volume': volume},
+                      index=pd.date_range('2024-01-01', periods=n, freq='15min'))
+
+    for end in (30, 60, 250, n):
+        window = df.iloc[:end]
+        full = generate_signals(window, '15min').iloc[-1]
+        fast = evaluate_last_bar(*[window[c].to_numpy() for c in ('open', 'high', 'low', 'close', 'volume')])
+        assert (bool(full['buy_signal']), bool(full['sell_signal'])) == (fast['buy'], fast['sell'])
+        state = IndicatorState()
+        for candle in window.to_dict('records'):
+            expected = state.update(candle)
+        for key, value in fast['values'].items():
+            if not isinstance(value, (bool, np.bool_)):
+                e = expected[key]
+                assert (np.isnan(e) and np.isnan(value)) or abs(value - e) <= 1e-9 * max(1.0, abs(e)), key
+    print("Fast path matches generate_signals decisions and incremental indicator values.")
+
+    window = df.iloc[-250:]
+    arrays = [window[c].to_numpy() for c in ('open', 'high', 'low', 'close', 'volume')]
+    for label, fn, repeat in (("generate_signals", lambda: generate_signals(window, '15min'), 50),
+                              ("evaluate_last_bar", lambda: evaluate_last_bar(*arrays), 1000)):
+        started = time.perf_counter()
+        for _ in range(repeat):
+            fn()
+        print(f"{label:18s} {(time.perf_counter() - started) / repeat * 1000:.3f} ms per call (250 candles)")
@@ -0,0 +1,285 @@
+# signal_rules.py
+# شروط buy_signal / sell_signal كرسم اعتماديات صغير: كل شرط يعتمد على "مزوّد" مؤشر واحد أو أكثر،
+# والمزوّدات تُحسب عند الطلب فقط وتُحفظ. المقيّم يفحص الشروط الأرخص والأكثر رفضًا أولًا ويتوقف عند أول رفض،
+# فلا تُحسب المؤشرات المكلفة (MACD, RSI, EMA) لمعظم الشموع. الإحصاءات تُجمع لكل شرط ويُعاد الترتيب دوريًا.
+# القرارات مطابقة تمامًا لـ generate_signals: نفس المقارنات ونفس دلالات NaN (أي مقارنة مع NaN = False).
+import time
+
+import numpy as np
+
+from indicator_kernels import ema, ema_last
+from strategy.candle_patterns import (PATTERN_NAMES, PATTERN_RULES, candlestick_pattern_mask, decode_pattern_mask,
+                                      pattern_window)
+
+PATTERN_KEYS = PATTERN_NAMES  # view حي على سجل الأنماط: أنماط register_pattern اللاحقة تُحسب وتُقرأ هنا أيضًا
+
+
+class LastBarIndicators:
+    # قيم المؤشرات للشمعة الأخيرة من مصفوفات NumPy، تُحسب كسولًا لكل مزوّد عند أول طلب لأحد مفاتيحه
+    PROVIDES = {
+        "ema": ("ema20", "ema50"),
+        "tenkan": ("tenkan",),
+        "rsi": ("rsi",),
+        "macd": ("macd_line", "macd_signal"),
+        "stoch": ("stoch",),
+        "obv": ("obv_mean20", "obv_mean50"),
+        "boll": ("boll_lower", "boll_upper"),
+        "patterns": PATTERN_KEYS,
+    }
+    PROVIDER_OF = {key: provider for provider, keys in PROVIDES.items() for key in keys}
+
+    def __init__(self, open_: np.ndarray, high: np.ndarray, low: np.ndarray,
+                 close: np.ndarray, volume: np.ndarray, timings: dict | None = None):
+        self.open, self.high, self.low, self.close, self.volume = open_, high, low, close, volume
+        self.n = len(close)
+        self._values = {"close": float(close[-1])}
+        self._timings = timings  # provider -> [مجموع الثواني, عدد مرات الحساب]
+
+    def __getitem__(self, key: str):
+        if key not in self._values:
+            self.compute(self.provider_of(key))
+        return self._values[key]
+
+    @classmethod
+    def provider_of(cls, key: str) -> str:
+        # الأنماط من السجل مباشرة، فلا يلزم أن يكون النمط مسجلًا قبل تعريف الصنف
+        return "patterns" if key in PATTERN_RULES else cls.PROVIDER_OF[key]
+
+    def computed(self, provider: str) -> bool:
+        return self.PROVIDES[provider][0] in self._values
+
+    def compute(self, provider: str) -> None:
+        started = time.perf_counter()
+        self._values.update(getattr(self, f"_compute_{provider}")())
+        if self._timings is not None:
+            entry = self._timings.setdefault(provider, [0.0, 0])
+            entry[0] += time.perf_counter() - started
+            entry[1] += 1
+
+    def compute_all(self) -> dict:
+        for provider in self.PROVIDES:
+            if not self.computed(provider):
+                self.compute(provider)
+        return dict(self._values)
+
+    # --- المزوّدات ---
+    # المؤشرات ذات النوافذ (tenkan, stoch, bollinger, OBV means, الأنماط) تُحسب على الذيل الذي تحتاجه فقط؛
+    # المؤشرات التكرارية (EMA, MACD, RSI) تعتمد على التاريخ كله فتُحسب كجداء نقطي/كتل متجهة بلا نسخ
+    def _compute_ema(self) -> dict:
+        return {"ema20": ema_last(self.close, 2 / 21, 20), "ema50": ema_last(self.close, 2 / 51, 50)}
+
+    def _compute_tenkan(self) -> dict:
+        if self.n < 9:
+            return {"tenkan": np.nan}
+        return {"tenkan": (self.high[-9:].max() + self.low[-9:].min()) / 2}
+
+    def _compute_rsi(self) -> dict:
+        diff = np.diff(self.close)
+        # الفرق الأول في ta يساوي 0 (NaN يتحول إلى 0)
+        up = np.concatenate(([0.0], np.where(diff > 0, diff, 0.0)))
+        down = np.concatenate(([0.0], np.where(diff < 0, -diff, 0.0)))
+        ema_up, ema_down = ema_last(up, 1 / 9, 9), ema_last(down, 1 / 9, 9)
+        if np.isnan(ema_down):
+            return {"rsi": np.nan}
+        return {"rsi": 100.0 if ema_down == 0 else 100 - 100 / (1 + ema_up / ema_down)}
+
+    def _compute_macd(self) -> dict:
+        if self.n < 26:
+            return {"macd_line": np.nan, "macd_signal": np.nan}
+        macd_series = ema(self.close, 2 / 13, 12)[25:] - ema(self.close, 2 / 27, 26)[25:]
+        return {"macd_line": float(macd_series[-1]), "macd_signal": ema_last(macd_series, 2 / 10, 9)}
+
+    def _compute_stoch(self) -> dict:
+        if self.n < 5:
+            return {"stoch": np.nan}
+        lowest, highest = self.low[-5:].min(), self.high[-5:].max()
+        return {"stoch": 100 * (self._values["close"] - lowest) / (highest - lowest) if highest != lowest else np.nan}
+
+    def _compute_obv(self) -> dict:
+        n = self.n
+        if n < 20:
+            return {"obv_mean20": np.nan, "obv_mean50": np.nan}
+        close, volume = self.close, self.volume
+        signed = np.empty(n)
+        signed[0] = volume[0]
+        signed[1:] = np.where(close[1:] < close[:-1], -volume[1:], volume[1:])
+        # نحتاج آخر 50 قيمة OBV فقط: مجموع ما قبلها + مجموع تراكمي للذيل
+        tail = min(n, 50)
+        obv_tail = signed[:n - tail].sum() + np.cumsum(signed[n - tail:])
+        return {"obv_mean20": obv_tail[-20:].mean(), "obv_mean50": obv_tail.mean() if n >= 50 else np.nan}
+
+    def _compute_boll(self) -> dict:
+        if self.n < 20:
+            return {"boll_lower": np.nan, "boll_upper": np.nan}
+        window = self.close[-20:]
+        mid, std = window.mean(), window.std()
+        return {"boll_lower": mid - 2 * std, "boll_upper": mid + 2 * std}
+
+    def _compute_patterns(self) -> dict:
+        # القناع على آخر pattern_window() شموع فقط، ثم بتات الشمعة الأخيرة
+        window = slice(max(0, self.n - pattern_window()), self.n)
+        mask = candlestick_pattern_mask(self.open[window], self.high[window], self.low[window], self.close[window])
+        return {name: bool(flags[-1]) for name, flags in decode_pattern_mask(mask).items()}
+
+
+class Condition:
+    def __init__(self, name: str, providers: tuple, predicate, seed_cost: float):
+        self.name = name
+        self.providers = providers
+        self.predicate = predicate
+        self.seed_cost = seed_cost  # تكلفة تقديرية (ميكروثانية) قبل توفر قياسات فعلية
+        self.evaluated = 0
+        self.rejected = 0
+
+    def reject_rate(self) -> float:
+        # تنعيم لابلاس حتى لا يُحكم على شرط من أول بضع شموع
+        return (self.rejected + 1) / (self.evaluated + 2)
+
+
+def _stoch_in_range(v) -> bool:
+    return 20 <= v["stoch"] <= 80
+
+
+def _obv_trend(v) -> bool:
+    return v["obv_mean20"] > v["obv_mean50"]
+
+
+def buy_conditions() -> list[Condition]:
+    return [
+        Condition("price_touches_lower", ("boll",), lambda v: v["close"] <= v["boll_lower"], 8),
+        Condition("bullish_pattern", ("patterns",), lambda v: bool(
+            v["bullish_engulfing"] or v["hammer"] or v["morning_star"] or v["three_white_soldiers"]), 10),
+        Condition("stoch_in_range", ("stoch",), _stoch_in_range, 5),
+        Condition("ichimoku_up", ("tenkan",), lambda v: v["close"] > v["tenkan"], 5),
+        Condition("obv_trend", ("obv",), _obv_trend, 15),
+        Condition("trend_up", ("ema",), lambda v: v["ema20"] > v["ema50"], 6),
+        Condition("rsi_below_70", ("rsi",), lambda v: v["rsi"] < 70, 20),
+        Condition("macd_bullish", ("macd",), lambda v: v["macd_line"] > v["macd_signal"], 60),
+    ]
+
+
+def sell_conditions() -> list[Condition]:
+    return [
+        Condition("price_touches_upper", ("boll",), lambda v: v["close"] >= v["boll_upper"], 8),
+        Condition("bearish_pattern", ("patterns",), lambda v: bool(
+            v["bearish_engulfing"] or v["shooting_star"] or v["evening_star"] or v["three_black_crows"]), 10),
+        Condition("stoch_in_range", ("stoch",), _stoch_in_range, 5),
+        Condition("ichimoku_down", ("tenkan",), lambda v: v["close"] < v["tenkan"], 5),
+        Condition("obv_not_trending", ("obv",), lambda v: not _obv_trend(v), 15),
+        Condition("trend_down", ("ema",), lambda v: v["ema20"] < v["ema50"], 6),
+        Condition("rsi_above_30", ("rsi",), lambda v: v["rsi"] > 30, 20),
+        Condition("macd_bearish", ("macd",), lambda v: v["macd_line"] < v["macd_signal"], 60),
+    ]
+
+
+class RuleEvaluator:
+    def __init__(self, reorder_every: int = 500):
+        self.rules = {"buy": buy_conditions(), "sell": sell_conditions()}
+        self.reorder_every = reorder_every
+        self.evaluations = 0
+        self.reorders = 0
+        self.provider_timings: dict = {}  # provider -> [مجموع الثواني, عدد مرات الحساب]
+
+    def indicators(self, open_, high, low, close, volume) -> LastBarIndicators:
+        return LastBarIndicators(open_, high, low, close, volume, timings=self.provider_timings)
+
+    def _cost(self, condition: Condition) -> float:
+        total = 0.0
+        for provider in condition.providers:
+            seconds, count = self.provider_timings.get(provider, (0.0, 0))
+            total += seconds / count * 1e6 if count else condition.seed_cost
+        return total
+
+    def reorder(self) -> None:
+        # الترتيب الأمثل لسلسلة AND مستقلة: تصاعديًا حسب التكلفة / احتمال الرفض
+        for side, conditions in self.rules.items():
+            conditions.sort(key=lambda c: self._cost(c) / c.reject_rate())
+        self.reorders += 1
+
+    def _side(self, side: str, values) -> bool:
+        for condition in self.rules[side]:
+            condition.evaluated += 1
+            if not condition.predicate(values):
+                condition.rejected += 1
+                return False
+        return True
+
+    def evaluate(self, values) -> tuple[bool, bool]:
+        # values: LastBarIndicators (كسول) أو أي mapping بنفس المفاتيح (مثل قيم IndicatorState)
+        self.evaluations += 1
+        if self.reorder_every and self.evaluations % self.reorder_every == 0:
+            self.reorder()
+        return self._side("buy", values), self._side("sell", values)
+
+    def decide(self, values) -> str | None:
+        # buy و sell متنافيان (trend_up مع trend_down مستحيل)، لذا لا نقيّم sell إذا تحقق buy
+        self.evaluations += 1
+        if self.reorder_every and self.evaluations % self.reorder_every == 0:
+            self.reorder()
+        if self._side("buy", values):
+            return "call"
+        if self._side("sell", values):
+            return "put"
+        return None
+
+    def stats(self) -> dict:
+        return {
+            "evaluations": self.evaluations,
+            "reorders": self.reorders,
+            "conditions": {side: [{"name": c.name, "evaluated": c.evaluated, "rejected": c.rejected,
+                                   "reject_rate": c.rejected / c.evaluated if c.evaluated else 0.0}
+                                  for c in conditions]
+                           for side, conditions in self.rules.items()},
+            "provider_computations": {p: count for p, (_, count) in self.provider_timings.items()},
+            "provider_mean_us": {p: seconds / count * 1e6 for p, (seconds, count) in self.provider_timings.items() if count},
+        }
+
+    def format_stats(self) -> str:
+        if not self.evaluations:
+            return "لا تقييمات بعد"
+        parts = []
+        for side, conditions in self.rules.items():
+            top = [f"{c.name} {c.rejected / c.evaluated:.0%}" for c in conditions if c.evaluated][:3]
+            parts.append(f"{side}: {', '.join(top)}")
+        return f"{self.evaluations} تقييم، رفض مبكر: " + " | ".join(parts)
+
+
+if __name__ == "__main__":
+    # 1) قرارات مطابقة لـ evaluate_signal_conditions على قيم عشوائية (مع NaN) تجعل كل شرط ينجح كثيرًا
+    # 2) قياس زمن التقييم الكسول مقابل حساب كل المؤشرات على سلسلة عشوائية
+    from indicator_engine import evaluate_signal_conditions
+
+    rng = np.random.default_rng(11)
+    evaluator = RuleEvaluator(reorder_every=100)
+    fired = 0
+    for _ in range(50000):
+        values = {key: bool(rng.random() < 0.3) for key in PATTERN_KEYS}
+        values.update({key: rng.choice([np.nan, rng.uniform(0, 100)], p=[0.05, 0.95])
+                       for key in ("close", "ema20", "ema50", "tenkan", "rsi", "macd_line", "macd_signal",
+                                   "stoch", "obv_mean20", "obv_mean50")})
+        values["boll_lower"] = values["close"] + rng.uniform(-10, 30)
+        values["boll_upper"] = values["close"] - rng.uniform(-10, 30)
+        expected = evaluate_signal_conditions(values)
+        assert evaluator.evaluate(values) == expected, values
+        fired += any(expected)
+    print(f"Decisions identical on 50000 random bars ({fired} signals, {evaluator.reorders} reorders).")
+
+    n = 250
+    close = 1.1 + np.cumsum(rng.normal(0, 0.0005, n + 2000))
+    open_ = np.r_[close[0], close[:-1]]
+    high = np.maximum(open_, close) + rng.uniform(0, 0.0004, len(close))
+    low = np.minimum(open_, close) - rng.uniform(0, 0.0004, len(close))
+    volume = rng.uniform(100, 1000, len(close))
+    windows = [tuple(a[end - n:end] for a in (open_, high, low, close, volume)) for end in range(n, len(close))]
+
+    evaluator = RuleEvaluator()
+    for label, run in (("compute all", lambda w: evaluate_signal_conditions(LastBarIndicators(*w).compute_all())),
+                       ("lazy rules", lambda w: evaluator.decide(evaluator.indicators(*w)))):
+        started = time.perf_counter()
+        for window in windows:
+            run(window)
+        print(f"{label:12s} {(time.perf_counter() - started) / len(windows) * 1e6:.1f} us per bar")
+    stats = evaluator.stats()
+    print("Provider computations:", stats["provider_computations"])
+    for side, conditions in stats["conditions"].items():
+        print(side, [(c["name"], f"{c['reject_rate']:.0%}") for c in conditions if c["evaluated"]])
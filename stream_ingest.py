@@ -0,0 +1,181 @@
+# stream_ingest.py
+# وضع الاستقبال المتدفق: الاشتراك في تدفق أسعار (websocket أو خادم إعادة تشغيل محلي)، وبناء شموع
+# 15min/30min/1h في الذاكرة مع كل تيك، وإصدار حدث "إغلاق شمعة" فور انتهاء الشمعة ليتفاعل معه التحليل مباشرة.
+import asyncio
+import json
+import time
+
+import pandas as pd
+
+from timeframes import candle_open_time, interval_to_seconds
+
+try:
+    import websockets
+except ImportError:
+    websockets = None
+
+try:
+    from config.api_keys_config import TWELVEDATA_API_KEY
+except ImportError:
+    TWELVEDATA_API_KEY = None
+
+TWELVEDATA_WS_URL = "wss://ws.twelvedata.com/v1/quotes/price?apikey={api_key}"
+
+
+class CandleAggregator:
+    def __init__(self, intervals: list, on_close=None, candle_store=None, source: str = "STREAM"):
+        self.intervals = list(intervals)
+        self._seconds = {interval: interval_to_seconds(interval) for interval in self.intervals}
+        self.on_close = on_close
+        self.candle_store = candle_store
+        self.source = source
+        self._current: dict = {}  # (symbol, interval) -> candle dict قيد التكوين
+        self._last_closed: dict = {}  # (symbol, interval) -> open_time لآخر شمعة أُغلقت
+        self.ticks_received = 0
+        self.late_ticks = 0
+
+    def add_tick(self, symbol: str, price: float, timestamp: float, volume: float = 0.0) -> None:
+        self.ticks_received += 1
+        for interval in self.intervals:
+            open_time = candle_open_time(timestamp, self._seconds[interval])
+            key = (symbol, interval)
+            candle = self._current.get(key)
+            if open_time <= self._last_closed.get(key, -1) or (candle is not None and open_time < candle["open_time"]):
+                # تيك متأخر يخص شمعة أُغلقت بالفعل
+                self.late_ticks += 1
+                continue
+            if candle is not None and open_time > candle["open_time"]:
+                self._close(symbol, interval, candle)
+                candle = None
+            if candle is None:
+                # أول شمعة بعد بدء الاشتراك ناقصة (بدأت قبل وصول أول تيك) فلا تُكتب فوق بيانات المزود في المخزن
+                self._current[key] = {"open_time": open_time, "open": price, "high": price,
+                                      "low": price, "close": price, "volume": volume,
+                                      "partial": key not in self._last_closed}
+            else:
+                candle["high"] = max(candle["high"], price)
+                candle["low"] = min(candle["low"], price)
+                candle["close"] = price
+                candle["volume"] += volume
+
+    def close_due(self, now: float | None = None) -> int:
+        # إغلاق الشموع التي انتهى وقتها حتى لو لم يصل تيك جديد بعد الحد الزمني
+        now_s = time.time() if now is None else now
+        closed = 0
+        for (symbol, interval), candle in list(self._current.items()):
+            if candle["open_time"] + self._seconds[interval] <= now_s:
+                del self._current[(symbol, interval)]
+                self._close(symbol, interval, candle)
+                closed += 1
+        return closed
+
+    def next_close_time(self, now: float | None = None) -> float:
+        now_s = time.time() if now is None else now
+        return min(candle_open_time(now_s, seconds) + seconds for seconds in self._seconds.values())
+
+    def forming_candle(self, symbol: str, interval) -> dict | None:
+        return self._current.get((symbol, interval))
+
+    def _close(self, symbol: str, interval, candle: dict) -> None:
+        self._last_closed[(symbol, interval)] = candle["open_time"]
+        close_time = candle["open_time"] + self._seconds[interval]
+        if self.candle_store is not None and not candle["partial"]:
+            df = pd.DataFrame([{k: candle[k] for k in ("open", "high", "low", "close", "volume")}],
+                              index=pd.to_datetime([candle["open_time"]], unit="s"))
+            self.candle_store.append(self.source, symbol, interval, df)
+        if self.on_close is not None:
+            self.on_close({"symbol": symbol, "interval": interval, "open_time": candle["open_time"],
+                           "close_time": close_time, "candle": candle, "emitted_at": time.time()})
+
+
+# --- مصادر التدفق: كل مصدر هو async iterator يُرجع (symbol, price, timestamp, volume) ---
+class TwelveDataPriceStream:
+    def __init__(self, symbols: list[str], api_key: str | None = TWELVEDATA_API_KEY):
+        self.symbols = symbols
+        self.api_key = api_key
+
+    async def __aiter__(self):
+        if websockets is None:
+            raise RuntimeError("websockets package is required for the TwelveData price stream.")
+        async with websockets.connect(TWELVEDATA_WS_URL.format(api_key=self.api_key)) as ws:
+            await ws.send(json.dumps({"action": "subscribe", "params": {"symbols": ",".join(self.symbols)}}))
+            async for raw in ws:
+                message = json.loads(raw)
+                if message.get("event") == "price":
+                    # day_volume تراكمي لليوم وليس حجم التيك، والفوركس بلا حجم أصلًا
+                    yield message["symbol"], float(message["price"]), float(message["timestamp"]), 0.0
+
+
+class LineJsonPriceStream:
+    # عميل لخادم إعادة التشغيل المحلي (stream_replay.py): سطر JSON لكل تيك بنفس شكل رسائل TwelveData
+    def __init__(self, symbols: list[str], host: str = "127.0.0.1", port: int = 8765):
+        self.symbols = symbols
+        self.host = host
+        self.port = port
+
+    async def __aiter__(self):
+        reader, writer = await asyncio.open_connection(self.host, self.port)
+        writer.write((json.dumps({"action": "subscribe", "params": {"symbols": ",".join(self.symbols)}}) + "\n").encode())
+        await writer.drain()
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                message = json.loads(line)
+                if message.get("event") == "price":
+                    yield message["symbol"], float(message["price"]), float(message["timestamp"]), float(message.get("volume") or 0)
+        finally:
+            writer.close()
+
+
+class StreamIngestor:
+    def __init__(self, stream, intervals: list, candle_store=None, source: str = "STREAM",
+                 symbol_map: dict | None = None, close_grace_s: float = 0.2, use_wall_clock: bool = True):
+        # symbol_map: رمز التدفق -> الاسم المستخدم في المخزن والتحليل (COMMON_NAME)
+        # use_wall_clock=False عند إعادة تشغيل تاريخ مسرّع: تُغلق الشموع بالتيكات فقط وليس بساعة النظام
+        self.stream = stream
+        self.use_wall_clock = use_wall_clock
+        self.symbol_map = symbol_map or {}
+        self.close_grace_s = close_grace_s
+        self.events: asyncio.Queue = asyncio.Queue()
+        self.aggregator = CandleAggregator(intervals, on_close=self.events.put_nowait,
+                                           candle_store=candle_store, source=source)
+        self._tasks: list = []
+
+    async def _consume(self) -> None:
+        while True:
+            try:
+                async for symbol, price, timestamp, volume in self.stream:
+                    self.aggregator.add_tick(self.symbol_map.get(symbol, symbol), price, timestamp, volume)
+                print("Stream: Price stream ended, reconnecting in 5s...")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Stream: Price stream error: {type(e).__name__}: {e}. Reconnecting in 5s...")
+            await asyncio.sleep(5)
+
+    async def _close_timer(self) -> None:
+        # نستيقظ عند كل حد شمعة (+ مهلة قصيرة للتيكات المتأخرة) ونغلق الشموع فورًا
+        while True:
+            wake_at = self.aggregator.next_close_time() + self.close_grace_s
+            await asyncio.sleep(max(0.0, wake_at - time.time()))
+            self.aggregator.close_due(time.time() - self.close_grace_s)
+
+    def start(self) -> None:
+        self._tasks = [asyncio.create_task(self._consume())]
+        if self.use_wall_clock:
+            self._tasks.append(asyncio.create_task(self._close_timer()))
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def next_batch(self) -> list[dict]:
+        # ننتظر أول حدث ثم نأخذ كل الأحداث الجاهزة معه (مثلًا إغلاق 15min و30min و1h في نفس اللحظة)
+        batch = [await self.events.get()]
+        while not self.events.empty():
+            batch.append(self.events.get_nowait())
+        return batch
@@ -0,0 +1,134 @@
+# stream_replay.py
+# خادم تدفق أسعار محلي بديل لـ TwelveData websocket، لاختبار وضع STREAM واختبار الحمل دون اتصال.
+# البروتوكول: سطر JSON لكل رسالة عبر TCP. العميل يرسل {"action":"subscribe","params":{"symbols":"EUR/USD,..."}}
+# والخادم يرد بتيكات {"event":"price","symbol":...,"price":...,"timestamp":...}.
+# وضعان: "live" يولّد تيكات عشوائية بختم الوقت الحالي، و"replay" يعيد ملف CSV للتيكات (timestamp,symbol,price) بسرعة مضاعفة.
+import argparse
+import asyncio
+import csv
+import json
+import random
+import time
+
+
+class ReplayStreamServer:
+    def __init__(self, host: str = "127.0.0.1", port: int = 8765, ticks_per_second: float = 5.0,
+                 volatility: float = 0.0002, csv_path: str | None = None, speed: float = 60.0, seed: int = 42):
+        self.host = host
+        self.port = port
+        self.ticks_per_second = ticks_per_second
+        self.volatility = volatility
+        self.csv_path = csv_path
+        self.speed = speed
+        self._rng = random.Random(seed)
+        self._prices: dict[str, float] = {}
+        self._server = None
+        self.clients = 0
+        self.ticks_sent = 0
+
+    async def start(self) -> None:
+        self._server = await asyncio.start_server(self._handle_client, self.host, self.port)
+        mode = f"replay of {self.csv_path} at x{self.speed}" if self.csv_path else f"live random walk, {self.ticks_per_second} ticks/s per symbol"
+        print(f"Replay_server: Listening on {self.host}:{self.port} ({mode}).")
+
+    async def stop(self) -> None:
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+
+    async def serve_forever(self) -> None:
+        await self.start()
+        async with self._server:
+            await self._server.serve_forever()
+
+    async def _handle_client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        self.clients += 1
+        try:
+            request = json.loads(await reader.readline() or b"{}")
+            symbols = [s for s in request.get("params", {}).get("symbols", "").split(",") if s]
+            if self.csv_path:
+                await self._replay_csv(writer, set(symbols))
+            else:
+                await self._live_random_walk(writer, symbols)
+        except (ConnectionError, asyncio.CancelledError):
+            pass
+        finally:
+            self.clients -= 1
+            writer.close()
+
+    async def _send(self, writer: asyncio.StreamWriter, symbol: str, price: float, timestamp: float) -> None:
+        writer.write((json.dumps({"event": "price", "symbol": symbol, "price": round(price, 6),
+                                  "timestamp": timestamp}) + "\n").encode())
+        self.ticks_sent += 1
+        await writer.drain()
+
+    async def _live_random_walk(self, writer: asyncio.StreamWriter, symbols: list[str]) -> None:
+        interval = 1.0 / max(self.ticks_per_second, 1e-6)
+        while True:
+            for symbol in symbols:
+                price = self._prices.get(symbol, 1.0 + self._rng.random())
+                price *= 1.0 + self._rng.gauss(0.0, self.volatility)
+                self._prices[symbol] = price
+                await self._send(writer, symbol, price, time.time())
+            await asyncio.sleep(interval)
+
+    async def _replay_csv(self, writer: asyncio.StreamWriter, symbols: set[str]) -> None:
+        first_ts, started = None, time.monotonic()
+        with open(self.csv_path, newline="") as fh:
+            for row in csv.DictReader(fh):
+                if symbols and row["symbol"] not in symbols:
+                    continue
+                ts = float(row["timestamp"])
+                if first_ts is None:
+                    first_ts = ts
+                delay = (ts - first_ts) / self.speed - (time.monotonic() - started)
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                await self._send(writer, row["symbol"], float(row["price"]), ts)
+
+
+async def _load_test(host: str, port: int, symbols: list[str], intervals: list[str], duration_s: float) -> None:
+    # يشغل عميل StreamIngestor ضد الخادم ويقيس زمن إصدار أحداث إغلاق الشموع بعد حدودها
+    from stream_ingest import LineJsonPriceStream, StreamIngestor
+
+    ingestor = StreamIngestor(LineJsonPriceStream(symbols, host, port), intervals)
+    ingestor.start()
+    lags, deadline = [], time.time() + duration_s
+    while time.time() < deadline:
+        try:
+            batch = await asyncio.wait_for(ingestor.next_batch(), timeout=max(0.1, deadline - time.time()))
+        except asyncio.TimeoutError:
+            break
+        lags.extend(event["emitted_at"] - event["close_time"] for event in batch)
+    await ingestor.stop()
+    agg = ingestor.aggregator
+    print(f"Load test: {agg.ticks_received} ticks ({agg.ticks_received / duration_s:.0f}/s), "
+          f"{len(lags)} candle closes, late ticks: {agg.late_ticks}")
+    if lags:
+        lags.sort()
+        print(f"Close-to-event lag: p50={lags[len(lags) // 2] * 1000:.1f}ms max={lags[-1] * 1000:.1f}ms")
+
+
+async def _main(args) -> None:
+    server = ReplayStreamServer(args.host, args.port, args.rate, csv_path=args.csv, speed=args.speed)
+    if not args.load_test:
+        await server.serve_forever()
+        return
+    await server.start()
+    symbols = [f"SYM{i:04d}" for i in range(args.symbols)]
+    await _load_test(args.host, args.port, symbols, args.intervals.split(","), args.duration)
+    await server.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local stand-in price stream for STREAM ingestion mode.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--rate", type=float, default=5.0, help="ticks per second per symbol (live mode)")
+    parser.add_argument("--csv", default=None, help="tick CSV with timestamp,symbol,price columns (replay mode)")
+    parser.add_argument("--speed", type=float, default=60.0, help="replay speed multiplier")
+    parser.add_argument("--load-test", action="store_true", help="run an in-process client and report throughput/lag")
+    parser.add_argument("--symbols", type=int, default=100)
+    parser.add_argument("--intervals", default="1min")
+    parser.add_argument("--duration", type=float, default=130.0)
+    asyncio.run(_main(parser.parse_args()))
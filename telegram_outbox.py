@@ -0,0 +1,228 @@
+# telegram_outbox.py
+# طابور رسائل تيليجرام الصادرة، منفصل عن مسار التداول:
+# - enqueue لا ينتظر الشبكة أبدًا؛ عامل خلفي واحد يرسل.
+# - دمج: الرسائل المنتظرة (مثل إشارات دورة واحدة) تُجمع في رسالة واحدة أو قطع لا تتجاوز حد تيليجرام.
+# - حدود المحادثة الواحدة بدلوَي رموز (TokenBucket من request_scheduler): في الثانية وفي الدقيقة، لكل محاولة إرسال
+#   (بما فيها إعادة المحاولة والإرسال كنص عادي)؛ أثناء انتظار الرصيد تتراكم رسائل أكثر فتُدمج أكثر.
+# - إعادة المحاولة: RetryAfter بالمدة التي يطلبها تيليجرام، أخطاء الشبكة بتراجع أسي مع jitter، وخطأ تنسيق
+#   Markdown (BadRequest) يُعاد مرة واحدة كنص عادي.
+# - عمق الطابور وزمن التسليم (من enqueue حتى نجاح الإرسال) في /status و metrics.
+import asyncio
+import contextlib
+import random
+import time
+from collections import deque
+
+from telegram.error import BadRequest, NetworkError, RetryAfter
+
+try:
+    from metrics import REGISTRY, TELEGRAM_ERRORS, TELEGRAM_SECONDS
+except ImportError: # metrics.py اختياري: الطابور يعمل كما هو بلا قياس، وبلا زمن تسليم في /status
+    class _NoMetrics:
+        # ما يستخدمه هذا الملف من metrics (histogram/labels/observe/quantile/time/inc) بلا قياس
+        def histogram(self, name, help_text, *args, **kwargs): return self
+        def labels(self, **labels): return self
+        def observe(self, value, **labels): pass
+        def quantile(self, q): return None
+        def time(self, **labels): return contextlib.nullcontext()
+        def inc(self, amount=1, **labels): pass
+    REGISTRY = TELEGRAM_ERRORS = TELEGRAM_SECONDS = _NoMetrics()
+from request_scheduler import TokenBucket
+
+TELEGRAM_MAX_MESSAGE_CHARS = 4096
+MESSAGE_SEPARATOR = "\n\n"
+
+DELIVERY_SECONDS = REGISTRY.histogram("signalbot_telegram_delivery_seconds",
+                                      "Time from enqueue to successful Telegram delivery.")
+
+
+class TelegramOutbox:
+    def __init__(self, bot, chat_id, messages_per_second: float = 1.0, messages_per_minute: float = 20,
+                 max_chars: int = TELEGRAM_MAX_MESSAGE_CHARS, max_retries: int = 5, backoff_base_s: float = 1.0,
+                 max_backoff_s: float = 60.0, max_pending: int = 1000):
+        self.bot = bot
+        self.chat_id = chat_id
+        self.max_chars = max_chars
+        self.max_retries = max_retries
+        self.backoff_base_s = backoff_base_s
+        self.max_backoff_s = max_backoff_s
+        self.max_pending = max_pending
+        self._per_second = TokenBucket(max(1.0, messages_per_second), messages_per_second)
+        self._per_minute = TokenBucket(messages_per_minute, messages_per_minute / 60.0)
+        self._pending: deque = deque()  # (text, parse_mode, enqueued_at)
+        self._wakeup: asyncio.Event | None = None
+        self._task: asyncio.Task | None = None
+        self._sending = False
+        self.enqueued = 0
+        self.messages_sent = 0
+        self.items_delivered = 0
+        self.items_failed = 0
+        self.items_dropped = 0
+        self.retries = 0
+        self.plain_text_fallbacks = 0
+
+    # --- الواجهة ---
+    def start(self) -> None:
+        if self._task is None or self._task.done():
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    def enqueue(self, text: str, parse_mode: str | None = "Markdown") -> None:
+        # فوري دائمًا؛ عند امتلاء الطابور تُسقط أقدم رسالة (الأحدث أهم لإشارات تداول)
+        if len(self._pending) >= self.max_pending:
+            self._pending.popleft()
+            self.items_dropped += 1
+        self._pending.append((text[:self.max_chars], parse_mode, time.monotonic()))
+        self.enqueued += 1
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    def enqueue_many(self, texts: list[str], parse_mode: str | None = "Markdown") -> None:
+        for text in texts:
+            self.enqueue(text, parse_mode)
+
+    async def aclose(self, timeout: float = 5.0) -> None:
+        # محاولة تفريغ ما تبقى قبل الإغلاق، ضمن مهلة
+        if self._task is None:
+            return
+        deadline = time.monotonic() + timeout
+        while (self._pending or self._sending) and time.monotonic() < deadline:
+            await asyncio.sleep(0.05)
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    # --- العامل ---
+    def _take_batch(self) -> tuple[list, str | None]:
+        # أكبر عدد من الرسائل المتتالية بنفس parse_mode يتسع في رسالة واحدة
+        batch = [self._pending.popleft()]
+        parse_mode, length = batch[0][1], len(batch[0][0])
+        while self._pending:
+            text, mode, _ = self._pending[0]
+            if mode != parse_mode or length + len(MESSAGE_SEPARATOR) + len(text) > self.max_chars:
+                break
+            batch.append(self._pending.popleft())
+            length += len(MESSAGE_SEPARATOR) + len(text)
+        return batch, parse_mode
+
+    async def _run(self) -> None:
+        while True:
+            if not self._pending:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+            # رصيد المحاولة الأولى يُنتظر قبل أخذ الدفعة، فتُدمج فيها كل الرسائل التي وصلت أثناء الانتظار
+            await self._acquire_send()
+            if not self._pending:
+                continue
+            batch, parse_mode = self._take_batch()
+            self._sending = True
+            try:
+                delivered = await self._deliver(MESSAGE_SEPARATOR.join(text for text, _, _ in batch), parse_mode)
+            finally:
+                self._sending = False
+            now = time.monotonic()
+            if delivered:
+                self.messages_sent += 1
+                self.items_delivered += len(batch)
+                for _, _, enqueued_at in batch:
+                    DELIVERY_SECONDS.observe(now - enqueued_at)
+            else:
+                self.items_failed += len(batch)
+
+    async def _acquire_send(self) -> None:
+        await self._per_second.acquire()
+        await self._per_minute.acquire()
+
+    def _backoff(self, attempt: int) -> float:
+        return min(self.max_backoff_s, self.backoff_base_s * 2 ** attempt) * random.uniform(0.5, 1.0)
+
+    async def _deliver(self, text: str, parse_mode: str | None) -> bool:
+        # رصيد المحاولة الأولى أخذه _run؛ كل محاولة بعدها تأخذ رصيدها من الدلوين
+        attempt, first_send = 0, True
+        while True:
+            if not first_send:
+                await self._acquire_send()
+            first_send = False
+            try:
+                with TELEGRAM_SECONDS.time():
+                    await self.bot.send_message(chat_id=self.chat_id, text=text, parse_mode=parse_mode)
+                return True
+            except RetryAfter as e:
+                retry_after = e.retry_after
+                delay = retry_after.total_seconds() if hasattr(retry_after, "total_seconds") else float(retry_after)
+                print(f"Telegram outbox: Rate limited by Telegram, retrying in {delay:.0f}s.")
+            except BadRequest as e:
+                # BadRequest يرث NetworkError، لذا يُلتقط أولًا: لا فائدة من إعادة نفس الطلب
+                TELEGRAM_ERRORS.inc()
+                if parse_mode is None:
+                    print(f"Telegram outbox: Message rejected: {e}")
+                    return False
+                print(f"Telegram outbox: Formatting rejected ({e}), resending as plain text.")
+                parse_mode = None
+                self.plain_text_fallbacks += 1
+                continue
+            except NetworkError as e:
+                delay = self._backoff(attempt)
+                print(f"Telegram outbox: Send failed ({type(e).__name__}: {e}), retry {attempt + 1} in {delay:.1f}s.")
+            except Exception as e:
+                # Forbidden (البوت محظور/أُزيل)، InvalidToken ...: لا تُصلحها إعادة المحاولة
+                TELEGRAM_ERRORS.inc()
+                print(f"Telegram outbox: Send failed permanently: {type(e).__name__}: {e}")
+                return False
+            TELEGRAM_ERRORS.inc()
+            if attempt >= self.max_retries:
+                print(f"Telegram outbox: Giving up after {attempt + 1} attempts.")
+                return False
+            attempt += 1
+            self.retries += 1
+            await asyncio.sleep(delay)
+
+    # --- المراقبة ---
+    def stats(self) -> dict:
+        delivery = DELIVERY_SECONDS.labels()
+        return {"depth": len(self._pending), "enqueued": self.enqueued, "messages_sent": self.messages_sent,
+                "delivered": self.items_delivered, "failed": self.items_failed, "dropped": self.items_dropped,
+                "retries": self.retries, "plain_text_fallbacks": self.plain_text_fallbacks,
+                "delivery_p50_s": delivery.quantile(0.5), "delivery_p95_s": delivery.quantile(0.95)}
+
+    def format_stats(self) -> str:
+        s = self.stats()
+        latency = (f", delivery p50 {s['delivery_p50_s']:.1f}s p95 {s['delivery_p95_s']:.1f}s"
+                   if s["delivery_p50_s"] is not None else "")
+        return (f"queue {s['depth']}, {s['delivered']}/{s['enqueued']} delivered in {s['messages_sent']} messages, "
+                f"{s['failed']} failed, {s['dropped']} dropped, {s['retries']} retries{latency}")
+
+
+if __name__ == "__main__":
+    # بوت وهمي: RetryAfter مرة، خطأ شبكة مرة، رفض Markdown مرة؛ 10 إشارات في دورة واحدة ثم 30 رسالة متفرقة
+    class FakeBot:
+        def __init__(self):
+            self.sent = []
+            self.failures = [RetryAfter(1), NetworkError("connection reset"), BadRequest("can't parse entities")]
+
+        async def send_message(self, chat_id, text, parse_mode=None):
+            await asyncio.sleep(0.05)
+            if self.failures and len(self.sent) in (1, 3, 4):
+                raise self.failures.pop(0)
+            self.sent.append((time.monotonic(), text.count("Signal"), parse_mode))
+
+    async def demo():
+        bot = FakeBot()
+        outbox = TelegramOutbox(bot, chat_id=1, messages_per_second=1, messages_per_minute=20, backoff_base_s=0.2)
+        outbox.start()
+        started = time.monotonic()
+        outbox.enqueue_many([f"🚨 **Trading Signal!** 🚨\nAsset: **PAIR{i}**" for i in range(10)])
+        print(f"10 signals enqueued in {(time.monotonic() - started) * 1000:.2f} ms (trading path not blocked)")
+        for i in range(30):
+            outbox.enqueue(f"Signal update {i}")
+            await asyncio.sleep(0.1)
+        await outbox.aclose(timeout=30)
+        print(f"{len(bot.sent)} Telegram messages for {outbox.enqueued} items, send times "
+              f"{[round(t - started, 1) for t, _, _ in bot.sent]}")
+        print(outbox.format_stats())
+
+    asyncio.run(demo())
@@ -0,0 +1,41 @@
+# timeframes.py
+# أدوات مشتركة لتحويل أسماء الأطر الزمنية ("15min", "1h", ...) إلى ثوانٍ وحساب حدود الشموع
+import re
+import time
+
+import pandas as pd
+
+_INTERVAL_PATTERN = re.compile(r"^\s*(\d+)\s*(min|m|h|day|d|week|w)\s*$", re.IGNORECASE)
+_UNIT_SECONDS = {"min": 60, "m": 60, "h": 3600, "day": 86400, "d": 86400, "week": 604800, "w": 604800}
+
+
+def interval_to_seconds(interval_or_timeframe) -> int:
+    # IQ Option يستخدم عدد الثواني مباشرة، بينما TwelveData يستخدم نصوصًا مثل "15min"
+    if isinstance(interval_or_timeframe, (int, float)):
+        return int(interval_or_timeframe)
+    match = _INTERVAL_PATTERN.match(str(interval_or_timeframe))
+    if not match:
+        raise ValueError(f"Unsupported interval: {interval_or_timeframe!r}")
+    return int(match.group(1)) * _UNIT_SECONDS[match.group(2).lower()]
+
+
+def candle_open_time(timestamp_s: float, interval_or_timeframe) -> int:
+    # بداية الشمعة التي يقع فيها الطابع الزمني (محاذاة على حدود UTC كما يفعل المزود)
+    seconds = interval_to_seconds(interval_or_timeframe)
+    return int(timestamp_s // seconds) * seconds
+
+
+def next_candle_close(timestamp_s: float | None, interval_or_timeframe) -> int:
+    if timestamp_s is None:
+        timestamp_s = time.time()
+    return candle_open_time(timestamp_s, interval_or_timeframe) + interval_to_seconds(interval_or_timeframe)
+
+
+def closed_candles(df: pd.DataFrame | None, interval_or_timeframe, now: float | None = None) -> pd.DataFrame | None:
+    # المزود يعيد الشمعة الجارية وهي ما زالت قيد التكوين (وكذلك الدلو الأخير المشتق منها): نبقي فقط الشموع
+    # التي بدأت قبل بداية الشمعة الجارية، فيُحلل الإطار على الشمعة التي أُغلقت فعلًا
+    if df is None or df.empty:
+        return df
+    cutoff_ns = candle_open_time(time.time() if now is None else now, interval_or_timeframe) * 1_000_000_000
+    opens = pd.DatetimeIndex(pd.to_datetime(df["datetime"]) if "datetime" in df.columns else df.index)
+    return df[opens.as_unit("ns").asi8 < cutoff_ns]
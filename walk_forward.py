@@ -0,0 +1,322 @@
+# walk_forward.py
+# محسّن walk-forward لثوابت الاستراتيجية (EMA 20/50، RSI 9 وحدوده 70/30، Stochastic 5 ونطاقه 20-80، Bollinger 20/2،
+# OBV 20/50، ومجموعة الأطر) موزع على كل الأنوية:
+# - الشموع تُحمّل مرة واحدة في الأب وتوضع في shared_memory؛ العمّال يربطون عليها views بدل نسخها (pickle) لكل مهمة.
+# - المهمة = تركيبة معاملات واحدة على كل الأصول: اختبار رجعي على التاريخ كله (المؤشرات سببية، فلا تسرب من المستقبل)
+#   ثم تقطيع الصفقات إلى نوافذ train/test لكل fold.
+# - النتائج تُكتب سطرًا بسطر في جدول CSV على القرص فور انتهاء كل مهمة؛ إعادة التشغيل بنفس الملف تتخطى ما اكتمل.
+import argparse
+import csv
+import itertools
+import json
+import multiprocessing as mp
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing import shared_memory
+
+import numpy as np
+import pandas as pd
+
+from backtest import (DEFAULT_PAYOUT, DEFAULT_TRADE_AMOUNT, DEFAULT_TRADE_DURATION, NS, backtest_asset,
+                      load_frames_from_store, summarize, synthetic_pair)
+from batch_signals import DEFAULT_STRATEGY_PARAMS, OHLCV
+from candle_store import DEFAULT_STORE_DIR, TIMESTAMP_COLUMN, CandleStore
+from resampler import plan_frames, resample_arrays
+from timeframes import interval_to_seconds
+
+SETTLE_KEY = "settle"  # سلسلة التسوية لكل أصل في الذاكرة المشتركة: (symbol, SETTLE_KEY)
+DEFAULT_FRAMES = "15min,30min,1h"
+# شبكة افتراضية صغيرة حول القيم الحالية؛ frames مجموعة أطر مفصولة بفواصل
+DEFAULT_PARAM_SPACE = {
+    "ema_fast": (12, 20), "ema_slow": (50, 100),
+    "rsi_upper": (65, 70), "rsi_lower": (30, 35),
+    "boll_dev": (2, 2.5),
+    "frames": (DEFAULT_FRAMES, "15min,1h"),
+}
+SUMMARY_FIELDS = ("trades", "wins", "losses", "ties", "win_rate", "pnl", "max_drawdown")
+# عدد خيوط BLAS لكل عامل: العمّال يتوازون فيما بينهم، وخيوط داخلية إضافية تعني تنافسًا على نفس الأنوية
+_THREAD_ENV = ("OMP_NUM_THREADS", "OPENBLAS_NUM_THREADS", "MKL_NUM_THREADS")
+
+
+def parameter_grid(space: dict) -> list[dict]:
+    # الجداء الديكارتي مع استبعاد التركيبات غير المنطقية (سريع >= بطيء، حدود مقلوبة)
+    names = list(space)
+    combos = []
+    for values in itertools.product(*(space[name] for name in names)):
+        params = dict(zip(names, values))
+        p = {**DEFAULT_STRATEGY_PARAMS, **params}
+        if p["ema_fast"] >= p["ema_slow"] or p["obv_fast"] >= p["obv_slow"]:
+            continue
+        if p["rsi_lower"] >= p["rsi_upper"] or p["stoch_low"] >= p["stoch_high"]:
+            continue
+        combos.append(params)
+    return combos
+
+
+def combo_key(params: dict) -> str:
+    return json.dumps(params, sort_keys=True)
+
+
+def walk_forward_folds(start_ns: int, end_ns: int, train, test, step=None) -> list[tuple[int, int, int]]:
+    # نوافذ متدحرجة (train_start, test_start, test_end)؛ الخطوة الافتراضية = طول نافذة الاختبار
+    train_ns, test_ns = interval_to_seconds(train) * NS, interval_to_seconds(test) * NS
+    step_ns = test_ns if step is None else interval_to_seconds(step) * NS
+    folds, fold_start = [], start_ns
+    while fold_start + train_ns + test_ns <= end_ns:
+        folds.append((fold_start, fold_start + train_ns, fold_start + train_ns + test_ns))
+        fold_start += step_ns
+    return folds
+
+
+class SharedCandles:
+    # كل السلاسل {(symbol, frame): (timestamps, columns)} في كتلتين: int64 للأوقات و float64 بشكل (5, N) لـ OHLCV
+    def __init__(self, series: dict):
+        self.layout, offset = {}, 0
+        for key, (timestamps, _) in series.items():
+            self.layout[key] = (offset, len(timestamps))
+            offset += len(timestamps)
+        total = max(offset, 1)
+        self._times = shared_memory.SharedMemory(create=True, size=total * 8)
+        self._values = shared_memory.SharedMemory(create=True, size=total * 8 * len(OHLCV))
+        times = np.ndarray((total,), dtype="<i8", buffer=self._times.buf)
+        values = np.ndarray((len(OHLCV), total), dtype=np.float64, buffer=self._values.buf)
+        for key, (timestamps, columns) in series.items():
+            start, length = self.layout[key]
+            times[start:start + length] = timestamps
+            for i, col in enumerate(OHLCV):
+                values[i, start:start + length] = columns[col]
+        del times, values  # لا مراجع للمخزن المؤقت قبل close()
+
+    @property
+    def spec(self) -> tuple:
+        # ما يُرسل للعمّال مرة واحدة: أسماء الكتل والتخطيط فقط (بضعة كيلوبايت)
+        return self._times.name, self._values.name, self.layout
+
+    def close(self) -> None:
+        for block in (self._times, self._values):
+            block.close()
+            block.unlink()
+
+
+def attach_shared_candles(spec: tuple) -> tuple[list, dict]:
+    # يرجع (الكتل لإبقائها حية، {(symbol, frame): (timestamps, columns)}) كـ views للقراءة فقط
+    times_name, values_name, layout = spec
+    blocks = [shared_memory.SharedMemory(name=times_name), shared_memory.SharedMemory(name=values_name)]
+    total = blocks[0].size // 8
+    times = np.ndarray((total,), dtype="<i8", buffer=blocks[0].buf)
+    values = np.ndarray((len(OHLCV), total), dtype=np.float64, buffer=blocks[1].buf)
+    times.flags.writeable = False
+    values.flags.writeable = False
+    series = {key: (times[start:start + length], {col: values[i, start:start + length] for i, col in enumerate(OHLCV)})
+              for key, (start, length) in layout.items()}
+    return blocks, series
+
+
+# --- العامل ---
+_worker_blocks: list = []
+_worker_series: dict = {}
+_worker_context: dict = {}
+
+
+def _init_worker(spec: tuple, context: dict) -> None:
+    global _worker_blocks, _worker_series, _worker_context
+    _worker_blocks, _worker_series = attach_shared_candles(spec)
+    _worker_context = context
+
+
+def _evaluate_combo(params: dict) -> tuple[str, list[dict]]:
+    ctx = _worker_context
+    frames = params.get("frames", DEFAULT_FRAMES).split(",")
+    strategy = {k: v for k, v in params.items() if k != "frames"}
+    entry, expiry, pnl = [], [], []
+    for symbol in ctx["symbols"]:
+        if (symbol, SETTLE_KEY) not in _worker_series or any((symbol, f) not in _worker_series for f in frames):
+            continue
+        trades = backtest_asset({f: _worker_series[(symbol, f)] for f in frames}, frames,
+                                _worker_series[(symbol, SETTLE_KEY)], ctx["settle_interval"], ctx["trade_amount"],
+                                ctx["trade_duration"], ctx["payout"], params=strategy)
+        entry.append(trades["entry_time"])
+        expiry.append(trades["expiry_time"])
+        pnl.append(trades["pnl"])
+    entry, expiry, pnl = (np.concatenate(x) if x else np.zeros(0) for x in (entry, expiry, pnl))
+
+    key, rows = combo_key(params), []
+    for fold, (train_start, test_start, test_end) in enumerate(ctx["folds"]):
+        row = {"key": key, **params, "fold": fold, "train_start": pd.Timestamp(train_start).isoformat(),
+               "test_start": pd.Timestamp(test_start).isoformat(), "test_end": pd.Timestamp(test_end).isoformat()}
+        # الصفقة تُنسب لنافذة التدريب فقط إذا انتهت قبل بداية الاختبار
+        for prefix, window in (("train", (entry >= train_start) & (expiry <= test_start)),
+                               ("test", (entry >= test_start) & (entry < test_end))):
+            summary = summarize(pnl[window], expiry[window])
+            row.update({f"{prefix}_{field}": summary[field] for field in SUMMARY_FIELDS})
+        rows.append(row)
+    return key, rows
+
+
+# --- جدول النتائج ---
+def load_results(path: str) -> pd.DataFrame:
+    if not os.path.exists(path) or os.path.getsize(path) == 0:
+        return pd.DataFrame()
+    # السطر الأخير قد يكون مبتورًا إذا توقف التشغيل أثناء الكتابة
+    results = pd.read_csv(path, on_bad_lines="skip")
+    results = results.dropna(subset=[results.columns[-1]])
+    return results.drop_duplicates(subset=["key", "fold"], keep="last").reset_index(drop=True)
+
+
+def _completed_keys(results: pd.DataFrame, folds: list) -> set:
+    if results.empty:
+        return set()
+    expected = [pd.Timestamp(train_start).isoformat() for train_start, _, _ in folds]
+    recorded = set(results["train_start"])
+    if not recorded.issubset(expected):
+        raise ValueError("Results table was produced with different walk-forward folds; use a new results path.")
+    counts = results.groupby("key")["fold"].nunique()
+    return set(counts.index[counts == len(folds)])
+
+
+def run_walk_forward(series: dict, symbols: list[str], grid: list[dict], folds: list, results_path: str,
+                     settle_interval, workers: int | None = None, trade_amount: float = DEFAULT_TRADE_AMOUNT,
+                     trade_duration=DEFAULT_TRADE_DURATION, payout: float = DEFAULT_PAYOUT,
+                     log=print) -> pd.DataFrame:
+    # series: {(symbol, frame): (timestamps, columns)} لكل الأطر المطلوبة في الشبكة + (symbol, SETTLE_KEY)
+    done = _completed_keys(load_results(results_path), folds)
+    pending = [params for params in grid if combo_key(params) not in done]
+    log(f"Walk-forward: {len(grid)} combinations x {len(folds)} folds, {len(grid) - len(pending)} already done.")
+    if not pending:
+        return load_results(results_path)
+
+    for name in _THREAD_ENV:
+        os.environ.setdefault(name, "1")
+    workers = workers or os.cpu_count() or 1
+    context = {"symbols": symbols, "folds": folds, "settle_interval": settle_interval,
+               "trade_amount": trade_amount, "trade_duration": trade_duration, "payout": payout}
+    fieldnames = ["key", *sorted({name for params in grid for name in params}), "fold",
+                  "train_start", "test_start", "test_end",
+                  *(f"{prefix}_{field}" for prefix in ("train", "test") for field in SUMMARY_FIELDS)]
+    shared = SharedCandles(series)
+    started = time.perf_counter()
+    try:
+        # spawn: نفس السلوك على Windows/Linux، والعمّال لا يرثون نسخة من بيانات الأب
+        with ProcessPoolExecutor(max_workers=workers, mp_context=mp.get_context("spawn"),
+                                 initializer=_init_worker, initargs=(shared.spec, context)) as pool, \
+                open(results_path, "a", newline="", encoding="utf-8") as f:
+            writer = csv.DictWriter(f, fieldnames=fieldnames)
+            if f.tell() == 0:
+                writer.writeheader()
+            futures = [pool.submit(_evaluate_combo, params) for params in pending]
+            for finished, future in enumerate(as_completed(futures), 1):
+                _, rows = future.result()
+                writer.writerows(rows)
+                f.flush()
+                elapsed = time.perf_counter() - started
+                log(f"Walk-forward: {finished}/{len(pending)} combinations "
+                    f"({elapsed:.1f}s, {elapsed / finished:.2f}s each with {workers} workers)")
+    finally:
+        shared.close()
+    return load_results(results_path)
+
+
+def walk_forward_report(results: pd.DataFrame, objective: str = "pnl", min_trades: int = 30) -> pd.DataFrame:
+    # لكل fold: التركيبة الأفضل على نافذة التدريب ونتيجتها خارج العينة (test)، مع نتيجة المعاملات الافتراضية للمقارنة
+    if results.empty:
+        return pd.DataFrame()
+    names = json.loads(results["key"].iloc[0])
+    default_key = combo_key({name: DEFAULT_STRATEGY_PARAMS.get(name, DEFAULT_FRAMES) for name in names})
+    rows = []
+    for fold, part in results.groupby("fold"):
+        eligible = part[part["train_trades"] >= min_trades]
+        if eligible.empty:
+            continue
+        best = eligible.loc[eligible[f"train_{objective}"].idxmax()]
+        default = part[part["key"] == default_key]
+        rows.append({"fold": fold, "test_start": best["test_start"], "params": best["key"],
+                     f"train_{objective}": best[f"train_{objective}"],
+                     "test_trades": best["test_trades"], "test_win_rate": best["test_win_rate"],
+                     "test_pnl": best["test_pnl"],
+                     "default_test_pnl": default["test_pnl"].iloc[0] if not default.empty else np.nan})
+    return pd.DataFrame(rows)
+
+
+def _load_store_series(store: CandleStore, source: str, symbols: list[str], frames: list, settle_interval,
+                       start=None, end=None) -> dict:
+    series = {}
+    for symbol in symbols:
+        loaded = load_frames_from_store(store, source, symbol, frames, start, end)
+        settle = store.read_arrays(source, symbol, settle_interval, start=start, end=end)
+        if not loaded or settle is None:
+            print(f"Walk-forward: No data for {symbol}, skipped.")
+            continue
+        series.update({(symbol, frame): arrays for frame, arrays in loaded.items()})
+        series[(symbol, SETTLE_KEY)] = (settle[TIMESTAMP_COLUMN], {col: settle[col] for col in OHLCV})
+    return series
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Parallel walk-forward optimization of the signal_engine constants.")
+    parser.add_argument("--symbols", default="EUR/USD,GBP/USD,USD/JPY")
+    parser.add_argument("--source", default="TWELVEDATA")
+    parser.add_argument("--store", default=DEFAULT_STORE_DIR)
+    parser.add_argument("--start", default=None)
+    parser.add_argument("--end", default=None)
+    parser.add_argument("--space", default=None, help="JSON object of parameter -> list of values")
+    parser.add_argument("--train", default="365d")
+    parser.add_argument("--test", default="90d")
+    parser.add_argument("--results", default=os.path.join("data", "walk_forward.csv"))
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--amount", type=float, default=DEFAULT_TRADE_AMOUNT)
+    parser.add_argument("--duration", default=DEFAULT_TRADE_DURATION)
+    parser.add_argument("--payout", type=float, default=DEFAULT_PAYOUT)
+    parser.add_argument("--settle-interval", default="1min")
+    parser.add_argument("--min-trades", type=int, default=30)
+    parser.add_argument("--synthetic", type=int, default=0, help="run on N synthetic pairs instead of the store")
+    parser.add_argument("--years", type=float, default=3.0, help="history length for --synthetic")
+    parser.add_argument("--regime", default="signals", choices=("signals", "walk"),
+                        help="--synthetic data: a regime that triggers the strategy, or a plain random walk")
+    args = parser.parse_args()
+
+    space = json.loads(args.space) if args.space else DEFAULT_PARAM_SPACE
+    grid = parameter_grid(space)
+    all_frames = sorted({f for params in grid for f in params.get("frames", DEFAULT_FRAMES).split(",")},
+                        key=interval_to_seconds)
+    if args.synthetic:
+        # الإطار الأساسي يُستخدم للتسوية أيضًا، فالمدة الافتراضية = الإطار الأساسي
+        rng = np.random.default_rng(0)
+        base, derivable, _ = plan_frames(all_frames)
+        n = int(args.years * 365 * 86400 / interval_to_seconds(base))
+        symbols = [f"SYN{i:03d}" for i in range(args.synthetic)]
+        series = {}
+        for i, symbol in enumerate(symbols):
+            base_series = synthetic_pair(rng, args.regime, i, n, base, 1_500_000_000 * NS)
+            series[(symbol, base)] = series[(symbol, SETTLE_KEY)] = base_series
+            series.update({(symbol, f): resample_arrays(*base_series, f) for f in derivable})
+        settle_interval = base
+        duration = args.duration if args.duration != DEFAULT_TRADE_DURATION else base
+    else:
+        symbols = args.symbols.split(",")
+        series = _load_store_series(CandleStore(args.store), args.source, symbols, all_frames,
+                                    args.settle_interval, args.start, args.end)
+        settle_interval, duration = args.settle_interval, args.duration
+    if not series:
+        raise SystemExit("No candles to optimize on.")
+
+    settle_times = [ts for (_, frame), (ts, _) in series.items() if frame == SETTLE_KEY and len(ts)]
+    folds = walk_forward_folds(min(int(ts[0]) for ts in settle_times), max(int(ts[-1]) for ts in settle_times),
+                               args.train, args.test)
+    if not folds:
+        raise SystemExit(f"History is shorter than one train+test window ({args.train} + {args.test}).")
+    os.makedirs(os.path.dirname(args.results) or ".", exist_ok=True)
+    results = run_walk_forward(series, symbols, grid, folds, args.results, settle_interval, args.workers,
+                               args.amount, duration, args.payout)
+    if args.synthetic and args.regime == "signals":
+        # فحص ذاتي: نظام الإشارات يجب أن يُنتج صفقات في التدريب والاختبار
+        assert (results["train_trades"] > 0).any() and (results["test_trades"] > 0).any(), \
+            "The signal regime produced no trades."
+    report = walk_forward_report(results, min_trades=args.min_trades)
+    if report.empty:
+        print(f"No combination reached {args.min_trades} training trades in any fold.")
+    else:
+        print(report.to_string(index=False))
+        defaults = report["default_test_pnl"]
+        print(f"Out-of-sample P&L of the selected parameters: {report['test_pnl'].sum():+.2f}"
+              + (f" (defaults: {defaults.sum():+.2f})" if defaults.notna().all() else " (defaults not in the grid)"))